@@ -25,6 +25,20 @@ target_metadata = Base.metadata
 # my_important_option = config.get_main_option("my_important_option")
 # ... etc.
 
+# `alembic -x shard=<name> upgrade head` migrates a conversation shard of
+# SHARD_DATABASE_URLS instead of the main database. Every shard has the full
+# schema.
+shard = context.get_x_argument(as_dictionary=True).get("shard")
+if shard is not None:
+    from config import settings
+
+    if shard not in settings.SHARD_DATABASE_URLS:
+        raise SystemExit(f"Unknown shard: {shard}")
+    config.set_main_option(
+        "sqlalchemy.url",
+        settings.SHARD_DATABASE_URLS[shard].replace("%", "%%"),
+    )
+
 
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
@@ -0,0 +1,61 @@
+"""Add full-text index on message content
+
+Revision ID: 3b9f1c2d4e5a
+Revises: c0d22b704e92
+Create Date: 2026-10-19 10:12:41.118204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "3b9f1c2d4e5a"
+down_revision: Union[str, Sequence[str], None] = "c0d22b704e92"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# SQLite has no FULLTEXT index, it gets an external-content FTS5 table kept in
+# sync by triggers (same DDL as models.message.SQLITE_FTS_DDL)
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE messages_fts USING fts5("
+    "content, content='messages', content_rowid='id')",
+    "CREATE TRIGGER messages_fts_ai AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER messages_fts_ad AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) "
+    "VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER messages_fts_au AFTER UPDATE OF content ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) "
+    "VALUES ('delete', old.id, old.content); "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == "sqlite":
+        for statement in SQLITE_FTS_DDL:
+            op.execute(statement)
+        # index the rows that existed before the triggers
+        op.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+    else:
+        op.create_index(
+            "ix_messages_content_fulltext",
+            "messages",
+            ["content"],
+            unique=False,
+            mysql_prefix="FULLTEXT",
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "sqlite":
+        for trigger in ("messages_fts_ai", "messages_fts_ad", "messages_fts_au"):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS messages_fts")
+    else:
+        op.drop_index("ix_messages_content_fulltext", table_name="messages")
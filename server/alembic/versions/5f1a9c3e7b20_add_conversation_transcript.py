@@ -0,0 +1,38 @@
+"""Add conversation transcript snapshot
+
+Revision ID: 5f1a9c3e7b20
+Revises: 8d2e6a41c7b3
+Create Date: 2026-10-19 16:02:41.918344
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision: str = "5f1a9c3e7b20"
+down_revision: Union[str, Sequence[str], None] = "8d2e6a41c7b3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing conversations start with a NULL transcript, it is rebuilt from
+    # their messages the first time a chat turn reads them
+    op.add_column(
+        "conversations",
+        sa.Column(
+            "transcript",
+            sa.Text().with_variant(mysql.LONGTEXT(), "mysql"),
+            nullable=True,
+        ),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("conversations", "transcript")
@@ -0,0 +1,55 @@
+"""Add conversation archives for cold storage
+
+Revision ID: 8d2e6a41c7b3
+Revises: 3b9f1c2d4e5a
+Create Date: 2026-10-19 14:37:05.402117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision: str = "8d2e6a41c7b3"
+down_revision: Union[str, Sequence[str], None] = "3b9f1c2d4e5a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "conversations",
+        sa.Column("archived", sa.Boolean(), server_default="0", nullable=False),
+    )
+    op.create_table(
+        "conversation_archives",
+        sa.Column("conversation_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "payload",
+            sa.LargeBinary().with_variant(mysql.LONGBLOB(), "mysql"),
+            nullable=False,
+        ),
+        sa.Column("message_count", sa.Integer(), nullable=False),
+        sa.Column("raw_bytes", sa.Integer(), nullable=False),
+        sa.Column("compressed_bytes", sa.Integer(), nullable=False),
+        sa.Column(
+            "archived_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(
+            ["conversation_id"], ["conversations.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("conversation_id"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("conversation_archives")
+    op.drop_column("conversations", "archived")
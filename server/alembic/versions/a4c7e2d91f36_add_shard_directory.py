@@ -0,0 +1,65 @@
+"""Add shard directory tables
+
+Revision ID: a4c7e2d91f36
+Revises: 5f1a9c3e7b20
+Create Date: 2026-10-19 17:21:08.550419
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "a4c7e2d91f36"
+down_revision: Union[str, Sequence[str], None] = "5f1a9c3e7b20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "user_shards",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("shard", sa.String(length=64), nullable=False),
+        sa.Column(
+            "assigned_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.create_index(
+        op.f("ix_user_shards_shard"), "user_shards", ["shard"], unique=False
+    )
+    op.create_table(
+        "conversation_directory",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    # register the existing conversations, so allocated ids continue after
+    # them. Conversations created while unsharded are registered on the next
+    # start with shards (ShardMap.register_unsharded_conversations).
+    op.execute(
+        "INSERT INTO conversation_directory (id, user_id, created_at) "
+        "SELECT id, user_id, created_at FROM conversations"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("conversation_directory")
+    op.drop_index(op.f("ix_user_shards_shard"), table_name="user_shards")
+    op.drop_table("user_shards")
@@ -0,0 +1,33 @@
+"""Add message conversation index
+
+Revision ID: b71d4f0e9a25
+Revises: e93b0c5a27d4
+Create Date: 2026-10-19 20:14:37.581204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "b71d4f0e9a25"
+down_revision: Union[str, Sequence[str], None] = "e93b0c5a27d4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_messages_conversation_id_id",
+        "messages",
+        ["conversation_id", "id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_messages_conversation_id_id", table_name="messages")
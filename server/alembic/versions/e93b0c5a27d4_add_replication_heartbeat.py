@@ -0,0 +1,33 @@
+"""Add replication heartbeat
+
+Revision ID: e93b0c5a27d4
+Revises: a4c7e2d91f36
+Create Date: 2026-10-19 18:05:52.207731
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e93b0c5a27d4"
+down_revision: Union[str, Sequence[str], None] = "a4c7e2d91f36"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "replication_heartbeat",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("beat_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("replication_heartbeat")
@@ -0,0 +1,33 @@
+"""Add conversation version
+
+Revision ID: f2a8d4c61b93
+Revises: d58a3f6c1e07
+Create Date: 2026-10-19 18:12:07.402611
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "f2a8d4c61b93"
+down_revision: Union[str, Sequence[str], None] = "d58a3f6c1e07"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing conversations start at version 0: validators change once, on
+    # the first read after the upgrade
+    op.add_column(
+        "conversations",
+        sa.Column("version", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("conversations", "version")
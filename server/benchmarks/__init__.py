@@ -0,0 +1,6 @@
+"""
+Micro-benchmarks for the server hot paths.
+
+Run from the server directory, e.g. `python -m benchmarks.bench_conversation_listing`.
+They use a temporary SQLite database and need no running MySQL or model.
+"""
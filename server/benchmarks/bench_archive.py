@@ -0,0 +1,53 @@
+"""
+Space savings of archived conversations and the latency of bringing them back.
+
+    python -m benchmarks.bench_archive [--conversations 200] [--per-conversation 100]
+"""
+
+import argparse
+import time
+
+from benchmarks.common import make_session, seed_conversations
+from models import Conversation
+from services.archiver import archive_cold_conversations
+from utils.metrics import metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--per-conversation", type=int, default=100)
+    args = parser.parse_args()
+
+    db = make_session()
+    seed_conversations(db, args.conversations, args.per_conversation)
+    # everything was created "now", archiving with a negative age takes it all
+    started = time.perf_counter()
+    report = archive_cold_conversations(
+        db, older_than_days=-1, batch_size=args.conversations
+    )
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"archived {report.conversations} conversations / {report.messages} messages "
+        f"in {elapsed * 1000:.0f} ms"
+    )
+    print(
+        f"serialized {report.raw_bytes / 1e6:.2f} MB -> compressed "
+        f"{report.compressed_bytes / 1e6:.2f} MB ({report.space_saving:.0%} saved)"
+    )
+
+    ids = [c.id for c in db.query(Conversation.id)]
+    for conversation_id in ids:
+        Conversation.get_by_id(db, conversation_id, with_messages=True)
+        db.expunge_all()
+
+    rehydrate = metrics.snapshot()["archive.rehydrate_seconds"]
+    print(
+        f"rehydrate {args.per_conversation} messages: avg {rehydrate['avg'] * 1000:.2f} ms, "
+        f"p95 {rehydrate['p95'] * 1000:.2f} ms, max {rehydrate['max'] * 1000:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Bytes on the wire and CPU cost of response compression for conversation
+listings.
+
+The payloads are real listing bodies (routers.conversation._stream_listing)
+at a few sizes. Each encoder compresses the whole body at once, and the
+streamed chunks with a flush after each one, as the middleware does for
+StreamingResponse. Brotli and zstd are skipped when not installed.
+
+    python -m benchmarks.bench_compression [--repeat 5]
+"""
+
+import argparse
+import random
+import zlib
+
+from benchmarks.common import make_session, seed_conversations, timed
+from routers.conversation import _stream_listing
+from utils import compression
+
+# (conversations, messages per conversation)
+PAYLOADS = [(5, 10), (50, 20), (500, 50)]
+
+WORDS = (
+    "the a to of and in is it you that for on with as this be can are your have not "
+    "model answer question code python function error data example use should will "
+    "would like more time what how why when which one two first then also here there "
+    "value list return file server request response database query table index user"
+).split()
+
+
+def message_text(n: int) -> str:
+    """Chat-like text, varied enough not to flatter the compressors"""
+    rng = random.Random(n)
+    return (
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 120))).capitalize()
+        + "."
+    )
+
+
+def gzip_encoder(level: int):
+    def compress(chunks: list[bytes]) -> bytes:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        out = [
+            compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            for chunk in chunks[:-1]
+        ]
+        out.append(compressor.compress(chunks[-1]) + compressor.flush())
+        return b"".join(out)
+
+    return compress
+
+
+def brotli_encoder(quality: int):
+    brotli = compression.brotli
+
+    def compress(chunks: list[bytes]) -> bytes:
+        compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=quality)
+        out = [compressor.process(chunk) + compressor.flush() for chunk in chunks[:-1]]
+        out.append(compressor.process(chunks[-1]) + compressor.finish())
+        return b"".join(out)
+
+    return compress
+
+
+def zstd_encoder(level: int):
+    zstandard = compression.zstandard
+
+    def compress(chunks: list[bytes]) -> bytes:
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        out = [
+            compressor.compress(chunk)
+            + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            for chunk in chunks[:-1]
+        ]
+        out.append(compressor.compress(chunks[-1]) + compressor.flush())
+        return b"".join(out)
+
+    return compress
+
+
+def encoders():
+    yield "gzip", "gzip -1", gzip_encoder(1)
+    yield "gzip", "gzip -4 (default)", gzip_encoder(4)
+    yield "gzip", "gzip -6", gzip_encoder(6)
+    yield "gzip", "gzip -9", gzip_encoder(9)
+    if compression.brotli is not None:
+        yield "br", "brotli q4", brotli_encoder(4)
+        yield "br", "brotli q5 (default)", brotli_encoder(5)
+        yield "br", "brotli q7", brotli_encoder(7)
+    if compression.zstandard is not None:
+        yield "zstd", "zstd 1", zstd_encoder(1)
+        yield "zstd", "zstd 3 (default)", zstd_encoder(3)
+        yield "zstd", "zstd 9", zstd_encoder(9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for conversations, per_conversation in PAYLOADS:
+        db = make_session()
+        user_id = seed_conversations(
+            db, conversations, per_conversation, content=message_text
+        )
+        chunks = list(_stream_listing(db, user_id))
+        body = b"".join(chunks)
+        print(
+            f"-- listing of {conversations} conversations x {per_conversation} messages: "
+            f"{len(body) / 1024:,.1f} KB in {len(chunks)} streamed chunks"
+        )
+        print(
+            f"{'encoder':<22} {'bytes':>10} {'ratio':>7} {'ms':>8} {'MB/s':>8} {'streamed bytes':>15}"
+        )
+        for encoding, name, compress in encoders():
+            whole = compress([body])
+            assert compression.decompress(whole, encoding) == body
+            streamed = compress(chunks)
+            seconds = timed(lambda: compress([body]), args.repeat)
+            print(
+                f"{name:<22} {len(whole):>10,} {len(body) / len(whole):>6.1f}x "
+                f"{seconds * 1000:>8.2f} {len(body) / seconds / 1e6:>8.1f} {len(streamed):>15,}"
+            )
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
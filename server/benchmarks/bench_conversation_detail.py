@@ -0,0 +1,99 @@
+"""
+Per-message cost of serializing GET /conv-with-msg/{conversation_id}.
+
+Before: the ORM conversation is turned into MessageInConversationResponse and
+GetConversationResponse models, which FastAPI dumps, validates again against
+response_model and encodes. After: Conversation.get_detail_by_id builds the
+response dict from rows and utils.json_encoding encodes it once. Serialization
+is timed on already loaded data, then end to end with the database read.
+
+    python -m benchmarks.bench_conversation_detail [--messages 2000]
+"""
+
+import argparse
+import json
+
+from benchmarks.common import make_session, seed_conversations, timed
+from fastapi.encoders import jsonable_encoder
+from models import Conversation
+from pydantic import TypeAdapter
+from schemas.conversation import GetConversationResponse, MessageInConversationResponse
+from utils import json_encoding
+
+response_adapter = TypeAdapter(GetConversationResponse)
+
+
+def pydantic_body(conversation) -> bytes:
+    response = GetConversationResponse(
+        conversation_id=conversation.id,
+        title=conversation.title,
+        prompt=conversation.prompt,
+        created_at=conversation.created_at.isoformat(),
+        messages=[
+            MessageInConversationResponse(
+                id=message.id,
+                sender=message.sent_by.value,
+                content=message.content,
+                created_at=message.created_at.isoformat(),
+            )
+            for message in conversation.messages
+        ],
+    )
+    # what FastAPI does with a model returned for a response_model
+    validated = response_adapter.validate_python(response.model_dump())
+    content = jsonable_encoder(response_adapter.dump_python(validated, mode="json"))
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode(
+        "utf-8"
+    )
+
+
+def orm_read(db, conversation_id: int):
+    db.expunge_all()
+    return Conversation.get_by_id(db, conversation_id, with_messages=True)
+
+
+def report_per_message(
+    name: str, seconds: float, messages: int, baseline: float | None = None
+):
+    line = f"{name:<40} {seconds * 1000:10.2f} ms {seconds / messages * 1e6:8.2f} us/message"
+    if baseline:
+        line += f"   x{baseline / seconds:.3g}"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    db = make_session()
+    seed_conversations(db, 1, args.messages)
+    conversation_id = db.query(Conversation.id).scalar()
+
+    conversation = orm_read(db, conversation_id)
+    detail = Conversation.get_detail_by_id(db, conversation_id)
+    assert json.loads(pydantic_body(conversation)) == json.loads(
+        json_encoding.dumps(detail)
+    )
+
+    encoder = "orjson" if json_encoding.orjson is not None else "json"
+    print(f"GET /conv-with-msg, {args.messages} messages, fast path encoder: {encoder}")
+    print("serialization only")
+    before = timed(lambda: pydantic_body(conversation), args.repeat)
+    report_per_message("Pydantic models + response_model", before, args.messages)
+    after = timed(lambda: json_encoding.dumps(detail), args.repeat)
+    report_per_message("Row dicts + single encode", after, args.messages, before)
+
+    print("read and serialization")
+    before = timed(lambda: pydantic_body(orm_read(db, conversation_id)), args.repeat)
+    report_per_message("ORM + Pydantic", before, args.messages)
+    after = timed(
+        lambda: json_encoding.dumps(Conversation.get_detail_by_id(db, conversation_id)),
+        args.repeat,
+    )
+    report_per_message("Core projection + single encode", after, args.messages, before)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Compare the ORM and the projection read path of get_user_conversations.
+
+The ORM path is what the endpoint used to do: load Conversation and Message
+objects, build Pydantic responses and let FastAPI encode them. The projection
+path is Conversation.get_listing_by_user_id, whose plain dicts go straight to
+JSONResponse. The streamed path is what the endpoint does now: the same
+projection, read through a cursor and encoded piece by piece. All paths are
+timed up to the encoded response body; peak memory is measured in a separate
+run under tracemalloc.
+
+    python -m benchmarks.bench_conversation_listing [--messages 10000]
+"""
+
+import argparse
+import json
+import tracemalloc
+
+from benchmarks.common import make_session, report, seed_conversations, timed
+from fastapi.encoders import jsonable_encoder
+from models import Conversation
+from routers.conversation import _stream_listing
+from schemas.conversation import GetConversationResponse, MessageInConversationResponse
+
+
+def orm_listing(db, user_id: int):
+    conversations = Conversation.get_by_user_id(db, user_id, with_messages=True)
+    response = [
+        GetConversationResponse(
+            conversation_id=conv.id,
+            title=conv.title,
+            prompt=conv.prompt,
+            created_at=conv.created_at.isoformat(),
+            messages=[
+                MessageInConversationResponse(
+                    id=msg.id,
+                    sender=msg.sent_by.value,
+                    content=msg.content,
+                    created_at=msg.created_at.isoformat(),
+                )
+                for msg in conv.messages
+            ],
+        )
+        for conv in conversations
+    ]
+    db.expunge_all()
+    return json.dumps(jsonable_encoder(response))
+
+
+def projection_listing(db, user_id: int):
+    return json.dumps(Conversation.get_listing_by_user_id(db, user_id))
+
+
+def streamed_listing(db, user_id: int):
+    size = 0
+    for piece in _stream_listing(db, user_id):
+        size += len(piece)
+    return size
+
+
+def peak_mb(fn) -> float:
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--per-conversation", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    db = make_session()
+    user_id = seed_conversations(
+        db, args.messages // args.per_conversation, args.per_conversation
+    )
+    assert orm_listing(db, user_id) == projection_listing(db, user_id)
+    assert json.loads(b"".join(_stream_listing(db, user_id))) == json.loads(
+        projection_listing(db, user_id)
+    )
+
+    print(f"get_user_conversations, {args.messages} messages")
+    orm = timed(lambda: orm_listing(db, user_id), args.repeat)
+    report("ORM + Pydantic", orm)
+    report(
+        "Core projection",
+        timed(lambda: projection_listing(db, user_id), args.repeat),
+        orm,
+    )
+    report(
+        "Streamed projection",
+        timed(lambda: streamed_listing(db, user_id), args.repeat),
+        orm,
+    )
+
+    print("peak memory")
+    for name, fn in (
+        ("ORM + Pydantic", orm_listing),
+        ("Core projection", projection_listing),
+        ("Streamed projection", streamed_listing),
+    ):
+        db.expire_all()
+        print(f"  {name:<22} {peak_mb(lambda: fn(db, user_id)):8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Throughput and peak memory of the streaming conversation export and import,
+at two history sizes. Peak memory should stay flat as the history grows.
+
+    python -m benchmarks.bench_export [--conversations 500] [--per-conversation 100]
+"""
+
+import argparse
+import os
+import tempfile
+import tracemalloc
+
+from benchmarks.common import make_session, seed_conversations
+from models import User
+from services import conversation_export
+from services.conversation_export import ConversationImporter, TransferReport
+
+
+def _measure(fn) -> tuple[TransferReport, float]:
+    """Report of a plain run, and peak MB of a second run under tracemalloc"""
+    report = fn()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return report, peak / 1024 / 1024
+
+
+def run(conversations: int, per_conversation: int):
+    directory = tempfile.mkdtemp()
+    db = make_session(os.path.join(directory, "bench.db"))
+    user_id = seed_conversations(db, conversations, per_conversation)
+    path = os.path.join(directory, "export.ndjson")
+
+    def export():
+        report = TransferReport()
+        with open(path, "wb") as out:
+            for data in conversation_export.export_ndjson(db, user_id, report):
+                out.write(data)
+        return report.finish("bench_export")
+
+    def import_():
+        n = db.query(User).count()
+        user = User(
+            username=f"target{n}", email=f"target{n}@example.com", password_hash="x"
+        )
+        db.add(user)
+        db.commit()
+        with open(path, "rb") as lines:
+            return (
+                ConversationImporter(db, user.id)
+                .import_records(conversation_export.iter_ndjson_records(lines))
+                .finish("bench_import")
+            )
+
+    for name, fn in (("export ndjson", export), ("import ndjson", import_)):
+        report, peak = _measure(fn)
+        print(f"{name:<14} {report.summary()}, peak {peak:.1f} MB")
+
+    if conversation_export.pa is not None:
+        parquet = os.path.join(directory, "parquet")
+
+        def export_parquet():
+            return conversation_export.export_parquet(
+                [lambda: make_session(os.path.join(directory, "bench.db"))],
+                parquet,
+                user_id,
+            ).finish("bench_export")
+
+        report, peak = _measure(export_parquet)
+        print(f"{'export parquet':<14} {report.summary()}, peak {peak:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--conversations", type=int, default=500)
+    parser.add_argument("--per-conversation", type=int, default=100)
+    args = parser.parse_args()
+
+    for scale in (1, 4):
+        print(
+            f"-- {args.conversations * scale} conversations x {args.per_conversation} messages"
+        )
+        run(args.conversations * scale, args.per_conversation)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compare full-text search with a LIKE scan over messages.content.
+
+Runs on SQLite, where the full-text index is the FTS5 table from
+models.message; MySQL uses a FULLTEXT index with the same Message.search.
+
+    python -m benchmarks.bench_message_search [--messages 1000000]
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks.common import make_session, report, seed_conversations, timed
+from models import Conversation, Message
+from sqlalchemy import select
+
+VOCABULARY_SIZE = 50_000
+WORDS_PER_MESSAGE = 30
+
+
+def like_search(db, user_id: int, term: str, limit: int):
+    statement = (
+        select(Message.id)
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .where(Conversation.user_id == user_id, Message.content.like(f"%{term}%"))
+        .order_by(Message.id.desc())
+        .limit(limit)
+    )
+    return db.execute(statement).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--per-conversation", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    # Zipf-like vocabulary: a few very common words, a long tail of rare ones
+    words = [f"w{i}" for i in range(VOCABULARY_SIZE)]
+    weights = [1 / (i + 1) for i in range(VOCABULARY_SIZE)]
+    cumulative = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+
+    def content(n):
+        return " ".join(rng.choices(words, cum_weights=cumulative, k=WORDS_PER_MESSAGE))
+
+    db = make_session()
+    started = time.perf_counter()
+    user_id = seed_conversations(
+        db,
+        args.messages // args.per_conversation,
+        args.per_conversation,
+        content=content,
+    )
+    print(f"seeded {args.messages} messages in {time.perf_counter() - started:.1f} s")
+
+    for label, term in (("common term", "w1"), ("rare term", "w40000")):
+        print(f"search, {label} ({term}), first page of 20")
+        # LIKE needs a word boundary to mean the same thing, approximate with spaces
+        like = timed(lambda: like_search(db, user_id, f" {term} ", 20), args.repeat)
+        report("LIKE scan", like)
+        fts = timed(lambda: Message.search(db, user_id, term, limit=20), args.repeat)
+        report("full-text index", fts, like)
+
+
+if __name__ == "__main__":
+    main()
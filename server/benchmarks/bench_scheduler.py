@@ -0,0 +1,123 @@
+"""
+Queue waits of the scheduling policies on a simulated workload.
+
+One heavy user sends a share of the requests with long prompts; the other
+users send short ones. Jobs arrive as a Poisson process at a load factor of
+the model's capacity. A job's service time is its prefill plus the tokens it
+actually generates, which the scheduler does not know: its predicted cost
+is prompt tokens plus max_new_tokens. The policies run on a simulated clock,
+so the benchmark takes seconds whatever the load.
+
+    python -m benchmarks.bench_scheduler [--jobs 20000] [--load 0.9]
+"""
+
+import argparse
+import heapq
+import random
+import statistics
+from collections import deque
+
+from services.generation_scheduler import (
+    FIFOPolicy,
+    Job,
+    ShortestJobFirstPolicy,
+    WeightedFairQueuingPolicy,
+)
+
+HEAVY_USER = 0
+LIGHT_USERS = 9
+MAX_NEW_TOKENS = 100
+PREFILL_SECONDS_PER_TOKEN = 0.0002
+DECODE_SECONDS_PER_TOKEN = 0.02
+
+
+def workload(
+    jobs: int, load: float, heavy_share: float, concurrency: int, seed: int = 0
+):
+    """(arrival, user_id, predicted cost, service seconds) of each job"""
+    rng = random.Random(seed)
+    specs = []
+    for _ in range(jobs):
+        if rng.random() < heavy_share:
+            user_id, prompt_tokens = HEAVY_USER, rng.randint(1500, 3000)
+        else:
+            user_id, prompt_tokens = rng.randint(1, LIGHT_USERS), rng.randint(20, 300)
+        new_tokens = rng.randint(10, MAX_NEW_TOKENS)
+        service = (
+            prompt_tokens * PREFILL_SECONDS_PER_TOKEN
+            + new_tokens * DECODE_SECONDS_PER_TOKEN
+        )
+        specs.append((user_id, prompt_tokens + MAX_NEW_TOKENS, service))
+
+    mean_service = statistics.fmean(spec[2] for spec in specs)
+    rate = load * concurrency / mean_service
+    arrival = 0.0
+    timeline = []
+    for user_id, cost, service in specs:
+        arrival += rng.expovariate(rate)
+        timeline.append((arrival, user_id, cost, service))
+    return timeline
+
+
+def simulate(policy, timeline, concurrency: int) -> list[tuple[int, float]]:
+    """(user_id, queue wait) of each job"""
+    arrivals = deque(enumerate(timeline))
+    running: list[float] = []
+    waits = []
+    now = 0.0
+    while arrivals or len(policy) or running:
+        next_arrival = arrivals[0][1][0] if arrivals else float("inf")
+        next_finish = running[0] if running else float("inf")
+        if next_arrival <= next_finish:
+            sequence, (now, user_id, cost, _) = arrivals.popleft()
+            policy.push(Job(0.0, sequence, user_id, cost, now, None))
+        else:
+            now = heapq.heappop(running)
+        while len(running) < concurrency and len(policy):
+            job = policy.pop()
+            waits.append((job.user_id, now - job.enqueued_at))
+            heapq.heappush(running, now + timeline[job.sequence][3])
+    return waits
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=20_000)
+    parser.add_argument("--load", type=float, default=0.9)
+    parser.add_argument("--heavy-share", type=float, default=0.3)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    timeline = workload(args.jobs, args.load, args.heavy_share, args.concurrency)
+    policies = [
+        ("fifo", FIFOPolicy),
+        ("wfq", WeightedFairQueuingPolicy),
+        ("sjf", ShortestJobFirstPolicy),
+    ]
+    print(
+        f"{args.jobs:,} jobs, load {args.load}, heavy user share {args.heavy_share}, "
+        f"concurrency {args.concurrency}; queue wait in seconds"
+    )
+    print(f"{'policy':<6} {'users':<6} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, policy in policies:
+        waits = simulate(policy(), timeline, args.concurrency)
+        groups = {
+            "all": [wait for _, wait in waits],
+            "light": [wait for user_id, wait in waits if user_id != HEAVY_USER],
+            "heavy": [wait for user_id, wait in waits if user_id == HEAVY_USER],
+        }
+        for group, values in groups.items():
+            print(
+                f"{name:<6} {group:<6} {statistics.fmean(values):>8.2f} "
+                f"{percentile(values, 0.5):>8.2f} {percentile(values, 0.95):>8.2f} "
+                f"{percentile(values, 0.99):>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
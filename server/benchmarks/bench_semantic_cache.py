@@ -0,0 +1,46 @@
+"""
+Lookup latency of the semantic cache index at a few sizes.
+
+Vectors are random unit vectors of the chat model's hidden size (1024 for
+Qwen3-0.6B). Embedding time is not included: it is one forward pass of the
+model over the message and dominates small indexes.
+
+    python -m benchmarks.bench_semantic_cache [--repeat 50] [--dimension 1024]
+"""
+
+import argparse
+
+import numpy as np
+from benchmarks.common import timed
+from services.semantic_cache import VectorIndex
+
+SIZES = [1_000, 10_000, 100_000]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--dimension", type=int, default=1024)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'entries':>10} {'MB':>8} {'search ms':>10} {'add ms':>8}")
+    for size in SIZES:
+        index = VectorIndex(max_entries=size, ttl_seconds=3600)
+        vectors = rng.normal(size=(size, args.dimension)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        for i, vector in enumerate(vectors):
+            index.add(i % 4, vector, "reply", [1, 2, 3])
+
+        query = vectors[size // 2]
+        search = timed(lambda: index.search(0, query, threshold=0.95), args.repeat)
+        # full index, every add evicts the least recently used entry
+        add = timed(lambda: index.add(0, query, "reply", [1, 2, 3]), args.repeat)
+        print(
+            f"{size:>10,} {index._vectors.nbytes / 1e6:>8.1f} "
+            f"{search * 1000:>10.3f} {add * 1000:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Shared helpers for the benchmarks."""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Base, Conversation, Message, User
+from models.message import SenderType
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+
+def make_session(path: str | None = None):
+    """Create a SQLite database with the schema and return a session on it."""
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)()
+
+
+def seed_conversations(
+    db,
+    conversations: int,
+    messages_per_conversation: int,
+    content_size: int = 200,
+    content=None,
+    chunk_size: int = 10_000,
+) -> int:
+    """
+    Insert one user owning `conversations` conversations with messages, in
+    chunks so millions of rows fit in memory. `content(n)` gives the text of
+    the n-th message. Returns the user id.
+    """
+    user = User(username="bench", email="bench@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+
+    started = datetime.now(timezone.utc)
+    db.execute(
+        insert(Conversation),
+        [
+            {
+                "user_id": user.id,
+                "title": f"Conversation {i}",
+                "prompt": "You are a helpful and friendly assistant.",
+                "created_at": started,
+            }
+            for i in range(conversations)
+        ],
+    )
+    conversation_ids = [
+        c.id for c in db.query(Conversation.id).order_by(Conversation.id)
+    ]
+
+    if content is None:
+        text = ("lorem ipsum dolor sit amet " * (content_size // 27 + 1))[:content_size]
+
+        def content(n):
+            return f"{n}: {text}"
+
+    rows = []
+    n = 0
+    for conversation_id in conversation_ids:
+        for i in range(messages_per_conversation):
+            rows.append(
+                {
+                    "conversation_id": conversation_id,
+                    "sent_by": SenderType.USER if i % 2 == 0 else SenderType.ASSISTANT,
+                    "content": content(n),
+                    "created_at": started + timedelta(seconds=i),
+                }
+            )
+            n += 1
+            if len(rows) >= chunk_size:
+                db.execute(insert(Message), rows)
+                rows = []
+    if rows:
+        db.execute(insert(Message), rows)
+    db.commit()
+    return user.id
+
+
+def timed(fn, repeat: int = 5) -> float:
+    """Best wall-clock time of `repeat` runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def report(name: str, seconds: float, baseline: float | None = None):
+    line = f"{name:<40} {seconds * 1000:10.2f} ms"
+    if baseline:
+        line += f"   x{baseline / seconds:.3g}"
+    print(line)
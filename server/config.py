@@ -1,5 +1,6 @@
 """Configuration settings for the chat application."""
 
+import json
 import os
 
 from dotenv import load_dotenv
@@ -21,6 +22,16 @@ class Settings:
     DB_PASSWORD: str = os.getenv("DB_PASSWORD", "user")
     DB_NAME: str = os.getenv("DB_NAME", "chat-box")
 
+    # Connection pool settings, shared by the sync and the async engine.
+    # Recycle below MySQL's wait_timeout so idle connections are never stale.
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    # Connections opened per engine at startup, 0 disables warm-up
+    DB_POOL_WARMUP: int = int(os.getenv("DB_POOL_WARMUP", "5"))
+
     # Build DATABASE_URL from components if not provided
     @property
     def DATABASE_URL(self) -> str:
@@ -29,7 +40,172 @@ class Settings:
             f"mysql+pymysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:3306/{self.DB_NAME}",
         )
 
-    chat_model = {"MAX_NEW_TOKENS": 100, "TRUST_REMOTE_CODE": True}
+    # Same database through the asyncio driver, used by the async routes
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        return os.getenv(
+            "ASYNC_DATABASE_URL",
+            f"mysql+aiomysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:3306/{self.DB_NAME}",
+        )
+
+    # User-sharded conversation storage: JSON object of shard name -> database
+    # URL. DATABASE_URL remains the directory of users and shards. Empty keeps
+    # every conversation in DATABASE_URL.
+    SHARD_DATABASE_URLS: dict[str, str] = json.loads(
+        os.getenv("SHARD_DATABASE_URLS", "{}")
+    )
+    # Seconds a worker caches the shard of a user. A move reaches every worker
+    # within this time, the rebalancer waits it out before deleting old rows.
+    SHARD_ASSIGNMENT_TTL_SECONDS: float = float(
+        os.getenv("SHARD_ASSIGNMENT_TTL_SECONDS", "10")
+    )
+
+    # Read replicas of DATABASE_URL (JSON list of URLs) serving the GET
+    # conversation endpoints. A replica whose heartbeat is older than
+    # REPLICA_MAX_LAG_SECONDS is skipped. After a chat turn, the user reads from
+    # the primary for REPLICA_PIN_SECONDS, keep it above the accepted lag plus
+    # the heartbeat interval. Not used when conversations are sharded.
+    READ_REPLICA_URLS: list[str] = json.loads(os.getenv("READ_REPLICA_URLS", "[]"))
+    REPLICA_MAX_LAG_SECONDS: float = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "2"))
+    REPLICA_LAG_CHECK_INTERVAL: float = float(
+        os.getenv("REPLICA_LAG_CHECK_INTERVAL", "1")
+    )
+    REPLICA_HEARTBEAT_INTERVAL: float = float(
+        os.getenv("REPLICA_HEARTBEAT_INTERVAL", "1")
+    )
+    REPLICA_PIN_SECONDS: float = float(os.getenv("REPLICA_PIN_SECONDS", "5"))
+
+    # Write-behind persistence of chat turns (opt-in). Turns are journaled to
+    # MESSAGE_WRITE_BEHIND_JOURNAL.<n>, one slot n per worker process, and
+    # inserted by a background task.
+    MESSAGE_WRITE_BEHIND: bool = (
+        os.getenv("MESSAGE_WRITE_BEHIND", "false").lower() == "true"
+    )
+    MESSAGE_WRITE_BEHIND_JOURNAL: str = os.getenv(
+        "MESSAGE_WRITE_BEHIND_JOURNAL", "message_write_behind.journal"
+    )
+    MESSAGE_WRITE_BEHIND_BATCH_SIZE: int = int(
+        os.getenv("MESSAGE_WRITE_BEHIND_BATCH_SIZE", "200")
+    )
+    MESSAGE_WRITE_BEHIND_FLUSH_INTERVAL: float = float(
+        os.getenv("MESSAGE_WRITE_BEHIND_FLUSH_INTERVAL", "0.2")
+    )
+
+    # Conversation history cache: "memory" (LRU bounded by size) or "none"
+    CONVERSATION_CACHE_BACKEND: str = os.getenv("CONVERSATION_CACHE_BACKEND", "memory")
+    CONVERSATION_CACHE_MAX_BYTES: int = int(
+        os.getenv("CONVERSATION_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+    )
+
+    # Keep the generated token ids of assistant replies in conversation transcripts
+    TRANSCRIPT_TOKEN_IDS: bool = (
+        os.getenv("TRANSCRIPT_TOKEN_IDS", "false").lower() == "true"
+    )
+
+    # Cold conversation archiving, 0 disables the background archiver
+    ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", "0"))
+    ARCHIVE_INTERVAL_SECONDS: float = float(
+        os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600")
+    )
+    ARCHIVE_BATCH_SIZE: int = int(os.getenv("ARCHIVE_BATCH_SIZE", "100"))
+
+    # Sync tokens stay behind rows younger than this: ids are assigned at
+    # insert, a transaction still open may commit a lower id later. Keep it
+    # above the longest write transaction.
+    SYNC_SETTLE_SECONDS: float = float(os.getenv("SYNC_SETTLE_SECONDS", "5"))
+
+    # Response compression, encodings in order of preference. Brotli and zstd
+    # are used when their packages are installed (the "compression" extra).
+    COMPRESSION_ENCODINGS: list[str] = json.loads(
+        os.getenv("COMPRESSION_ENCODINGS", '["zstd", "br", "gzip"]')
+    )
+    COMPRESSION_MINIMUM_SIZE: int = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+    COMPRESSION_GZIP_LEVEL: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", "4"))
+    COMPRESSION_BROTLI_QUALITY: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+    COMPRESSION_ZSTD_LEVEL: int = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+
+    # Results of POST /chat requests sent with an Idempotency-Key header
+    IDEMPOTENCY_TTL_SECONDS: float = float(
+        os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400")
+    )
+    IDEMPOTENCY_MAX_ENTRIES: int = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+
+    # Exact-match cache of generated replies, only used with greedy decoding.
+    # GENERATION_CACHE_DIR enables the on-disk tier that survives restarts.
+    GENERATION_CACHE_ENABLED: bool = (
+        os.getenv("GENERATION_CACHE_ENABLED", "true").lower() == "true"
+    )
+    GENERATION_CACHE_TTL_SECONDS: float = float(
+        os.getenv("GENERATION_CACHE_TTL_SECONDS", str(7 * 24 * 3600))
+    )
+    GENERATION_CACHE_MAX_BYTES: int = int(
+        os.getenv("GENERATION_CACHE_MAX_BYTES", str(32 * 1024 * 1024))
+    )
+    GENERATION_CACHE_DIR: str = os.getenv("GENERATION_CACHE_DIR", "")
+    GENERATION_CACHE_DISK_MAX_BYTES: int = int(
+        os.getenv("GENERATION_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024))
+    )
+
+    # Semantic cache of first-turn replies (opt-in). SEMANTIC_CACHE_ENCODER is
+    # a transformers model name for embeddings, empty uses the chat model.
+    # At most SEMANTIC_CACHE_EMBED_CONCURRENCY messages are embedded at once.
+    SEMANTIC_CACHE_ENABLED: bool = (
+        os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    )
+    SEMANTIC_CACHE_ENCODER: str = os.getenv("SEMANTIC_CACHE_ENCODER", "")
+    SEMANTIC_CACHE_THRESHOLD: float = float(
+        os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")
+    )
+    SEMANTIC_CACHE_MAX_ENTRIES: int = int(
+        os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000")
+    )
+    SEMANTIC_CACHE_TTL_SECONDS: float = float(
+        os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(24 * 3600))
+    )
+    SEMANTIC_CACHE_EMBED_CONCURRENCY: int = int(
+        os.getenv("SEMANTIC_CACHE_EMBED_CONCURRENCY", "1")
+    )
+
+    # Generations running at once on the chat model, and the order of those
+    # waiting: "fifo", "wfq" (weighted fair queuing per user) or "sjf" (shortest
+    # predicted job first). SCHEDULER_USER_WEIGHTS maps user ids to wfq weights.
+    GENERATION_CONCURRENCY: int = int(os.getenv("GENERATION_CONCURRENCY", "1"))
+    SCHEDULER_POLICY: str = os.getenv("SCHEDULER_POLICY", "fifo")
+    SCHEDULER_USER_WEIGHTS: dict[str, float] = json.loads(
+        os.getenv("SCHEDULER_USER_WEIGHTS", "{}")
+    )
+
+    # Admission control: above the estimated wait SLO, turns generate at most
+    # ADMISSION_DEGRADED_MAX_NEW_TOKENS (default half of MAX_NEW_TOKENS), above
+    # ADMISSION_REJECT_FACTOR times the SLO they are rejected. 0 disables it.
+    ADMISSION_WAIT_SLO_SECONDS: float = float(
+        os.getenv("ADMISSION_WAIT_SLO_SECONDS", "0")
+    )
+    ADMISSION_REJECT_FACTOR: float = float(os.getenv("ADMISSION_REJECT_FACTOR", "2"))
+    ADMISSION_DEGRADED_MAX_NEW_TOKENS: int = int(
+        os.getenv("ADMISSION_DEGRADED_MAX_NEW_TOKENS", "0")
+    )
+
+    # Per-user rate limit in model tokens (prompt plus generated), 0 disables it.
+    # The burst defaults to a minute of tokens. RATE_LIMIT_BACKEND: "memory"
+    # (per worker) or "database" (shared by all workers).
+    RATE_LIMIT_TOKENS_PER_MINUTE: float = float(
+        os.getenv("RATE_LIMIT_TOKENS_PER_MINUTE", "0")
+    )
+    RATE_LIMIT_BURST_TOKENS: float = float(os.getenv("RATE_LIMIT_BURST_TOKENS", "0"))
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory")
+
+    # DO_SAMPLE: None keeps the model's generation config (sampling for Qwen3),
+    # false forces greedy decoding
+    chat_model = {
+        "MAX_NEW_TOKENS": 100,
+        "TRUST_REMOTE_CODE": True,
+        "DO_SAMPLE": (
+            os.getenv("CHAT_MODEL_DO_SAMPLE").lower() == "true"
+            if os.getenv("CHAT_MODEL_DO_SAMPLE")
+            else None
+        ),
+    }
 
     # dev
     DUMMY_USER_ID: int = 1
@@ -1,3 +1,11 @@
 """Database connections."""
 
-from .mysql import get_mysql_db, test_connection
+from .mysql import (
+    get_async_mysql_db,
+    get_mysql_db,
+    streaming_session,
+    test_connection,
+    warm_up_connections,
+)
+from .sharding import get_async_user_shard_db, get_user_shard_db, shard_map
+from .replicas import get_read_db, replica_set
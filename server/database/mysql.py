@@ -1,12 +1,41 @@
 """MySQL database connection"""
 
+from contextlib import contextmanager
+from typing import Iterator
+
 from config import settings
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from .pool import (
+    InstrumentedAsyncQueuePool,
+    InstrumentedQueuePool,
+    instrument_pool,
+    pool_options,
+    warm_up_async_pool,
+    warm_up_pool,
+)
 
-engine = create_engine(settings.DATABASE_URL)
+engine = create_engine(
+    settings.DATABASE_URL, poolclass=InstrumentedQueuePool, **pool_options(settings)
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for routes running on the event loop. expire_on_commit is off so
+# committed objects can still be read without an implicit (blocking) refresh.
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL,
+    poolclass=InstrumentedAsyncQueuePool,
+    **pool_options(settings),
+)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
+instrument_pool(engine, "sync")
+instrument_pool(async_engine, "async")
+
 
 def get_mysql_db():
     """Get database session"""
@@ -17,6 +46,27 @@ def get_mysql_db():
         db.close()
 
 
+@contextmanager
+def streaming_session(db: Session) -> Iterator[Session]:
+    """
+    A session of its own on the database of a request's session, for a
+    streamed response body: FastAPI may close the request's dependencies
+    before the body is sent, and a closed session would check out a
+    connection nothing returns.
+    """
+    session = Session(bind=db.get_bind(), autoflush=False)
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+async def get_async_mysql_db():
+    """Get async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def test_connection():
     """Test database connection"""
     try:
@@ -25,3 +75,13 @@ def test_connection():
         return True
     except Exception:
         return False
+
+
+async def warm_up_connections() -> int:
+    """Fill both pools with ready connections before serving traffic"""
+    count = min(settings.DB_POOL_WARMUP, settings.DB_POOL_SIZE)
+    if count <= 0:
+        return 0
+    opened = warm_up_pool(engine, count)
+    opened += await warm_up_async_pool(async_engine, count)
+    return opened
@@ -0,0 +1,86 @@
+"""Instrumented connection pools and pool warm-up"""
+
+import asyncio
+import time
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from utils.metrics import metrics
+
+
+class _CheckoutTimingMixin:
+    """Record how long each checkout waited for a free connection."""
+
+    metrics_name = "db_pool"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.histogram(f"{self.metrics_name}.checkout_wait_seconds").observe(
+                time.perf_counter() - started
+            )
+
+
+class InstrumentedQueuePool(_CheckoutTimingMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument_pool(engine: Engine | AsyncEngine, name: str):
+    """Publish the pool gauges of an engine under db_pool.<name>.*"""
+    if isinstance(engine, AsyncEngine):
+        engine = engine.sync_engine
+
+    pool = engine.pool
+    prefix = f"db_pool.{name}"
+    pool.metrics_name = prefix
+
+    metrics.gauge(f"{prefix}.size", pool.size)
+    metrics.gauge(f"{prefix}.in_use", pool.checkedout)
+    metrics.gauge(f"{prefix}.idle", pool.checkedin)
+    metrics.gauge(f"{prefix}.overflow", lambda: max(pool.overflow(), 0))
+
+
+def pool_options(settings) -> dict:
+    """Engine keyword arguments for the configured pool behaviour."""
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def warm_up_pool(engine: Engine, connections: int) -> int:
+    """Open `connections` connections up front so the first requests don't pay for it."""
+    opened = []
+    try:
+        for _ in range(connections):
+            opened.append(engine.connect())
+    finally:
+        for connection in opened:
+            connection.close()
+    return len(opened)
+
+
+async def warm_up_async_pool(engine: AsyncEngine, connections: int) -> int:
+    """Async counterpart of warm_up_pool."""
+    results = await asyncio.gather(
+        *(engine.connect().start() for _ in range(connections)),
+        return_exceptions=True,
+    )
+    opened = [result for result in results if not isinstance(result, BaseException)]
+    for connection in opened:
+        await connection.close()
+
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        raise errors[0]
+    return len(opened)
@@ -0,0 +1,173 @@
+"""
+Read replicas for the GET conversation endpoints.
+
+Reads go to a replica whose lag is within REPLICA_MAX_LAG_SECONDS, otherwise
+to the primary. Lag is measured with ReplicationHeartbeat: the primary
+rewrites a timestamp every REPLICA_HEARTBEAT_INTERVAL seconds and a replica is
+as far behind as its copy of that timestamp is old. A user who just had a
+chat turn reads from the primary for REPLICA_PIN_SECONDS, so the turn is
+visible to them right away (read-your-writes). Writes always go to the
+primary.
+"""
+
+import asyncio
+import itertools
+import logging
+import threading
+import time
+
+from config import settings
+from fastapi import Depends
+from models import ReplicationHeartbeat
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+from utils.metrics import metrics
+
+from .pool import InstrumentedQueuePool, instrument_pool, pool_options
+from .sharding import get_user_shard_db, shard_map
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+    def __init__(self, name: str, engine: Engine):
+        self.name = name
+        self.engine = engine
+        self.session_factory = sessionmaker(
+            bind=engine, autoflush=False, info={"replica": name}
+        )
+        self.lag_seconds: float | None = None
+        self.checked_at: float | None = None
+
+    def check_lag(self) -> float | None:
+        try:
+            with self.session_factory() as db:
+                self.lag_seconds = ReplicationHeartbeat.lag_seconds(db)
+        except Exception as e:
+            logger.warning(f"Lag check of replica {self.name} failed: {e}")
+            self.lag_seconds = None
+        self.checked_at = time.monotonic()
+        return self.lag_seconds
+
+
+class ReplicaSet:
+    def __init__(
+        self,
+        urls: list[str],
+        max_lag_seconds: float,
+        lag_check_interval: float,
+        pin_seconds: float,
+        engine_options: dict | None = None,
+    ):
+        self.max_lag_seconds = max_lag_seconds
+        self.lag_check_interval = lag_check_interval
+        self.pin_seconds = pin_seconds
+        self.replicas: list[Replica] = []
+        # user id -> monotonic time until which the user reads from the primary
+        self._pinned_until: dict[int, float] = {}
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+
+        for index, url in enumerate(urls):
+            name = f"replica{index}"
+            self.replicas.append(
+                Replica(name, create_engine(url, **(engine_options or {})))
+            )
+            metrics.gauge(
+                f"db_replica.{name}.lag_seconds",
+                lambda replica=self.replicas[-1]: replica.lag_seconds or 0.0,
+            )
+
+    @classmethod
+    def from_settings(cls) -> "ReplicaSet":
+        replica_set = cls(
+            settings.READ_REPLICA_URLS,
+            max_lag_seconds=settings.REPLICA_MAX_LAG_SECONDS,
+            lag_check_interval=settings.REPLICA_LAG_CHECK_INTERVAL,
+            pin_seconds=settings.REPLICA_PIN_SECONDS,
+            engine_options={
+                "poolclass": InstrumentedQueuePool,
+                **pool_options(settings),
+            },
+        )
+        for replica in replica_set.replicas:
+            instrument_pool(replica.engine, replica.name)
+        return replica_set
+
+    def pin_user(self, user_id: int):
+        """Send the reads of a user to the primary for the next pin_seconds"""
+        if self.replicas:
+            self._pinned_until[user_id] = time.monotonic() + self.pin_seconds
+
+    def is_pinned(self, user_id: int) -> bool:
+        pinned_until = self._pinned_until.get(user_id)
+        if pinned_until is None:
+            return False
+        if time.monotonic() >= pinned_until:
+            self._pinned_until.pop(user_id, None)
+            return False
+        return True
+
+    def _is_fresh(self, replica: Replica) -> bool:
+        stale_check = (
+            replica.checked_at is None
+            or time.monotonic() - replica.checked_at >= self.lag_check_interval
+        )
+        lag = replica.check_lag() if stale_check else replica.lag_seconds
+        return lag is not None and lag <= self.max_lag_seconds
+
+    def choose(self, user_id: int) -> Replica | None:
+        """Replica to read from, or None to read from the primary"""
+        if not self.replicas:
+            return None
+        if self.is_pinned(user_id):
+            metrics.counter("db_replica.primary_reads.pinned").inc()
+            return None
+
+        with self._lock:
+            start = next(self._next)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if self._is_fresh(replica):
+                metrics.counter("db_replica.replica_reads").inc()
+                return replica
+
+        metrics.counter("db_replica.primary_reads.lagging").inc()
+        return None
+
+
+replica_set = ReplicaSet.from_settings()
+
+
+def get_read_db(primary: Session = Depends(get_user_shard_db)):
+    """Session for read-only endpoints: a replica when one is fresh, else the primary"""
+    # replicas are configured for DATABASE_URL, shards are read from directly
+    # TODO: remove the dummy user id here after an auth system is added
+    replica = None
+    if not shard_map.sharded:
+        replica = replica_set.choose(settings.DUMMY_USER_ID)
+    if replica is None:
+        yield primary
+        return
+
+    db = replica.session_factory(info={"primary": primary})
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def run_heartbeat(session_factory, interval_seconds: float):
+    """Write the replication heartbeat on the primary every interval_seconds, until cancelled"""
+    while True:
+        try:
+            await asyncio.to_thread(_beat, session_factory)
+        except Exception as e:
+            logger.error(f"Error writing the replication heartbeat: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+def _beat(session_factory):
+    with session_factory() as db:
+        ReplicationHeartbeat.beat(db)
@@ -0,0 +1,250 @@
+"""
+User-sharded storage of conversations and messages.
+
+SHARD_DATABASE_URLS maps shard names to databases. The main database
+(DATABASE_URL) stays the directory: it holds the users, the shard of every
+user (UserShard) and the allocator of conversation ids (ConversationDirectory),
+which keeps ids unique across shards. A user is placed on a shard the first
+time their conversations are accessed, and stays there until moved with
+services.shard_rebalancer. Every shard has the full schema, migrated with
+`alembic -x shard=<name> upgrade head`, and a copy of the rows of its users,
+so foreign keys hold on each shard.
+
+Each worker caches the shard of a user for SHARD_ASSIGNMENT_TTL_SECONDS, so
+a move reaches every worker within that time; the rebalancer waits it out
+before deleting the source rows.
+
+Without SHARD_DATABASE_URLS nothing is routed, the main database is the only
+shard, and conversation ids come from its own autoincrement without being
+registered. Every start with shards registers such conversations first
+(register_unsharded_conversations), so sharding can be turned on later.
+"""
+
+import time
+from typing import Callable
+
+from config import settings
+from fastapi import Depends
+from models import ConversationDirectory, User, UserShard
+from sqlalchemy import create_engine, insert
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import Session, sessionmaker
+
+from .mysql import AsyncSessionLocal, SessionLocal, get_async_mysql_db, get_mysql_db
+from .pool import (
+    InstrumentedAsyncQueuePool,
+    InstrumentedQueuePool,
+    instrument_pool,
+    pool_options,
+)
+
+# asyncio driver used for the async engine of a shard
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url: str) -> str:
+    parsed = make_url(url)
+    drivername = ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+def copy_user_to_shard(db: Session, user: User):
+    """Make sure the shard has the row of a user its conversations point to."""
+    if db.get(User, user.id) is None:
+        db.execute(
+            insert(User).values(
+                id=user.id,
+                username=user.username,
+                email=user.email,
+                password_hash=user.password_hash,
+                created_at=user.created_at,
+            )
+        )
+        db.commit()
+
+
+class ShardMap:
+    def __init__(
+        self,
+        urls: dict[str, str],
+        directory_session_factory,
+        async_directory_session_factory,
+        engine_options: dict | None = None,
+        async_engine_options: dict | None = None,
+        assignment_ttl_seconds: float = 0.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.names = sorted(urls)
+        self.directory_session_factory = directory_session_factory
+        self.async_directory_session_factory = async_directory_session_factory
+        self.engines: dict[str, Engine] = {}
+        self.async_engines: dict[str, AsyncEngine] = {}
+        self.session_factories: dict[str, sessionmaker] = {}
+        self.async_session_factories: dict[str, async_sessionmaker] = {}
+        # user id -> (shard, expiry), read from the directory as users are
+        # routed and again once expired, so moves by other processes show up
+        self.assignment_ttl_seconds = assignment_ttl_seconds
+        self.clock = clock
+        self._assignments: dict[int, tuple[str, float]] = {}
+
+        for name in self.names:
+            engine = create_engine(urls[name], **(engine_options or {}))
+            async_engine = create_async_engine(
+                async_database_url(urls[name]), **(async_engine_options or {})
+            )
+            self.engines[name] = engine
+            self.async_engines[name] = async_engine
+            self.session_factories[name] = sessionmaker(
+                bind=engine, autoflush=False, info={"shard": name}
+            )
+            self.async_session_factories[name] = async_sessionmaker(
+                bind=async_engine,
+                autoflush=False,
+                expire_on_commit=False,
+                info={"shard": name},
+            )
+
+    @classmethod
+    def from_settings(cls) -> "ShardMap":
+        shard_map = cls(
+            settings.SHARD_DATABASE_URLS,
+            SessionLocal,
+            AsyncSessionLocal,
+            engine_options={
+                "poolclass": InstrumentedQueuePool,
+                **pool_options(settings),
+            },
+            async_engine_options={
+                "poolclass": InstrumentedAsyncQueuePool,
+                **pool_options(settings),
+            },
+            assignment_ttl_seconds=settings.SHARD_ASSIGNMENT_TTL_SECONDS,
+        )
+        for name in shard_map.names:
+            instrument_pool(shard_map.engines[name], f"shard.{name}.sync")
+            instrument_pool(shard_map.async_engines[name], f"shard.{name}.async")
+        return shard_map
+
+    @property
+    def sharded(self) -> bool:
+        return bool(self.names)
+
+    def placement(self, user_id: int) -> str:
+        """Shard a new user is placed on"""
+        return self.names[user_id % len(self.names)]
+
+    def _cached(self, user_id: int) -> str | None:
+        assignment = self._assignments.get(user_id)
+        if assignment is None or assignment[1] <= self.clock():
+            return None
+        return assignment[0]
+
+    def _remember(self, user_id: int, shard: str):
+        self._assignments[user_id] = (shard, self.clock() + self.assignment_ttl_seconds)
+
+    def shard_for_user(self, directory: Session, user_id: int) -> str:
+        """Shard of a user, placing the user on first access."""
+        shard = self._cached(user_id)
+        if shard is not None:
+            return shard
+
+        shard = UserShard.get_shard(directory, user_id)
+        if shard is None:
+            shard = self.placement(user_id)
+            user = directory.get(User, user_id)
+            if user is not None:
+                with self.session_factories[shard]() as db:
+                    copy_user_to_shard(db, user)
+                UserShard.assign(directory, user_id, shard)
+        self._remember(user_id, shard)
+        return shard
+
+    async def shard_for_user_async(self, directory: AsyncSession, user_id: int) -> str:
+        shard = self._cached(user_id)
+        if shard is not None:
+            return shard
+
+        shard = await directory.run_sync(UserShard.get_shard, user_id)
+        if shard is None:
+            shard = self.placement(user_id)
+            user = await directory.get(User, user_id)
+            if user is not None:
+                async with self.async_session_factories[shard]() as db:
+                    await db.run_sync(copy_user_to_shard, user)
+                await directory.run_sync(UserShard.assign, user_id, shard)
+        self._remember(user_id, shard)
+        return shard
+
+    def forget(self, user_id: int):
+        """Drop the cached shard of a user in this process, after it was moved"""
+        self._assignments.pop(user_id, None)
+
+    def register_unsharded_conversations(self) -> int:
+        """
+        Register the conversations created while unsharded in the directory,
+        before any id is allocated. Returns how many were registered.
+        """
+        with self.directory_session_factory() as directory:
+            try:
+                return ConversationDirectory.register_existing(directory)
+            except IntegrityError:
+                # another worker registered some of them at the same time
+                directory.rollback()
+                return ConversationDirectory.register_existing(directory)
+
+    def allocate_conversation_id(self, user_id: int) -> int | None:
+        """Id for a new conversation, or None to let the database pick one when unsharded."""
+        if not self.sharded:
+            return None
+        with self.directory_session_factory() as directory:
+            return ConversationDirectory.allocate(directory, user_id)
+
+    async def allocate_conversation_id_async(self, user_id: int) -> int | None:
+        if not self.sharded:
+            return None
+        async with self.async_directory_session_factory() as directory:
+            return await directory.run_sync(ConversationDirectory.allocate, user_id)
+
+
+shard_map = ShardMap.from_settings()
+
+
+def get_user_shard_db(directory: Session = Depends(get_mysql_db)):
+    """Database session on the shard of the current user"""
+    if not shard_map.sharded:
+        yield directory
+        return
+
+    # TODO: remove the dummy user id here after an auth system is added
+    shard = shard_map.shard_for_user(directory, settings.DUMMY_USER_ID)
+    db = shard_map.session_factories[shard]()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_user_shard_db(
+    directory: AsyncSession = Depends(get_async_mysql_db),
+):
+    """Async database session on the shard of the current user"""
+    if not shard_map.sharded:
+        yield directory
+        return
+
+    # TODO: remove the dummy user id here after an auth system is added
+    shard = await shard_map.shard_for_user_async(directory, settings.DUMMY_USER_ID)
+    async with shard_map.async_session_factories[shard]() as db:
+        yield db
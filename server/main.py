@@ -1,9 +1,25 @@
+import asyncio
 import logging
 
 from chat_model_loader import load_model_and_processor
 from config import settings
-from database import test_connection
-from routers import chat_model_router, conversation_router, user_router
+from database import (
+    replica_set,
+    shard_map,
+    test_connection,
+    warm_up_connections,
+)
+from database.replicas import run_heartbeat
+from database.mysql import AsyncSessionLocal, SessionLocal
+from routers import (
+    chat_model_router,
+    conversation_router,
+    metrics_router,
+    user_router,
+)
+from services.archiver import run_archiver
+from services.message_writer import message_writer
+from utils.compression import CompressionMiddleware
 from utils.startup import ensure_dummy_user
 
 # config logging
@@ -34,6 +50,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "ETag",
+        "Last-Modified",
+        "X-Sync-Token",
+        "Idempotent-Replayed",
+        "Retry-After",
+    ],
+)
+
+# Compress responses for clients that accept it, listings are large and repetitive
+app.add_middleware(
+    CompressionMiddleware,
+    encodings=settings.COMPRESSION_ENCODINGS,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+    zstd_level=settings.COMPRESSION_ZSTD_LEVEL,
 )
 
 
@@ -47,20 +80,64 @@ async def startup_event():
         exit(1)
 
     logger.info("Database connection successful")
+    if shard_map.sharded:
+        registered = shard_map.register_unsharded_conversations()
+        if registered:
+            logger.info(f"Registered {registered} unsharded conversations")
+        logger.info(f"Conversations sharded by user across {shard_map.names}")
+
+    opened = await warm_up_connections()
+    logger.info(f"Warmed up {opened} database connections")
 
     # Ensure default user exists for development and testing
     ensure_dummy_user()
 
+    if settings.MESSAGE_WRITE_BEHIND:
+        await message_writer.start(AsyncSessionLocal, shard_map.async_session_factories)
+        logger.info("Write-behind message persistence enabled")
+
+    if settings.ARCHIVE_AFTER_DAYS > 0:
+        # every shard archives its own conversations
+        session_factories = list(shard_map.session_factories.values()) or [SessionLocal]
+        app.state.archiver_tasks = [
+            asyncio.create_task(
+                run_archiver(session_factory, settings.ARCHIVE_INTERVAL_SECONDS)
+            )
+            for session_factory in session_factories
+        ]
+        logger.info(
+            f"Archiving conversations inactive for {settings.ARCHIVE_AFTER_DAYS} days"
+        )
+
+    if replica_set.replicas:
+        app.state.heartbeat_task = asyncio.create_task(
+            run_heartbeat(SessionLocal, settings.REPLICA_HEARTBEAT_INTERVAL)
+        )
+        logger.info(f"Reading conversations from {len(replica_set.replicas)} replicas")
+
     logger.info("Loading chat model...")
     load_model_and_processor()
     logger.info("Chat model and processor loaded successfully")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks and flush chat turns still queued for write-behind"""
+    for archiver_task in getattr(app.state, "archiver_tasks", []):
+        archiver_task.cancel()
+    heartbeat_task = getattr(app.state, "heartbeat_task", None)
+    if heartbeat_task is not None:
+        heartbeat_task.cancel()
+
+    await message_writer.stop()
+
+
 # configure API router
 api_router = APIRouter(prefix="/api")
 api_router.include_router(user_router)
 api_router.include_router(chat_model_router)
 api_router.include_router(conversation_router)
+api_router.include_router(metrics_router)
 
 app.include_router(api_router)
 
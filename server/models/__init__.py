@@ -1,6 +1,20 @@
 from .base import Base
 from .user import User
 from .conversation import Conversation
+from .conversation_archive import ConversationArchive
 from .message import Message
+from .rate_limit_bucket import RateLimitBucket
+from .replication_heartbeat import ReplicationHeartbeat
+from .shard_directory import ConversationDirectory, UserShard
 
-__all__ = ["Base", "User", "Conversation", "Message"]
+__all__ = [
+    "Base",
+    "User",
+    "Conversation",
+    "ConversationArchive",
+    "ConversationDirectory",
+    "Message",
+    "RateLimitBucket",
+    "ReplicationHeartbeat",
+    "UserShard",
+]
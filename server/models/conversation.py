@@ -1,13 +1,144 @@
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
-from sqlalchemy.orm import Session, joinedload, relationship
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, NamedTuple
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Integer,
+    String,
+    Text,
+    event,
+    insert,
+    select,
+    update,
+)
+from sqlalchemy.dialects.mysql import LONGTEXT
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, relationship, selectinload
 from sqlalchemy.sql import func
 
 from .base import Base
+from .conversation_archive import ConversationArchive
+from .message import Message, SenderType
+
+LISTING_BATCH_SIZE = 1000
+# Conversations per chunk of a streamed listing
+LISTING_CHUNK_SIZE = 200
 
 DEFAULT_SYSTEM_PROMPT = "You are a helpful and friendly assistant."
 SYSTEM_PROMPT_TYPE = "system"
 
 
+class TranscriptEntry(NamedTuple):
+    sent_by: SenderType
+    content: str
+    token_ids: list[int] | None = None
+
+
+class Validator(NamedTuple):
+    """Cache validators of a conversation read, see Conversation.get_validator"""
+
+    etag: str
+    last_modified: datetime | None
+    archived: bool = False
+
+
+class Changes(NamedTuple):
+    """What Conversation.get_changes found, and where the next call starts"""
+
+    conversations: list[dict]
+    messages: list[dict]
+    last_conversation_id: int
+    last_message_id: int
+    has_more: bool
+
+
+def _settle_cutoff(db: Session, settle_seconds: float) -> datetime | None:
+    """Rows created after this, by the database clock, may not be settled"""
+    if settle_seconds <= 0:
+        return None
+    now = db.execute(select(func.now())).scalar()
+    return now - timedelta(seconds=settle_seconds)
+
+
+def _settled_mark(rows, after_id: int, cutoff: datetime | None) -> tuple[int, bool]:
+    """
+    Id of the last of the rows, in id order, that precedes every row created
+    after cutoff, and whether such a row was held back
+    """
+    mark = after_id
+    for row in rows:
+        if cutoff is not None and row.created_at > cutoff:
+            return mark, True
+        mark = row.id
+    return mark, False
+
+
+def _validator(
+    parts: tuple, last_modified: datetime | None, archived: bool = False
+) -> Validator:
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=8).hexdigest()
+    if last_modified is not None and last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # weak: the same state may be sent with different content encodings
+    return Validator(f'W/"{digest}"', last_modified, archived)
+
+
+def encode_transcript(entries: list[TranscriptEntry]) -> str:
+    """One JSON array per line: [sender, content] or [sender, content, token_ids]"""
+    lines = []
+    for entry in entries:
+        item = [entry.sent_by.value, entry.content]
+        if entry.token_ids is not None:
+            item.append(entry.token_ids)
+        lines.append(json.dumps(item, ensure_ascii=False, separators=(",", ":")))
+    return "".join(line + "\n" for line in lines)
+
+
+def decode_transcript(transcript: str) -> list[TranscriptEntry]:
+    """Parse a whole transcript with a single json.loads"""
+    if not transcript:
+        return []
+    # JSON escapes newlines inside strings, so raw newlines only separate entries
+    items = json.loads("[" + transcript.rstrip("\n").replace("\n", ",") + "]")
+    return [TranscriptEntry(SenderType(item[0]), *item[1:]) for item in items]
+
+
+def _message_dict(row) -> dict:
+    return {
+        "id": row.id,
+        "sender": row.sent_by.value,
+        "content": row.content,
+        "created_at": row.created_at.isoformat(),
+    }
+
+
+class _MessageCursor:
+    """Message rows ordered by conversation, handed out one conversation at a time"""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._pending = next(self._rows, None)
+
+    def messages_of(self, conversation_id: int) -> Iterator[dict]:
+        # skip what the consumer left of earlier conversations
+        while (
+            self._pending is not None
+            and self._pending.conversation_id < conversation_id
+        ):
+            self._pending = next(self._rows, None)
+        while (
+            self._pending is not None
+            and self._pending.conversation_id == conversation_id
+        ):
+            yield _message_dict(self._pending)
+            self._pending = next(self._rows, None)
+
+
 class Conversation(Base):
     __tablename__ = "conversations"
 
@@ -19,27 +150,67 @@ class Conversation(Base):
     prompt = Column(String(4000), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # True while the messages live in conversation_archives instead of messages
+    archived = Column(Boolean, nullable=False, default=False, server_default="0")
+    # Serialized history (see encode_transcript), appended on every chat turn so
+    # prompts are built from this row alone. NULL means it must be rebuilt from
+    # the messages table, e.g. after messages were written outside a chat turn.
+    transcript = Column(Text().with_variant(LONGTEXT, "mysql"), nullable=True)
+    # Bumped by every write of the messages (chat turns and ORM writes), so
+    # cache validators are read from this row instead of the messages table
+    version = Column(Integer, nullable=False, default=0, server_default="0")
     messages = relationship(
         "Message",
         back_populates="conversation",
         cascade="all, delete-orphan",
-        order_by="Message.created_at",
+        order_by="[Message.created_at, Message.id]",
     )
 
     @classmethod
     def create_conversation(
-        cls, db: Session, user_id: int, title: str, prompt: str
+        cls,
+        db: Session,
+        user_id: int,
+        title: str,
+        prompt: str,
+        conversation_id: int | None = None,
     ) -> "Conversation":
+        # conversation_id is set by sharded storage, see database.sharding
         new_conversation = cls(
+            id=conversation_id,
             user_id=user_id,
             title=title,
             prompt=prompt if prompt else DEFAULT_SYSTEM_PROMPT,
+            transcript="",
         )
         db.add(new_conversation)
         db.commit()
         db.refresh(new_conversation)
         return new_conversation
 
+    @classmethod
+    async def create_conversation_async(
+        cls,
+        db: AsyncSession,
+        user_id: int,
+        title: str,
+        prompt: str,
+        conversation_id: int | None = None,
+    ) -> "Conversation":
+        new_conversation = cls(
+            id=conversation_id,
+            user_id=user_id,
+            title=title,
+            prompt=prompt if prompt else DEFAULT_SYSTEM_PROMPT,
+            transcript="",
+        )
+        db.add(new_conversation)
+        await db.commit()
+        # messages is loaded explicitly, lazy loading is not possible under asyncio
+        await db.refresh(new_conversation)
+        await db.refresh(new_conversation, attribute_names=["messages"])
+        return new_conversation
+
     @classmethod
     def get_by_id(
         cls, db: Session, conversation_id: int, with_messages: bool = False
@@ -49,8 +220,219 @@ class Conversation(Base):
             query = query.options(joinedload(Conversation.messages))
 
         conversation = query.filter(Conversation.id == conversation_id).first()
+        if conversation is not None and conversation.archived:
+            # move a cold conversation back to hot storage on access. A replica
+            # session sends the write, and the read after it, to its primary.
+            db = db.info.get("primary", db)
+            ConversationArchive.restore(db, conversation_id)
+            query = query.with_session(db).populate_existing()
+            conversation = query.filter(Conversation.id == conversation_id).first()
         return conversation
 
+    @classmethod
+    def get_detail_by_id(cls, db: Session, conversation_id: int) -> dict | None:
+        """
+        A conversation with its messages, as the dict the API returns.
+
+        Like get_listing_by_user_id, the dict is built straight from the
+        selected columns, without ORM objects or Pydantic models.
+        """
+        row = db.execute(
+            select(
+                Conversation.id,
+                Conversation.title,
+                Conversation.prompt,
+                Conversation.created_at,
+                Conversation.archived,
+            ).where(Conversation.id == conversation_id)
+        ).first()
+        if row is None:
+            return None
+        if row.archived:
+            # restored the same way as in get_by_id, messages are then read
+            # from where the restore was written
+            cls.get_by_id(db, conversation_id)
+            db = db.info.get("primary", db)
+
+        messages = db.execute(
+            select(Message.id, Message.sent_by, Message.content, Message.created_at)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at, Message.id)
+        )
+        return {
+            "conversation_id": row.id,
+            "title": row.title,
+            "prompt": row.prompt,
+            "created_at": row.created_at.isoformat(),
+            "messages": [_message_dict(message) for message in messages],
+        }
+
+    @classmethod
+    def get_validator(cls, db: Session, conversation_id: int) -> Validator | None:
+        """
+        ETag and Last-Modified of get_detail_by_id, from a primary key read.
+
+        Writes of the messages bump version, changes of the conversation row
+        bump updated_at; message bodies are never loaded.
+        """
+        row = db.execute(
+            select(
+                Conversation.updated_at,
+                Conversation.created_at,
+                Conversation.archived,
+                Conversation.version,
+            ).where(Conversation.id == conversation_id)
+        ).first()
+        if row is None:
+            return None
+        return _validator(
+            (conversation_id, row.updated_at, row.archived, row.version),
+            row.updated_at or row.created_at,
+            row.archived,
+        )
+
+    @classmethod
+    def get_listing_validator(cls, db: Session, user_id: int) -> Validator:
+        """
+        ETag and Last-Modified of the listing of a user, from the rows of the
+        user's conversations only
+        """
+        row = db.execute(
+            select(
+                func.count(Conversation.id).label("conversation_count"),
+                func.max(Conversation.id).label("last_conversation_id"),
+                func.max(
+                    func.coalesce(Conversation.updated_at, Conversation.created_at)
+                ).label("last_modified"),
+                # versions only grow, a write anywhere changes the sum
+                func.coalesce(func.sum(Conversation.version), 0).label("versions"),
+            ).where(Conversation.user_id == user_id)
+        ).one()
+        return _validator(("listing", user_id, *row), row.last_modified)
+
+    @classmethod
+    def get_sync_marks(
+        cls, db: Session, user_id: int, settle_seconds: float = 0
+    ) -> tuple[int, int]:
+        """
+        Highest conversation id and highest message id of a user, 0 when none,
+        leaving out rows created less than settle_seconds ago
+        """
+        conversations = select(func.max(Conversation.id)).where(
+            Conversation.user_id == user_id
+        )
+        messages = (
+            select(func.max(Message.id))
+            .join(Conversation, Message.conversation_id == Conversation.id)
+            .where(Conversation.user_id == user_id)
+        )
+        cutoff = _settle_cutoff(db, settle_seconds)
+        if cutoff is not None:
+            conversations = conversations.where(Conversation.created_at <= cutoff)
+            messages = messages.where(Message.created_at <= cutoff)
+        last_conversation_id = db.execute(conversations).scalar()
+        last_message_id = db.execute(messages).scalar()
+        return last_conversation_id or 0, last_message_id or 0
+
+    @classmethod
+    def get_changes(
+        cls,
+        db: Session,
+        user_id: int,
+        after_conversation_id: int,
+        after_message_id: int,
+        limit: int,
+        settle_seconds: float = 0,
+    ) -> "Changes":
+        """
+        Conversations with an id above after_conversation_id and messages with
+        an id above after_message_id, as API dicts. At most `limit` messages
+        are read, in id order; those of new archived conversations come from
+        their blobs, outside the limit.
+
+        Ids are assigned at insert, not commit, so a row younger than
+        settle_seconds may be followed by a lower id committed later. The
+        returned marks stop before the first such row: it is returned again
+        by the next call, and the rows it hides are not skipped.
+        """
+        cutoff = _settle_cutoff(db, settle_seconds)
+        conversations = db.execute(
+            select(
+                Conversation.id,
+                Conversation.title,
+                Conversation.prompt,
+                Conversation.created_at,
+                Conversation.archived,
+            )
+            .where(
+                Conversation.user_id == user_id, Conversation.id > after_conversation_id
+            )
+            .order_by(Conversation.id)
+        ).all()
+        rows = db.execute(
+            select(
+                Message.id,
+                Message.conversation_id,
+                Message.sent_by,
+                Message.content,
+                Message.created_at,
+            )
+            .join(Conversation, Message.conversation_id == Conversation.id)
+            .where(Conversation.user_id == user_id, Message.id > after_message_id)
+            .order_by(Message.id)
+            .limit(limit + 1)
+        ).all()
+        has_more = len(rows) > limit
+        messages = [
+            {**_message_dict(row), "conversation_id": row.conversation_id}
+            for row in rows[:limit]
+        ]
+        # a partial page resumes after its last row, blob ids must not skip rows
+        last_message_id, held = _settled_mark(rows[:limit], after_message_id, cutoff)
+        # rows after a held one are younger still, they come once settled
+        has_more = has_more and not held
+
+        archived = [row.id for row in conversations if row.archived]
+        if archived:
+            archives = db.execute(
+                select(
+                    ConversationArchive.conversation_id, ConversationArchive.payload
+                ).where(ConversationArchive.conversation_id.in_(archived))
+            )
+            for conversation_id, payload in archives:
+                messages.extend(
+                    {
+                        "id": message["id"],
+                        "sender": message["sent_by"].value,
+                        "content": message["content"],
+                        "created_at": message["created_at"].isoformat(),
+                        "conversation_id": conversation_id,
+                    }
+                    for message in ConversationArchive.decode_messages(payload)
+                    if message["id"] > after_message_id
+                )
+            if not has_more and not held:
+                last_message_id = max([last_message_id] + [m["id"] for m in messages])
+        last_conversation_id, _ = _settled_mark(
+            conversations, after_conversation_id, cutoff
+        )
+
+        return Changes(
+            conversations=[
+                {
+                    "conversation_id": row.id,
+                    "title": row.title,
+                    "prompt": row.prompt,
+                    "created_at": row.created_at.isoformat(),
+                }
+                for row in conversations
+            ],
+            messages=messages,
+            last_conversation_id=last_conversation_id,
+            last_message_id=last_message_id,
+            has_more=has_more,
+        )
+
     @classmethod
     def get_by_user_id(
         cls, db: Session, user_id: int, with_messages: bool = False
@@ -60,3 +442,269 @@ class Conversation(Base):
             query = query.options(joinedload(Conversation.messages))
 
         return query.filter(Conversation.user_id == user_id).all()
+
+    @classmethod
+    def get_listing_by_user_id(cls, db: Session, user_id: int) -> list[dict]:
+        """
+        Read-only listing of a user's conversations with their messages.
+
+        Selects only the columns the API returns and builds the response dicts
+        straight from the rows, without ORM objects or Pydantic models.
+        """
+        return [
+            {**conversation, "messages": list(messages)}
+            for conversation, messages in cls.iter_listing_by_user_id(db, user_id)
+        ]
+
+    @classmethod
+    def iter_listing_by_user_id(
+        cls, db: Session, user_id: int
+    ) -> Iterator[tuple[dict, Iterator[dict]]]:
+        """
+        Streamed form of get_listing_by_user_id: (conversation, messages)
+        pairs in conversation order, messages being an iterator over the
+        conversation's messages. Conversations are read LISTING_CHUNK_SIZE at
+        a time and their messages through a yield_per cursor, so memory stays
+        bounded whatever the size of the history.
+        """
+        last_id = 0
+        while True:
+            chunk = db.execute(
+                select(
+                    Conversation.id,
+                    Conversation.title,
+                    Conversation.prompt,
+                    Conversation.created_at,
+                    Conversation.archived,
+                )
+                .where(Conversation.user_id == user_id, Conversation.id > last_id)
+                .order_by(Conversation.id)
+                .limit(LISTING_CHUNK_SIZE)
+            ).all()
+            if not chunk:
+                return
+            last_id = chunk[-1].id
+
+            # cold conversations are listed from their blobs, read-only. Blobs
+            # are fetched before the message cursor opens, a streaming cursor
+            # must be the only statement running on its connection.
+            archived = [row.id for row in chunk if row.archived]
+            payloads = dict(
+                db.execute(
+                    select(
+                        ConversationArchive.conversation_id, ConversationArchive.payload
+                    ).where(ConversationArchive.conversation_id.in_(archived))
+                ).all()
+                if archived
+                else []
+            )
+
+            result = db.execute(
+                select(
+                    Message.conversation_id,
+                    Message.id,
+                    Message.sent_by,
+                    Message.content,
+                    Message.created_at,
+                )
+                .where(
+                    Message.conversation_id.in_(
+                        [row.id for row in chunk if not row.archived]
+                    )
+                )
+                .order_by(Message.conversation_id, Message.created_at, Message.id)
+                .execution_options(yield_per=LISTING_BATCH_SIZE)
+            )
+            cursor = _MessageCursor(result)
+            try:
+                for row in chunk:
+                    conversation = {
+                        "conversation_id": row.id,
+                        "title": row.title,
+                        "prompt": row.prompt,
+                        "created_at": row.created_at.isoformat(),
+                    }
+                    if row.id in payloads:
+                        messages = (
+                            {
+                                "id": message["id"],
+                                "sender": message["sent_by"].value,
+                                "content": message["content"],
+                                "created_at": message["created_at"].isoformat(),
+                            }
+                            for message in ConversationArchive.decode_messages(
+                                payloads.pop(row.id)
+                            )
+                        )
+                    else:
+                        messages = cursor.messages_of(row.id)
+                    yield conversation, messages
+            finally:
+                result.close()
+
+    @classmethod
+    async def get_by_id_async(
+        cls, db: AsyncSession, conversation_id: int, with_messages: bool = False
+    ) -> "Conversation":
+        query = select(Conversation).where(Conversation.id == conversation_id)
+        if with_messages:
+            query = query.options(selectinload(Conversation.messages))
+
+        result = await db.execute(query)
+        conversation = result.scalars().first()
+        if conversation is not None and conversation.archived:
+            await db.run_sync(ConversationArchive.restore, conversation_id)
+            db.expire(conversation)
+            result = await db.execute(query.execution_options(populate_existing=True))
+            conversation = result.scalars().first()
+        return conversation
+
+    @classmethod
+    async def get_with_transcript_async(
+        cls, db: AsyncSession, conversation_id: int
+    ) -> tuple["Conversation | None", list[TranscriptEntry]]:
+        """
+        Load a conversation and its history from the transcript column: one
+        primary key read and one deserialize. A missing transcript is rebuilt
+        from the messages table and stored.
+        """
+        conversation = await db.get(cls, conversation_id)
+        if conversation is None:
+            return None, []
+        if conversation.transcript is not None and not conversation.archived:
+            return conversation, decode_transcript(conversation.transcript)
+
+        conversation = await cls.get_by_id_async(
+            db, conversation_id, with_messages=True
+        )
+        entries = [
+            TranscriptEntry(message.sent_by, message.content)
+            for message in conversation.messages
+        ]
+        await db.execute(
+            update(cls)
+            .where(cls.id == conversation_id, cls.transcript.is_(None))
+            .values(transcript=encode_transcript(entries))
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return conversation, entries
+
+    @staticmethod
+    def append_transcript_statement(
+        conversation_id: int, entries: list[TranscriptEntry]
+    ):
+        """
+        UPDATE appending entries in SQL and bumping the version. A NULL
+        transcript stays NULL.
+        """
+        return (
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(
+                transcript=Conversation.transcript + encode_transcript(entries),
+                version=Conversation.version + 1,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    @classmethod
+    def _turn_statements(
+        cls,
+        conversation_id: int,
+        user_message: str,
+        assistant_message: str,
+        assistant_token_ids: list[int] | None,
+        user_created_at: datetime | None,
+    ) -> list:
+        user_row = {
+            "conversation_id": conversation_id,
+            "sent_by": SenderType.USER,
+            "content": user_message,
+        }
+        assistant_row = {
+            "conversation_id": conversation_id,
+            "sent_by": SenderType.ASSISTANT,
+            "content": assistant_message,
+        }
+        if user_created_at is not None:
+            user_row["created_at"] = user_created_at
+            # both stamped by the application, a database default could sort
+            # before a user_created_at of the same second
+            assistant_row["created_at"] = max(
+                user_created_at, datetime.now(user_created_at.tzinfo)
+            )
+        # Core inserts: chat turns keep the transcript current themselves, so
+        # they must not trigger the ORM events that invalidate it
+        return [
+            insert(Message).values(**user_row),
+            insert(Message).values(**assistant_row),
+            cls.append_transcript_statement(
+                conversation_id,
+                [
+                    TranscriptEntry(SenderType.USER, user_message),
+                    TranscriptEntry(
+                        SenderType.ASSISTANT, assistant_message, assistant_token_ids
+                    ),
+                ],
+            ),
+        ]
+
+    @classmethod
+    def append_turn(
+        cls,
+        db: Session,
+        conversation_id: int,
+        user_message: str,
+        assistant_message: str,
+        assistant_token_ids: list[int] | None = None,
+        user_created_at: datetime | None = None,
+    ):
+        """Store the two messages of a chat turn and extend the transcript, in one transaction."""
+        for statement in cls._turn_statements(
+            conversation_id,
+            user_message,
+            assistant_message,
+            assistant_token_ids,
+            user_created_at,
+        ):
+            db.execute(statement)
+        db.commit()
+
+    @classmethod
+    async def append_turn_async(
+        cls,
+        db: AsyncSession,
+        conversation_id: int,
+        user_message: str,
+        assistant_message: str,
+        assistant_token_ids: list[int] | None = None,
+        user_created_at: datetime | None = None,
+    ):
+        for statement in cls._turn_statements(
+            conversation_id,
+            user_message,
+            assistant_message,
+            assistant_token_ids,
+            user_created_at,
+        ):
+            await db.execute(statement)
+        await db.commit()
+
+
+def _invalidate_transcript(mapper, connection, message):
+    """Messages written through the ORM (not a chat turn) make the transcript stale"""
+    conversations = Conversation.__table__
+    connection.execute(
+        update(conversations).where(conversations.c.id == message.conversation_id)
+        # keep updated_at as is, this is bookkeeping and not conversation activity
+        .values(
+            transcript=None,
+            updated_at=conversations.c.updated_at,
+            version=conversations.c.version + 1,
+        )
+    )
+
+
+for _event in ("after_insert", "after_update", "after_delete"):
+    event.listen(Message, _event, _invalidate_transcript)
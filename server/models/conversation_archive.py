@@ -0,0 +1,175 @@
+import json
+import time
+import zlib
+from datetime import datetime
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    ForeignKey,
+    Integer,
+    LargeBinary,
+    delete,
+    insert,
+    select,
+)
+from sqlalchemy.dialects.mysql import LONGBLOB
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from utils.metrics import metrics
+
+from .base import Base
+from .message import Message, SenderType
+
+COMPRESSION_LEVEL = 6
+# Message ids per DELETE when archiving, under the bound parameter limits
+DELETE_BATCH_SIZE = 1000
+
+
+class ConversationArchive(Base):
+    """Messages of a cold conversation, stored as one compressed blob."""
+
+    __tablename__ = "conversation_archives"
+
+    conversation_id = Column(
+        Integer,
+        ForeignKey("conversations.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    payload = Column(LargeBinary().with_variant(LONGBLOB, "mysql"), nullable=False)
+    message_count = Column(Integer, nullable=False)
+    raw_bytes = Column(Integer, nullable=False)
+    compressed_bytes = Column(Integer, nullable=False)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    @staticmethod
+    def encode_messages(rows) -> bytes:
+        return json.dumps(
+            [
+                [
+                    row.id,
+                    row.sent_by.value,
+                    row.content,
+                    row.created_at.isoformat() if row.created_at else None,
+                    row.updated_at.isoformat() if row.updated_at else None,
+                ]
+                for row in rows
+            ],
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+    @staticmethod
+    def decode_messages(payload: bytes) -> list[dict]:
+        """Decompress a payload into message row dicts, in conversation order."""
+        return [
+            {
+                "id": message_id,
+                "sent_by": SenderType(sent_by),
+                "content": content,
+                "created_at": (
+                    datetime.fromisoformat(created_at) if created_at else None
+                ),
+                "updated_at": (
+                    datetime.fromisoformat(updated_at) if updated_at else None
+                ),
+            }
+            for message_id, sent_by, content, created_at, updated_at in json.loads(
+                zlib.decompress(payload)
+            )
+        ]
+
+    @classmethod
+    def archive(cls, db: Session, conversation) -> "ConversationArchive | None":
+        """
+        Move the messages of a conversation into a compressed blob and delete
+        them from the messages table. Commits.
+
+        The conversation row is locked first, so turns appended meanwhile
+        wait, and only the messages written to the blob are deleted. If a
+        message was stored anyway, without the lock, the conversation is not
+        cold: nothing is archived and None is returned.
+        """
+        db.refresh(conversation, with_for_update=True)
+        rows = db.execute(
+            select(
+                Message.id,
+                Message.sent_by,
+                Message.content,
+                Message.created_at,
+                Message.updated_at,
+            )
+            .where(Message.conversation_id == conversation.id)
+            .order_by(Message.created_at, Message.id)
+        ).all()
+
+        raw = cls.encode_messages(rows)
+        payload = zlib.compress(raw, COMPRESSION_LEVEL)
+        archive = cls(
+            conversation_id=conversation.id,
+            payload=payload,
+            message_count=len(rows),
+            raw_bytes=len(raw),
+            compressed_bytes=len(payload),
+        )
+        db.add(archive)
+        archived_ids = [row.id for row in rows]
+        for start in range(0, len(archived_ids), DELETE_BATCH_SIZE):
+            db.execute(
+                delete(Message).where(
+                    Message.id.in_(archived_ids[start : start + DELETE_BATCH_SIZE])
+                )
+            )
+        remaining = db.execute(
+            select(Message.id)
+            .where(Message.conversation_id == conversation.id)
+            .limit(1)
+        ).first()
+        if remaining is not None:
+            db.rollback()
+            metrics.counter("archive.skipped_active").inc()
+            return None
+        conversation.archived = True
+        # rebuilt from the messages once the conversation is rehydrated
+        conversation.transcript = None
+        db.commit()
+
+        metrics.counter("archive.conversations").inc()
+        metrics.counter("archive.raw_bytes").inc(archive.raw_bytes)
+        metrics.counter("archive.compressed_bytes").inc(archive.compressed_bytes)
+        return archive
+
+    @classmethod
+    def restore(cls, db: Session, conversation_id: int) -> bool:
+        """
+        Move the archived messages of a conversation back into the messages
+        table. Commits. Returns False if there was nothing to restore.
+        """
+        started = time.perf_counter()
+        archive = db.execute(
+            select(cls).where(cls.conversation_id == conversation_id).with_for_update()
+        ).scalar_one_or_none()
+
+        from .conversation import Conversation
+
+        conversation = db.get(Conversation, conversation_id)
+        if archive is None:
+            if conversation is not None and conversation.archived:
+                conversation.archived = False
+                db.commit()
+            return False
+
+        rows = [
+            {"conversation_id": conversation_id, **message}
+            for message in cls.decode_messages(archive.payload)
+        ]
+        if rows:
+            db.execute(insert(Message), rows)
+        db.delete(archive)
+        conversation.archived = False
+        db.commit()
+
+        metrics.counter("archive.rehydrated_conversations").inc()
+        metrics.histogram("archive.rehydrate_seconds").observe(
+            time.perf_counter() - started
+        )
+        return True
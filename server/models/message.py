@@ -1,6 +1,23 @@
+import re
 from enum import Enum as PyEnum
 
-from sqlalchemy import Column, DateTime, Enum, ForeignKey, Integer, String
+from sqlalchemy import (
+    DDL,
+    Column,
+    DateTime,
+    Enum,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    column,
+    event,
+    select,
+    table,
+    text,
+)
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, relationship
 from sqlalchemy.sql import func
 
@@ -25,6 +42,17 @@ class Message(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     conversation = relationship("Conversation", back_populates="messages")
 
+    # Full-text index for message search. SQLite has no FULLTEXT, it gets the
+    # messages_fts FTS5 table defined below instead.
+    __table_args__ = (
+        Index(
+            "ix_messages_content_fulltext", "content", mysql_prefix="FULLTEXT"
+        ).ddl_if(dialect="mysql"),
+        # message counts per conversation (the conversation cache check)
+        # are answered from this index alone
+        Index("ix_messages_conversation_id_id", "conversation_id", "id"),
+    )
+
     @classmethod
     def create_message(
         cls, db: Session, conversation_id: int, sent_by: SenderType, content: str
@@ -34,3 +62,106 @@ class Message(Base):
         db.commit()
         db.refresh(message)
         return message
+
+    @classmethod
+    async def create_message_async(
+        cls, db: AsyncSession, conversation_id: int, sent_by: SenderType, content: str
+    ) -> "Message":
+        message = cls(conversation_id=conversation_id, sent_by=sent_by, content=content)
+        db.add(message)
+        await db.commit()
+        await db.refresh(message)
+        return message
+
+    @classmethod
+    def search(
+        cls, db: Session, user_id: int, query: str, limit: int, offset: int = 0
+    ) -> list[dict]:
+        """
+        Full-text search over the messages of a user's conversations.
+        Results are ordered by relevance, best first.
+        """
+        from .conversation import Conversation
+
+        columns = (
+            cls.id.label("message_id"),
+            cls.conversation_id,
+            Conversation.title.label("conversation_title"),
+            cls.sent_by,
+            cls.content,
+            cls.created_at,
+        )
+
+        if db.get_bind().dialect.name == "sqlite":
+            terms = re.findall(r"\w+", query)
+            if not terms:
+                return []
+            # quote every term so user input can't inject FTS5 query syntax
+            fts_query = " OR ".join(f'"{term}"' for term in terms)
+            fts = table("messages_fts", column("rowid"), column("rank"))
+            statement = (
+                select(*columns, (-fts.c.rank).label("score"))
+                .select_from(fts)
+                .join(cls, cls.id == fts.c.rowid)
+                .where(
+                    text("messages_fts MATCH :fts_query").bindparams(
+                        fts_query=fts_query
+                    )
+                )
+                .order_by(fts.c.rank, cls.id.desc())
+            )
+        else:
+            relevance = match(cls.content, against=query).in_natural_language_mode()
+            score = relevance.label("score")
+            statement = (
+                select(*columns, score)
+                .where(relevance)
+                .order_by(score.desc(), cls.id.desc())
+            )
+
+        statement = (
+            statement.join(Conversation, Conversation.id == cls.conversation_id)
+            .where(Conversation.user_id == user_id)
+            .limit(limit)
+            .offset(offset)
+        )
+
+        return [
+            {
+                "message_id": row.message_id,
+                "conversation_id": row.conversation_id,
+                "conversation_title": row.conversation_title,
+                "sender": row.sent_by.value,
+                "content": row.content,
+                "created_at": row.created_at.isoformat(),
+                "score": float(row.score),
+            }
+            for row in db.execute(statement)
+        ]
+
+
+# SQLite FTS5 index over messages.content, kept in sync by triggers. Used when
+# the schema is created on SQLite (tests, benchmarks); see the matching migration.
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE messages_fts USING fts5("
+    "content, content='messages', content_rowid='id')",
+    "CREATE TRIGGER messages_fts_ai AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER messages_fts_ad AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) "
+    "VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER messages_fts_au AFTER UPDATE OF content ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) "
+    "VALUES ('delete', old.id, old.content); "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+]
+
+for fts_ddl in SQLITE_FTS_DDL:
+    event.listen(
+        Message.__table__, "after_create", DDL(fts_ddl).execute_if(dialect="sqlite")
+    )
+event.listen(
+    Message.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS messages_fts").execute_if(dialect="sqlite"),
+)
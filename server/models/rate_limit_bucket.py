@@ -0,0 +1,71 @@
+from sqlalchemy import Column, Float, String, select
+from sqlalchemy.orm import Session
+
+from .base import Base
+
+
+class RateLimitBucket(Base):
+    """
+    Token bucket of a rate limit key, shared by all workers. Lives in the
+    directory database. Times are Unix timestamps so every worker refills
+    the bucket the same way.
+    """
+
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(String(128), primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)
+
+    @classmethod
+    def _locked(cls, db: Session, key: str, capacity: float, rate: float, now: float):
+        """The bucket row, locked and refilled up to now. Created full if missing."""
+        bucket = db.execute(
+            select(cls).where(cls.key == key).with_for_update()
+        ).scalar_one_or_none()
+        if bucket is None:
+            bucket = cls(key=key, tokens=capacity, updated_at=now)
+            db.add(bucket)
+            db.flush()
+        elapsed = max(now - bucket.updated_at, 0.0)
+        bucket.tokens = min(capacity, bucket.tokens + elapsed * rate)
+        bucket.updated_at = now
+        return bucket
+
+    @classmethod
+    def take(
+        cls,
+        db: Session,
+        key: str,
+        amount: float,
+        capacity: float,
+        rate: float,
+        now: float,
+    ) -> float:
+        """
+        Take `amount` tokens if the bucket holds them. Returns 0 when taken,
+        else the seconds until it will. Commits.
+        """
+        bucket = cls._locked(db, key, capacity, rate, now)
+        wait = 0.0
+        if bucket.tokens >= amount:
+            bucket.tokens -= amount
+        else:
+            wait = (amount - bucket.tokens) / rate
+        db.commit()
+        return wait
+
+    @classmethod
+    def adjust(
+        cls,
+        db: Session,
+        key: str,
+        delta: float,
+        capacity: float,
+        rate: float,
+        now: float,
+    ):
+        """Give back (positive) or charge (negative) tokens. May go into debt. Commits."""
+        bucket = cls._locked(db, key, capacity, rate, now)
+        bucket.tokens = min(capacity, bucket.tokens + delta)
+        db.commit()
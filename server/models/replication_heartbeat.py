@@ -0,0 +1,44 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, Integer, select, update
+from sqlalchemy.orm import Session
+
+from .base import Base
+
+HEARTBEAT_ID = 1
+
+
+class ReplicationHeartbeat(Base):
+    """
+    Single row the primary rewrites every few seconds. How old the row is on a
+    replica is how far that replica lags behind.
+    """
+
+    __tablename__ = "replication_heartbeat"
+
+    id = Column(Integer, primary_key=True)
+    beat_at = Column(DateTime(timezone=True), nullable=False)
+
+    @classmethod
+    def beat(cls, db: Session, now: datetime | None = None):
+        """Write the current time on the primary. Commits."""
+        now = now or datetime.now(timezone.utc)
+        updated = db.execute(
+            update(cls).where(cls.id == HEARTBEAT_ID).values(beat_at=now)
+        ).rowcount
+        if not updated:
+            db.add(cls(id=HEARTBEAT_ID, beat_at=now))
+        db.commit()
+
+    @classmethod
+    def lag_seconds(cls, db: Session) -> float | None:
+        """Seconds since the last heartbeat that reached this database, None without one."""
+        beat_at = db.execute(
+            select(cls.beat_at).where(cls.id == HEARTBEAT_ID)
+        ).scalar_one_or_none()
+        if beat_at is None:
+            return None
+        if beat_at.tzinfo is None:
+            # MySQL DATETIME and SQLite drop the offset, heartbeats are written in UTC
+            beat_at = beat_at.replace(tzinfo=timezone.utc)
+        return max((datetime.now(timezone.utc) - beat_at).total_seconds(), 0.0)
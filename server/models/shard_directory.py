@@ -0,0 +1,76 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, insert, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from .base import Base
+
+
+class UserShard(Base):
+    """Shard holding the conversations of a user. Lives in the directory database."""
+
+    __tablename__ = "user_shards"
+
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    shard = Column(String(64), nullable=False, index=True)
+    assigned_at = Column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+    @classmethod
+    def get_shard(cls, db: Session, user_id: int) -> str | None:
+        return db.execute(
+            select(cls.shard).where(cls.user_id == user_id)
+        ).scalar_one_or_none()
+
+    @classmethod
+    def assign(cls, db: Session, user_id: int, shard: str):
+        """Record the shard of a user. Commits."""
+        assignment = db.get(cls, user_id)
+        if assignment is None:
+            db.add(cls(user_id=user_id, shard=shard))
+        else:
+            assignment.shard = shard
+        db.commit()
+
+
+class ConversationDirectory(Base):
+    """
+    Allocates conversation ids for sharded storage. Ids stay unique across
+    shards, so a conversation keeps its id when its user is moved.
+    """
+
+    __tablename__ = "conversation_directory"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    @classmethod
+    def allocate(cls, db: Session, user_id: int) -> int:
+        """Reserve a new conversation id for a user. Commits."""
+        result = db.execute(insert(cls).values(user_id=user_id))
+        conversation_id = result.inserted_primary_key[0]
+        db.commit()
+        return conversation_id
+
+    @classmethod
+    def register_existing(cls, db: Session) -> int:
+        """
+        Register the conversations of the directory database created while
+        unsharded, so allocated ids continue after them. Commits. Returns
+        how many were registered.
+        """
+        from .conversation import Conversation
+
+        unregistered = select(
+            Conversation.id, Conversation.user_id, Conversation.created_at
+        ).where(~select(cls.id).where(cls.id == Conversation.id).exists())
+        result = db.execute(
+            insert(cls).from_select(["id", "user_id", "created_at"], unregistered)
+        )
+        db.commit()
+        return result.rowcount
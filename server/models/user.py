@@ -1,4 +1,5 @@
-from sqlalchemy import Column, DateTime, Integer, String
+from sqlalchemy import Column, DateTime, Integer, String, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
 
@@ -26,3 +27,15 @@ class User(Base):
         """Check if an email already exists in the database."""
         user = db.query(cls).filter(cls.email == email).first()
         return user is not None
+
+    @classmethod
+    async def is_username_exists_async(cls, username: str, db: AsyncSession) -> bool:
+        """Check if a username already exists in the database."""
+        result = await db.execute(select(cls.id).where(cls.username == username))
+        return result.first() is not None
+
+    @classmethod
+    async def is_email_exists_async(cls, email: str, db: AsyncSession) -> bool:
+        """Check if an email already exists in the database."""
+        result = await db.execute(select(cls.id).where(cls.email == email))
+        return result.first() is not None
@@ -4,6 +4,7 @@ This package contains all API routes
 
 from .chat_model import router as chat_model_router
 from .conversation import router as conversation_router
+from .metrics import router as metrics_router
 from .user import router as user_router
 
-__all__ = ["user_router", "chat_model_router", "conversation_router"]
+__all__ = ["user_router", "chat_model_router", "conversation_router", "metrics_router"]
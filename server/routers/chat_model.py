@@ -1,62 +1,269 @@
+import asyncio
 import logging
+import math
+import time
 
 import chat_model_loader
 import services
 from config import settings
-from database import get_mysql_db
-from fastapi import APIRouter, Depends, HTTPException, status
-from schemas import ChatRequest, ChatResponse
-from sqlalchemy.orm import Session
+from database import get_async_user_shard_db
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from pydantic import ValidationError
+from schemas import ChatRequest, ChatResponse, ChatSocketTurn
+from services.idempotency import (
+    IdempotencyKeyInUse,
+    IdempotencyKeyReused,
+    fingerprint,
+    idempotency_store,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 router = APIRouter(tags=["chat_model"])
 
+# Turns a WebSocket may have waiting behind the one being generated
+CHAT_SOCKET_MAX_PENDING_TURNS = 8
+
 
 @router.post("/chat", response_model=ChatResponse, status_code=status.HTTP_200_OK)
 async def chat_with_model(
-    chat_request: ChatRequest, db: Session = Depends(get_mysql_db)
+    chat_request: ChatRequest,
+    response: Response,
+    idempotency_key: str | None = Header(None, min_length=1, max_length=255),
+    request_timeout: float | None = Header(None, gt=0),
+    db: AsyncSession = Depends(get_async_user_shard_db),
 ):
-    """Get a user input message and reply"""
+    """
+    Get a user input message and reply.
+
+    With an Idempotency-Key header, a retry of the request gets the reply of
+    the first one instead of a new generation, marked by an
+    Idempotent-Replayed header. Replies are kept by the worker that served
+    them, a retry routed to another worker generates again.
 
-    model = chat_model_loader.model
-    tokenizer = chat_model_loader.tokenizer
+    With a Request-Timeout header, the seconds the client waits, a turn that
+    cannot start in time is rejected with 504 and generation stops when the
+    time is up, returning the partial reply marked truncated.
+    """
+    deadline = None
+    if request_timeout is not None:
+        deadline = time.monotonic() + request_timeout
 
-    if model is None or tokenizer is None:
+    if chat_model_loader.model is None or chat_model_loader.tokenizer is None:
         logger.error("Model or tokenizer not loaded.")
         raise HTTPException(
             status_code=500, detail="Model not loaded. Please try again later"
         )
 
+    async def reply() -> ChatResponse:
+        conversation, response_message, truncated = await services.run_chat_turn(
+            chat_request, db, deadline=deadline
+        )
+        return ChatResponse(
+            conversation_id=conversation.id,
+            messages=response_message,
+            truncated=truncated,
+        )
+
     try:
-        conversation = services.get_conversation_from_request(chat_request, db)
-        complete_prompt = services.generate_prompt(
-            conversation, chat_request.messages[0].content
+        if idempotency_key is None:
+            return await reply()
+
+        # TODO: remove the dummy user id here after an auth system is added
+        chat_response, replayed = await idempotency_store.run(
+            settings.DUMMY_USER_ID, idempotency_key, fingerprint(chat_request), reply
         )
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return chat_response
 
-        text = tokenizer.apply_chat_template(
-            complete_prompt,
-            add_generation_prompt=True,
-            tokenize=False,
-            enable_thinking=False,
+    except services.RateLimitExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded, try again later",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
         )
-        inputs = tokenizer([text], return_tensors="pt").to(model.device)
-        text_ids = model.generate(
-            **inputs, max_new_tokens=settings.chat_model["MAX_NEW_TOKENS"]
+    except services.Overloaded as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server overloaded, try again later",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
         )
-
-        output_ids = text_ids[0][len(inputs.input_ids[0]) :].tolist()
-        response_message = tokenizer.decode(output_ids, skip_special_tokens=True).strip(
-            "\n"
+    except services.DeadlineExceeded:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="No reply could be generated within Request-Timeout",
         )
-
-        services.store_request_and_response_messages(
-            db, conversation.id, chat_request.messages[0].content, response_message
+    except IdempotencyKeyReused:
+        raise HTTPException(
+            # the status constant for 422 was renamed in starlette 0.48
+            status_code=422,
+            detail="Idempotency-Key was already used for a different request",
+        )
+    except IdempotencyKeyInUse:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A different request with this Idempotency-Key is in progress",
         )
-
-        return ChatResponse(conversation_id=conversation.id, messages=response_message)
-
     except Exception as e:
         logger.error(f"Error loading model: {e}")
         raise HTTPException(
             status_code=500, detail="Something went wrong, try again later"
         )
+
+
+class ChatSocket:
+    """
+    State of one chat WebSocket: its database session, reused by every turn,
+    and the queue of turns. Turns run one at a time in arrival order, whatever
+    conversation they belong to, since they share the session.
+    """
+
+    def __init__(self, websocket: WebSocket, db: AsyncSession):
+        self.websocket = websocket
+        self.db = db
+        self.turns: asyncio.Queue = asyncio.Queue(maxsize=CHAT_SOCKET_MAX_PENDING_TURNS)
+        self.connected = True
+
+    async def send(self, event: dict):
+        # a turn in progress is still stored after the client is gone
+        if not self.connected:
+            return
+        try:
+            await self.websocket.send_json(event)
+        except (WebSocketDisconnect, RuntimeError):
+            self.connected = False
+
+    async def send_error(self, turn_id: str | None, detail):
+        await self.send({"type": "error", "turn_id": turn_id, "detail": detail})
+
+    async def run_turns(self):
+        while (queued := await self.turns.get()) is not None:
+            await self.run_turn(*queued)
+
+    async def run_turn(self, turn: ChatSocketTurn, deadline: float | None = None):
+        async def on_text(text: str):
+            await self.send({"type": "token", "turn_id": turn.turn_id, "text": text})
+
+        try:
+            conversation, reply, truncated = await services.run_chat_turn(
+                turn, self.db, on_text, deadline
+            )
+        except services.ModelNotLoaded:
+            await self.send_error(
+                turn.turn_id, "Model not loaded. Please try again later"
+            )
+            return
+        except services.RateLimitExceeded as e:
+            await self.send(
+                {
+                    "type": "error",
+                    "turn_id": turn.turn_id,
+                    "detail": "Rate limit exceeded, try again later",
+                    "retry_after": math.ceil(e.retry_after),
+                }
+            )
+            return
+        except services.Overloaded as e:
+            await self.send(
+                {
+                    "type": "error",
+                    "turn_id": turn.turn_id,
+                    "detail": "Server overloaded, try again later",
+                    "retry_after": math.ceil(e.retry_after),
+                }
+            )
+            return
+        except services.DeadlineExceeded:
+            await self.send_error(
+                turn.turn_id, "No reply could be generated within the timeout"
+            )
+            return
+        except Exception as e:
+            logger.error(f"Error in chat socket turn: {e}")
+            await self.db.rollback()
+            await self.send_error(turn.turn_id, "Something went wrong, try again later")
+            return
+
+        metrics.counter("chat_socket.turns").inc()
+        await self.send(
+            {
+                "type": "done",
+                "turn_id": turn.turn_id,
+                "conversation_id": conversation.id,
+                "messages": reply,
+                "truncated": truncated,
+            }
+        )
+
+    async def receive(self):
+        """Read client events until the socket closes"""
+        while True:
+            event = await self.websocket.receive_json()
+            event_type = event.get("type") if isinstance(event, dict) else None
+            if event_type == "ping":
+                await self.send({"type": "pong"})
+            elif event_type == "turn":
+                try:
+                    turn = ChatSocketTurn.model_validate(event)
+                except ValidationError as e:
+                    await self.send_error(
+                        event.get("turn_id"),
+                        e.errors(include_url=False, include_context=False),
+                    )
+                    continue
+                # the timeout runs from when the turn is received
+                deadline = None
+                if turn.timeout is not None:
+                    deadline = time.monotonic() + turn.timeout
+                try:
+                    self.turns.put_nowait((turn, deadline))
+                except asyncio.QueueFull:
+                    await self.send_error(turn.turn_id, "Too many turns in progress")
+            else:
+                await self.send_error(None, f"Unknown event type: {event_type}")
+
+
+@router.websocket("/ws/chat")
+async def chat_socket(
+    websocket: WebSocket, db: AsyncSession = Depends(get_async_user_shard_db)
+):
+    """
+    Chat over one persistent connection, for any of the user's conversations.
+
+    Client events: {"type": "turn", "turn_id", "conversation_id", "prompt",
+    "messages", "timeout"} with the fields of POST /chat and the seconds of
+    its Request-Timeout header, and {"type": "ping"}. Server events, tagged
+    with the turn_id: "token" with generated text as it comes, then "done"
+    with the conversation_id, the full reply and whether it was truncated at
+    the timeout, or "error" (with "retry_after" seconds when rate limited or
+    overloaded).
+    """
+    await websocket.accept()
+    socket = ChatSocket(websocket, db)
+    worker = asyncio.create_task(socket.run_turns())
+    metrics.counter("chat_socket.connections").inc()
+
+    try:
+        await socket.receive()
+    except WebSocketDisconnect:
+        pass
+    except ValueError:
+        await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+    finally:
+        socket.connected = False
+        # queued turns are dropped, the one being generated is still stored
+        while not socket.turns.empty():
+            socket.turns.get_nowait()
+        socket.turns.put_nowait(None)
+        await worker
@@ -1,68 +1,280 @@
+import asyncio
+import logging
+from typing import Iterator
+
 from config import settings
-from database import get_mysql_db
-from fastapi import APIRouter, Depends, HTTPException
-from models import Conversation
-from schemas.conversation import GetConversationResponse, MessageInConversationResponse
+from database import get_read_db, get_user_shard_db, shard_map, streaming_session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from models import Conversation, Message
+from schemas.conversation import (
+    ConversationImportResponse,
+    ConversationSyncResponse,
+    GetConversationResponse,
+    MessageSearchResponse,
+)
+from services import conversation_export, conversation_sync
+from services.conversation_export import (
+    IMPORT_BATCH_SIZE,
+    ConversationImporter,
+    InvalidImportRecord,
+    TransferReport,
+)
 from sqlalchemy.orm import Session
+from utils.conditional import not_modified, validator_headers
+from utils.json_encoding import FastJSONResponse, dumps
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["conversation"])
 
+# Listing pieces are flushed to the client once this many bytes are pending
+LISTING_STREAM_CHUNK_BYTES = 64 * 1024
+
 
 @router.get(
     "/conv-with-msg/{conversation_id}",
     response_model=GetConversationResponse,
 )
-def get_conversation(conversation_id: int, db: Session = Depends(get_mysql_db)):
-    conversation = Conversation.get_by_id(db, conversation_id, with_messages=True)
+def get_conversation(
+    conversation_id: int, request: Request, db: Session = Depends(get_read_db)
+):
+    validator = Conversation.get_validator(db, conversation_id)
+    if validator is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    # an unchanged poll stops here, before any message is loaded
+    response = not_modified(request, validator, "conversation")
+    if response is not None:
+        return response
+
+    conversation = Conversation.get_detail_by_id(db, conversation_id)
 
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
+    if validator.archived:
+        # reading restored the messages, which changes the validator
+        validator = Conversation.get_validator(
+            db.info.get("primary", db), conversation_id
+        )
 
-    message_responses = []
-    if conversation.messages:
-        for message in conversation.messages:
-            message_responses.append(
-                MessageInConversationResponse(
-                    id=message.id,
-                    sender=message.sent_by.value,
-                    content=message.content,
-                    created_at=message.created_at.isoformat(),
-                )
-            )
-
-    return GetConversationResponse(
-        conversation_id=conversation.id,
-        title=conversation.title,
-        prompt=conversation.prompt,
-        created_at=conversation.created_at.isoformat(),
-        messages=message_responses,
-    )
+    # Built from rows in the shape of GetConversationResponse, so it is encoded
+    # as is instead of being validated into models and serialized again
+    return FastJSONResponse(content=conversation, headers=validator_headers(validator))
+
+
+def _stream_listing(request_db: Session, user_id: int) -> Iterator[bytes]:
+    """The listing as a JSON array, encoded one conversation and message at a time"""
+    with streaming_session(request_db) as db:
+        yield from _encode_listing(db, user_id)
+
+
+def _encode_listing(db: Session, user_id: int) -> Iterator[bytes]:
+    pieces = [b"["]
+    size = 1
+    for index, (conversation, messages) in enumerate(
+        Conversation.iter_listing_by_user_id(db, user_id)
+    ):
+        # the conversation object is left open for its messages array
+        head = (b"," if index else b"") + dumps(conversation)[:-1] + b',"messages":['
+        pieces.append(head)
+        size += len(head)
+        for position, message in enumerate(messages):
+            piece = (b"," if position else b"") + dumps(message)
+            pieces.append(piece)
+            size += len(piece)
+            if size >= LISTING_STREAM_CHUNK_BYTES:
+                yield b"".join(pieces)
+                pieces, size = [], 0
+        pieces.append(b"]}")
+        size += 2
+    pieces.append(b"]")
+    yield b"".join(pieces)
 
 
 @router.get("/user-conv-with-msg/{user_id}")
-def get_user_conversations(user_id: int, db: Session = Depends(get_mysql_db)):
+def get_user_conversations(
+    user_id: int, request: Request, db: Session = Depends(get_read_db)
+):
+    # TODO: remove the dummy user id here after an auth system is added
+    user_id = settings.DUMMY_USER_ID
+    validator = Conversation.get_listing_validator(db, user_id)
+    response = not_modified(request, validator, "conversation_listing")
+    if response is not None:
+        return response
+
+    # The listing is already JSON-ready: skip FastAPI's jsonable_encoder pass
+    # and stream it, so memory does not grow with the size of the history
+    # taken before the listing is read, a sync from it may repeat a change but
+    # never misses one
+    headers = validator_headers(validator)
+    headers["X-Sync-Token"] = conversation_sync.current_token(db, user_id).encode()
+    return StreamingResponse(
+        _stream_listing(db, user_id), media_type="application/json", headers=headers
+    )
+
+
+@router.get("/sync", response_model=ConversationSyncResponse)
+def sync_conversations(
+    token: str | None = Query(None, description="sync_token of the previous sync"),
+    limit: int = Query(conversation_sync.SYNC_MESSAGE_LIMIT, ge=1, le=5000),
+    db: Session = Depends(get_read_db),
+):
+    """Conversations and messages created since a sync token, with the next token"""
+    # TODO: remove the dummy user id here after an auth system is added
+    user_id = settings.DUMMY_USER_ID
+    try:
+        since = conversation_sync.SyncToken.decode(token) if token else None
+        changes = conversation_sync.sync(db, user_id, since, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except conversation_sync.SyncTokenExpired as e:
+        raise HTTPException(status_code=410, detail=f"Sync token expired: {e}")
+
+    return FastJSONResponse(content=changes)
+
+
+@router.get("/search", response_model=MessageSearchResponse)
+def search_messages(
+    q: str = Query(..., min_length=1, max_length=200),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_read_db),
+):
+    """Full-text search over the messages of the current user's conversations"""
+    # TODO: remove the dummy user id here after an auth system is added
+    user_id = settings.DUMMY_USER_ID
+
+    # fetch one extra row to know whether there is a next page without a COUNT
+    results = Message.search(
+        db, user_id, q, limit=page_size + 1, offset=(page - 1) * page_size
+    )
+
+    return MessageSearchResponse(
+        query=q,
+        page=page,
+        page_size=page_size,
+        has_more=len(results) > page_size,
+        results=results[:page_size],
+    )
+
+
+@router.get("/export")
+def export_conversations(
+    format: str = Query("ndjson", pattern="^(ndjson|arrow)$"),
+    table: str = Query("messages", pattern="^(conversations|messages)$"),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Stream every conversation of the current user, as NDJSON (conversations
+    and messages) or as an Arrow IPC stream of one table
+    """
     # TODO: remove the dummy user id here after an auth system is added
     user_id = settings.DUMMY_USER_ID
-    conversations = Conversation.get_by_user_id(db, user_id, with_messages=True)
-
-    if not conversations:
-        return []
-
-    return [
-        GetConversationResponse(
-            conversation_id=conv.id,
-            title=conv.title,
-            prompt=conv.prompt,
-            created_at=conv.created_at.isoformat(),
-            messages=[
-                MessageInConversationResponse(
-                    id=msg.id,
-                    sender=msg.sent_by.value,
-                    content=msg.content,
-                    created_at=msg.created_at.isoformat(),
-                )
-                for msg in conv.messages
-            ],
+    report = TransferReport()
+
+    if format == "arrow":
+        if conversation_export.pa is None:
+            raise HTTPException(status_code=501, detail="Arrow export is not available")
+        media_type = "application/vnd.apache.arrow.stream"
+    else:
+        media_type = "application/x-ndjson"
+
+    return StreamingResponse(
+        _stream_export(db, format, table, user_id, report), media_type=media_type
+    )
+
+
+def _stream_export(
+    request_db: Session, format: str, table: str, user_id: int, report: TransferReport
+) -> Iterator[bytes]:
+    with streaming_session(request_db) as db:
+        if format == "arrow":
+            chunks = conversation_export.export_arrow_stream(db, table, user_id, report)
+        else:
+            chunks = conversation_export.export_ndjson(db, user_id, report)
+        yield from conversation_export.finish_after(chunks, report, "export")
+
+
+async def _iter_body_lines(request: Request):
+    pending = b""
+    async for data in request.stream():
+        lines = (pending + data).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+def _import_failed(
+    db: Session, status_code: int, error: str, line: int | None, imported: dict
+) -> HTTPException:
+    """
+    Roll back the failed batch. The batches before it are committed, the
+    error says how much was imported and on which line of the body it failed.
+    """
+    db.rollback()
+    return HTTPException(
+        status_code=status_code,
+        detail={"error": error, "line": line, "imported": imported},
+    )
+
+
+@router.post("/import", response_model=ConversationImportResponse)
+async def import_conversations(
+    request: Request, db: Session = Depends(get_user_shard_db)
+):
+    """Import an NDJSON export, streamed from the request body, for the current user"""
+    # TODO: remove the dummy user id here after an auth system is added
+    user_id = settings.DUMMY_USER_ID
+    importer = ConversationImporter(
+        db, user_id, allocate_id=shard_map.allocate_conversation_id
+    )
+
+    # records waiting for a batch, and the body line of each
+    batch, lines = [], []
+    line_number = 0
+    # records committed by the batches before, reported when one fails
+    imported = {"conversations": 0, "messages": 0}
+
+    async def import_batch():
+        # database work runs in a worker thread, off the event loop
+        await asyncio.to_thread(importer.import_batch, batch)
+        imported.update(
+            conversations=importer.report.conversations,
+            messages=importer.report.messages,
+        )
+        batch.clear()
+        lines.clear()
+
+    try:
+        async for line in _iter_body_lines(request):
+            line_number += 1
+            for record in conversation_export.iter_ndjson_records([line]):
+                batch.append(record)
+                lines.append(line_number)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await import_batch()
+        if batch:
+            await import_batch()
+    except InvalidImportRecord as e:
+        raise _import_failed(
+            db, 400, f"Invalid import record: {e}", lines[e.index], imported
         )
-        for conv in conversations
-    ]
+    except ValueError as e:
+        # the line is not JSON
+        raise _import_failed(
+            db, 400, f"Invalid import record: {e}", line_number, imported
+        )
+    except Exception:
+        logger.exception("Conversation import failed")
+        raise _import_failed(db, 500, "Import failed", None, imported)
+
+    report = importer.report.finish("import")
+    return ConversationImportResponse(
+        conversations=report.conversations,
+        messages=report.messages,
+        skipped=report.skipped,
+        seconds=report.seconds,
+        rows_per_second=report.rows_per_second,
+    )
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from utils.metrics import metrics
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics")
+def get_metrics():
+    """Snapshot of the in-process metrics"""
+    return metrics.snapshot()
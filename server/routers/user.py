@@ -1,17 +1,17 @@
 import logging
 
-from database import get_mysql_db
+from database import get_async_mysql_db
 from fastapi import APIRouter, Depends, HTTPException, status
 from models import User
 from schemas import UserCreate, UserResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 logger = logging.getLogger(__name__)
 router = APIRouter(tags=["user"])
 
 
 @router.post("/users", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def create_user(user: UserCreate, db: Session = Depends(get_mysql_db)):
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_mysql_db)):
     """
     Create a new user account.
     """
@@ -20,9 +20,9 @@ async def create_user(user: UserCreate, db: Session = Depends(get_mysql_db)):
         user.email = user.email.lower()
         user.username = user.username.lower()
 
-        if User.is_username_exists(user.username, db) or User.is_email_exists(
-            user.email, db
-        ):
+        if await User.is_username_exists_async(
+            user.username, db
+        ) or await User.is_email_exists_async(user.email, db):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Username or email already exists",
@@ -35,8 +35,8 @@ async def create_user(user: UserCreate, db: Session = Depends(get_mysql_db)):
             username=user.username, email=user.email, password_hash=password_hash
         )
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
 
         logger.info(
             f"User created successfully: {new_user.username} (ID: {new_user.id})"
@@ -53,7 +53,7 @@ async def create_user(user: UserCreate, db: Session = Depends(get_mysql_db)):
         raise
     except Exception as e:
         # Handle unexpected errors
-        db.rollback()
+        await db.rollback()
         logger.error(f"Unexpected error creating user: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
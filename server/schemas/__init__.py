@@ -2,7 +2,13 @@
 This package contains all Pydantic models (schemas) used in the API.
 """
 
-from .chat_model import ChatRequest, ChatResponse
+from .chat_model import ChatRequest, ChatResponse, ChatSocketTurn
 from .user import UserCreate, UserResponse
 
-__all__ = ["UserCreate", "UserResponse", "ChatRequest", "ChatResponse"]
+__all__ = [
+    "UserCreate",
+    "UserResponse",
+    "ChatRequest",
+    "ChatResponse",
+    "ChatSocketTurn",
+]
@@ -28,6 +28,25 @@ class ChatRequest(BaseModel):
     )
 
 
+class ChatSocketTurn(ChatRequest):
+    """A turn sent over the chat WebSocket, {"type": "turn", ...}"""
+
+    conversation_id: int | None = Field(
+        None, description="ID of the conversation, null to start a new one"
+    )
+    turn_id: str = Field(
+        ..., description="Client id of the turn, echoed in its events", max_length=64
+    )
+    timeout: float | None = Field(
+        None,
+        description="Seconds the client waits for the reply from sending the turn",
+        gt=0,
+    )
+
+
 class ChatResponse(BaseModel):
     conversation_id: int = Field(..., description="ID of the conversation")
     messages: str = Field(..., description="Resulted text of processing", min_length=1)
+    truncated: bool = Field(
+        False, description="Whether the reply was cut short at the client's deadline"
+    )
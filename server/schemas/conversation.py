@@ -16,3 +16,61 @@ class GetConversationResponse(BaseModel):
     messages: list[MessageInConversationResponse] = Field(
         None, description="The messages in the conversation"
     )
+
+
+class MessageSearchResult(BaseModel):
+    message_id: int = Field(..., description="The ID of the matching message")
+    conversation_id: int = Field(..., description="The conversation of the message")
+    conversation_title: str = Field(..., description="The title of the conversation")
+    sender: str = Field(..., description="The sender of the message")
+    content: str = Field(..., description="The content of the message")
+    created_at: str = Field(..., description="The timestamp of the message")
+    score: float = Field(..., description="Relevance of the match, higher is better")
+
+
+class MessageSearchResponse(BaseModel):
+    query: str = Field(..., description="The search query")
+    page: int = Field(..., description="The page number, starting at 1")
+    page_size: int = Field(..., description="The maximum number of results per page")
+    has_more: bool = Field(..., description="Whether a next page exists")
+    results: list[MessageSearchResult] = Field(
+        ..., description="Matching messages, most relevant first"
+    )
+
+
+class ConversationImportResponse(BaseModel):
+    conversations: int = Field(..., description="Number of conversations imported")
+    messages: int = Field(..., description="Number of messages imported")
+    skipped: int = Field(
+        ..., description="Messages skipped because their conversation was not imported"
+    )
+    seconds: float = Field(..., description="Duration of the import")
+    rows_per_second: float = Field(..., description="Import throughput")
+
+
+class SyncConversation(BaseModel):
+    conversation_id: int = Field(..., description="The ID of the conversation")
+    title: str = Field(..., description="The title of the conversation")
+    prompt: str | None = Field(None, description="The prompt of the conversation")
+    created_at: str = Field(..., description="The timestamp of the conversation")
+
+
+class SyncMessage(BaseModel):
+    id: int = Field(..., description="The ID of the message")
+    conversation_id: int = Field(..., description="The conversation of the message")
+    sender: str = Field(..., description="The sender of the message")
+    content: str = Field(..., description="The content of the message")
+    created_at: str = Field(..., description="The timestamp of the message")
+
+
+class ConversationSyncResponse(BaseModel):
+    conversations: list[SyncConversation] = Field(
+        ..., description="Conversations created after the sync token"
+    )
+    messages: list[SyncMessage] = Field(
+        ..., description="Messages created after the sync token, in id order"
+    )
+    sync_token: str = Field(..., description="Token to pass to the next sync")
+    has_more: bool = Field(
+        ..., description="Whether more changes are waiting, to be fetched right away"
+    )
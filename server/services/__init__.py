@@ -1,3 +1,18 @@
+from .admission_controller import DeadlineExceeded, Overloaded
 from .chat_model_services import *
+from .rate_limiter import RateLimitExceeded
 
-__all__ = ["get_conversation_from_request", "generate_prompt"]
+__all__ = [
+    "get_conversation_from_request",
+    "get_conversation_from_request_async",
+    "store_request_and_response_messages",
+    "store_request_and_response_messages_async",
+    "generate_prompt",
+    "generate_reply",
+    "run_chat_turn",
+    "ModelNotLoaded",
+    "GenerationUsage",
+    "RateLimitExceeded",
+    "Overloaded",
+    "DeadlineExceeded",
+]
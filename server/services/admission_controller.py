@@ -0,0 +1,133 @@
+"""
+Admission control of chat turns under load.
+
+Without it, turns pile up behind the generation scheduler until clients
+time out, and the generation spent on them is wasted. Before a turn starts,
+its wait for a model slot is estimated from the scheduler's queue and the
+measured generation speed:
+
+    job seconds = generated tokens per reply / generated tokens per second
+    wait = (remaining seconds of running jobs + queued jobs * job seconds)
+           / concurrency
+
+both rates being moving averages over completed generations. When the
+estimate is above ADMISSION_WAIT_SLO_SECONDS the turn is admitted with a
+reduced max_new_tokens, so the queue drains faster; above
+ADMISSION_REJECT_FACTOR times the SLO it is rejected at once. The estimate
+is exported as admission.estimated_wait_seconds for autoscaling.
+
+A turn with a client deadline is rejected whenever its wait alone would
+outlast the deadline, SLO or not: nobody would read the reply.
+
+Admission is decided in generate_reply after the generation and semantic
+cache lookups, so a turn answered from a cache is never shed.
+"""
+
+import time
+
+from config import settings
+from utils.metrics import metrics
+
+from .generation_scheduler import GenerationScheduler, generation_scheduler
+
+# Weight of the latest generation in the moving averages
+SMOOTHING = 0.2
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Overloaded, estimated wait {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """The client's deadline passed, or will, before a reply is generated"""
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        scheduler: GenerationScheduler,
+        wait_slo_seconds: float,
+        reject_factor: float = 2.0,
+        degraded_max_new_tokens: int = 0,
+    ):
+        self.scheduler = scheduler
+        self.wait_slo_seconds = wait_slo_seconds
+        self.reject_factor = reject_factor
+        self.degraded_max_new_tokens = degraded_max_new_tokens
+        self.tokens_per_second: float | None = None
+        self.tokens_per_reply: float | None = None
+
+        metrics.gauge("admission.estimated_wait_seconds", self.estimated_wait)
+        metrics.gauge(
+            "admission.tokens_per_second", lambda: self.tokens_per_second or 0.0
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.wait_slo_seconds > 0
+
+    def observe(self, generated_tokens: int, seconds: float):
+        """Record a completed generation"""
+        if generated_tokens <= 0 or seconds <= 0:
+            return
+        rate = generated_tokens / seconds
+        if self.tokens_per_second is None:
+            self.tokens_per_second = rate
+            self.tokens_per_reply = float(generated_tokens)
+            return
+        self.tokens_per_second += SMOOTHING * (rate - self.tokens_per_second)
+        self.tokens_per_reply += SMOOTHING * (generated_tokens - self.tokens_per_reply)
+
+    def estimated_wait(self) -> float:
+        """Seconds a turn arriving now would wait for a model slot"""
+        scheduler = self.scheduler
+        queued = len(scheduler.policy)
+        if self.tokens_per_second is None or (
+            scheduler.running < scheduler.concurrency and not queued
+        ):
+            return 0.0
+
+        job_seconds = self.tokens_per_reply / self.tokens_per_second
+        now = time.perf_counter()
+        remaining = sum(
+            max(job_seconds - (now - job.started_at), 0.0)
+            for job in scheduler.running_jobs.values()
+        )
+        return (remaining + queued * job_seconds) / scheduler.concurrency
+
+    def admit(self, max_new_tokens: int, deadline: float | None = None) -> int:
+        """
+        The max_new_tokens to generate a turn with, reduced when the wait is
+        above the SLO. Raises Overloaded when the turn should not start, and
+        DeadlineExceeded when it would not start before `deadline`
+        (time.monotonic()).
+        """
+        if deadline is not None and self.estimated_wait() >= (
+            deadline - time.monotonic()
+        ):
+            metrics.counter("admission.deadline_rejected").inc()
+            raise DeadlineExceeded()
+        if not self.enabled:
+            return max_new_tokens
+
+        wait = self.estimated_wait()
+        if wait > self.wait_slo_seconds * self.reject_factor:
+            metrics.counter("admission.rejected").inc()
+            raise Overloaded(wait)
+        if wait > self.wait_slo_seconds:
+            metrics.counter("admission.degraded").inc()
+            return min(
+                max_new_tokens, self.degraded_max_new_tokens or max_new_tokens // 2
+            )
+        metrics.counter("admission.admitted").inc()
+        return max_new_tokens
+
+
+admission_controller = AdmissionController(
+    generation_scheduler,
+    settings.ADMISSION_WAIT_SLO_SECONDS,
+    settings.ADMISSION_REJECT_FACTOR,
+    settings.ADMISSION_DEGRADED_MAX_NEW_TOKENS,
+)
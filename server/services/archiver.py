@@ -0,0 +1,109 @@
+"""
+Background archiver for cold conversations.
+
+Conversations without activity for ARCHIVE_AFTER_DAYS are moved out of the hot
+messages table into one compressed blob each (see ConversationArchive).
+Conversation.get_by_id moves them back on access.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from config import settings
+from models import Conversation, ConversationArchive, Message
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ArchiveReport:
+    conversations: int = 0
+    messages: int = 0
+    raw_bytes: int = 0
+    compressed_bytes: int = 0
+
+    @property
+    def space_saving(self) -> float:
+        """Fraction of the serialized size saved by compression"""
+        if not self.raw_bytes:
+            return 0.0
+        return 1 - self.compressed_bytes / self.raw_bytes
+
+
+def find_cold_conversations(db: Session, cutoff: datetime, limit: int) -> list[int]:
+    """Ids of hot conversations whose last message and last update are before cutoff"""
+    last_message = (
+        select(Message.conversation_id, func.max(Message.created_at).label("last_at"))
+        .group_by(Message.conversation_id)
+        .subquery()
+    )
+    query = (
+        select(Conversation.id)
+        .outerjoin(last_message, last_message.c.conversation_id == Conversation.id)
+        .where(
+            Conversation.archived.is_(False),
+            Conversation.created_at < cutoff,
+            or_(Conversation.updated_at.is_(None), Conversation.updated_at < cutoff),
+            or_(last_message.c.last_at.is_(None), last_message.c.last_at < cutoff),
+        )
+        .order_by(Conversation.id)
+        .limit(limit)
+    )
+    return list(db.execute(query).scalars())
+
+
+def archive_cold_conversations(
+    db: Session, older_than_days: int, batch_size: int
+) -> ArchiveReport:
+    """Archive up to batch_size cold conversations, one transaction each"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    report = ArchiveReport()
+
+    for conversation_id in find_cold_conversations(db, cutoff, batch_size):
+        conversation = db.get(Conversation, conversation_id)
+        try:
+            archive = ConversationArchive.archive(db, conversation)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error archiving conversation {conversation_id}: {e}")
+            continue
+        if archive is None:
+            # a turn came in while it was being archived
+            continue
+
+        report.conversations += 1
+        report.messages += archive.message_count
+        report.raw_bytes += archive.raw_bytes
+        report.compressed_bytes += archive.compressed_bytes
+
+    return report
+
+
+async def run_archiver(session_factory, interval_seconds: float):
+    """Archive cold conversations every interval_seconds, until cancelled"""
+    while True:
+        db = session_factory()
+        try:
+            report = await asyncio.to_thread(
+                archive_cold_conversations,
+                db,
+                settings.ARCHIVE_AFTER_DAYS,
+                settings.ARCHIVE_BATCH_SIZE,
+            )
+            if report.conversations:
+                logger.info(
+                    f"Archived {report.conversations} conversations "
+                    f"({report.messages} messages), {report.raw_bytes} -> "
+                    f"{report.compressed_bytes} bytes "
+                    f"({report.space_saving:.0%} saved)"
+                )
+        except Exception as e:
+            logger.error(f"Error running the conversation archiver: {e}")
+        finally:
+            db.close()
+
+        await asyncio.sleep(interval_seconds)
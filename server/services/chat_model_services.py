@@ -1,11 +1,52 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
 from time import sleep
+from typing import Awaitable, Callable
 
+import chat_model_loader
 from config import settings
-from models import Conversation, Message
+from database import replica_set, shard_map
+from models import Conversation
 from models.conversation import SYSTEM_PROMPT_TYPE
 from models.message import SenderType
 from schemas import ChatRequest
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload
+from utils.metrics import metrics
+
+from .admission_controller import DeadlineExceeded, admission_controller
+from .conversation_cache import CachedConversation, conversation_cache
+from .generation_cache import cache_key, generation_cache, is_cacheable
+from .generation_scheduler import generation_scheduler
+from .message_writer import message_writer
+from .rate_limiter import estimate_tokens, rate_limiter
+from .semantic_cache import namespace, semantic_cache
+from .turn_coordinator import turn_coordinator
+
+logger = logging.getLogger(__name__)
+
+
+class ModelNotLoaded(Exception):
+    """The chat model or its tokenizer is not loaded yet"""
+
+
+@dataclass
+class GenerationUsage:
+    """
+    Tokens the model processed for a reply, none when it came from a cache,
+    and whether the reply was cut short at the client's deadline
+    """
+
+    prompt_tokens: int = 0
+    generated_tokens: int = 0
+    truncated: bool = False
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.generated_tokens
 
 
 def get_conversation_from_request(
@@ -21,18 +62,82 @@ def get_conversation_from_request(
     if conversation_id is not None:
         conversation = Conversation.get_by_id(db, conversation_id, with_messages=True)
     else:
-        conversation = Conversation.create_conversation(db, user_id, title, prompt)
+        conversation = Conversation.create_conversation(
+            db,
+            user_id,
+            title,
+            prompt,
+            conversation_id=shard_map.allocate_conversation_id(user_id),
+        )
 
     return conversation
 
 
+async def get_conversation_from_request_async(
+    chat_request: ChatRequest, db: AsyncSession
+) -> CachedConversation:
+    """
+    Async variant of get_conversation_from_request for the event loop.
+    Histories are read through the conversation cache.
+    """
+    conversation_id = chat_request.conversation_id
+    # TODO: remove the dummy user id here after an auth system is added
+    user_id = settings.DUMMY_USER_ID
+    messages = chat_request.messages
+    title = messages[-1].content if messages else "New Conversation"
+    prompt = chat_request.prompt if chat_request.prompt else ""
+
+    async def load_from_transcript():
+        conversation, entries = await Conversation.get_with_transcript_async(
+            db, conversation_id
+        )
+        if conversation is None:
+            return None
+        return CachedConversation.from_transcript(conversation, entries)
+
+    if conversation_id is not None:
+        return await conversation_cache.get_or_load(
+            conversation_id, load_from_transcript
+        )
+
+    conversation = await Conversation.create_conversation_async(
+        db,
+        user_id,
+        title,
+        prompt,
+        conversation_id=await shard_map.allocate_conversation_id_async(user_id),
+    )
+    return conversation_cache.put(conversation)
+
+
 def store_request_and_response_messages(
     db: Session, conversation_id: int, user_message: str, assistant_message: str
 ):
     """Store user and assistant messages in the database in one transaction."""
 
-    Message.create_message(db, conversation_id, SenderType.USER, user_message)
-    Message.create_message(db, conversation_id, SenderType.ASSISTANT, assistant_message)
+    Conversation.append_turn(db, conversation_id, user_message, assistant_message)
+    # Core inserts fire no ORM event, and no cached snapshot was extended
+    conversation_cache.invalidate(conversation_id)
+
+
+async def store_request_and_response_messages_async(
+    db: AsyncSession,
+    conversation_id: int,
+    user_message: str,
+    assistant_message: str,
+    assistant_token_ids: list[int] | None = None,
+    user_created_at: datetime | None = None,
+):
+    """Async variant of store_request_and_response_messages."""
+
+    await Conversation.append_turn_async(
+        db,
+        conversation_id,
+        user_message,
+        assistant_message,
+        assistant_token_ids,
+        user_created_at,
+    )
 
 
 def generate_prompt(conversation: Conversation, new_message: str) -> list[dict]:
@@ -52,3 +157,293 @@ def _generate_conversation_history(conversation: Conversation) -> list[dict]:
         history.append({"role": role, "content": message.content})
 
     return history
+
+
+def _estimate_prompt_tokens(
+    chat_request: ChatRequest, conversation: CachedConversation | None
+) -> int:
+    """
+    Estimated prompt tokens of a turn before its prompt is built: the history,
+    or the system prompt of the conversation to create, and the new message.
+    """
+    if conversation is not None:
+        history = _generate_conversation_history(conversation)
+    else:
+        history = [{"role": SYSTEM_PROMPT_TYPE, "content": chat_request.prompt}]
+    text = "".join(message["content"] or "" for message in history)
+    return estimate_tokens(text + chat_request.messages[0].content)
+
+
+def generation_params(model, max_new_tokens: int | None = None) -> dict:
+    """
+    Decoding parameters of a generate call: the overrides from settings and
+    the model's generation config they apply to.
+    """
+    config = getattr(model, "generation_config", None)
+    params = config.to_dict() if config is not None else {}
+    params["max_new_tokens"] = max_new_tokens or settings.chat_model["MAX_NEW_TOKENS"]
+    if settings.chat_model["DO_SAMPLE"] is not None:
+        params["do_sample"] = settings.chat_model["DO_SAMPLE"]
+    return params
+
+
+def _cut_at_deadline(
+    model, output_ids: list[int], max_new_tokens: int, deadline: float | None
+) -> bool:
+    """
+    Whether generation was stopped by the deadline rather than at the end of
+    the reply or at max_new_tokens.
+    """
+    if deadline is None or time.monotonic() < deadline:
+        return False
+    if len(output_ids) >= max_new_tokens:
+        return False
+    config = getattr(model, "generation_config", None)
+    eos = getattr(config, "eos_token_id", None)
+    eos_ids = eos if isinstance(eos, list) else [eos]
+    return not output_ids or output_ids[-1] not in eos_ids
+
+
+def _generate_streaming(model, streamer, **kwargs):
+    """
+    model.generate into a streamer, ended when generate raises so the reader
+    stops; the error is raised again when the generation is awaited.
+    """
+    try:
+        return model.generate(**kwargs, streamer=streamer)
+    except BaseException:
+        streamer.end()
+        raise
+
+
+async def generate_reply(
+    complete_prompt: list[dict],
+    on_text: Callable[[str], Awaitable] | None = None,
+    user_id: int | None = None,
+    usage: GenerationUsage | None = None,
+    max_new_tokens: int | None = None,
+    deadline: float | None = None,
+) -> tuple[str, list[int]]:
+    """
+    Run the chat model on a prompt. Returns the reply and its token ids, and
+    fills `usage` when given. Generation runs in a worker thread once the
+    scheduler gives it a slot; with on_text, on_text receives the decoded
+    text as it is generated. max_new_tokens overrides the setting.
+
+    With a deadline (time.monotonic()), generation stops when it passes and
+    the partial reply is returned, marked truncated in `usage`. Raises
+    DeadlineExceeded when it passes before anything is generated.
+
+    Greedy generations are served from and stored in the generation cache,
+    first turns from the semantic cache when it is enabled; a cached reply is
+    passed to on_text at once. Only replies to generate go through admission
+    control, which may shorten them or raise Overloaded: a cached reply costs
+    the model nothing and is served under any load.
+    """
+    model = chat_model_loader.model
+    tokenizer = chat_model_loader.tokenizer
+    if model is None or tokenizer is None:
+        raise ModelNotLoaded()
+
+    text = tokenizer.apply_chat_template(
+        complete_prompt,
+        add_generation_prompt=True,
+        tokenize=False,
+        enable_thinking=False,
+    )
+
+    params = generation_params(model, max_new_tokens)
+    key = None
+    if generation_cache.enabled and is_cacheable(params):
+        key = cache_key(chat_model_loader.MODEL_NAME, text, params)
+        cached = await generation_cache.get(key)
+        if cached is not None:
+            if on_text is not None:
+                await on_text(cached.reply)
+            return cached.reply, list(cached.token_ids)
+    elif generation_cache.enabled:
+        metrics.counter("generation_cache.bypassed").inc()
+
+    # a first turn is the system prompt and the user's message
+    semantic_lookup = None
+    if semantic_cache.enabled and len(complete_prompt) == 2:
+        semantic_lookup = await semantic_cache.lookup(
+            namespace(
+                chat_model_loader.MODEL_NAME, complete_prompt[0]["content"], params
+            ),
+            complete_prompt[1]["content"],
+        )
+        if semantic_lookup is not None and semantic_lookup.hit is not None:
+            if on_text is not None:
+                await on_text(semantic_lookup.hit.reply)
+            return semantic_lookup.hit.reply, list(semantic_lookup.hit.token_ids)
+
+    # under load the reply is shortened or rejected before it queues
+    admitted = admission_controller.admit(params["max_new_tokens"], deadline)
+    if admitted != params["max_new_tokens"]:
+        params["max_new_tokens"] = admitted
+        # a shortened reply is only the answer of the shortened generation
+        if key is not None:
+            key = cache_key(chat_model_loader.MODEL_NAME, text, params)
+        semantic_lookup = None
+
+    inputs = tokenizer([text], return_tensors="pt").to(model.device)
+    generate_kwargs = {"max_new_tokens": params["max_new_tokens"]}
+    if settings.chat_model["DO_SAMPLE"] is not None:
+        generate_kwargs["do_sample"] = settings.chat_model["DO_SAMPLE"]
+    predicted_cost = len(inputs.input_ids[0]) + params["max_new_tokens"]
+
+    # TODO: remove the dummy user id here after an auth system is added
+    acquire = generation_scheduler.acquire(
+        user_id if user_id is not None else settings.DUMMY_USER_ID, predicted_cost
+    )
+    try:
+        job = await asyncio.wait_for(
+            acquire, None if deadline is None else deadline - time.monotonic()
+        )
+    except asyncio.TimeoutError:
+        metrics.counter("chat_turns.deadline_exceeded").inc()
+        raise DeadlineExceeded()
+
+    try:
+        if deadline is not None:
+            generate_kwargs["max_time"] = deadline - time.monotonic()
+            if generate_kwargs["max_time"] <= 0:
+                metrics.counter("chat_turns.deadline_exceeded").inc()
+                raise DeadlineExceeded()
+        started_at = time.perf_counter()
+        if on_text is None:
+            text_ids = await asyncio.to_thread(
+                model.generate, **inputs, **generate_kwargs
+            )
+        else:
+            from transformers import TextIteratorStreamer
+
+            streamer = TextIteratorStreamer(
+                tokenizer, skip_prompt=True, skip_special_tokens=True
+            )
+            generation = asyncio.ensure_future(
+                asyncio.to_thread(
+                    _generate_streaming, model, streamer, **inputs, **generate_kwargs
+                )
+            )
+            while (piece := await asyncio.to_thread(next, streamer, None)) is not None:
+                if piece:
+                    await on_text(piece)
+            text_ids = await generation
+        generation_seconds = time.perf_counter() - started_at
+    finally:
+        generation_scheduler.release(job)
+
+    output_ids = text_ids[0][len(inputs.input_ids[0]) :].tolist()
+    reply = tokenizer.decode(output_ids, skip_special_tokens=True).strip("\n")
+    truncated = _cut_at_deadline(model, output_ids, params["max_new_tokens"], deadline)
+    if usage is not None:
+        usage.prompt_tokens = len(inputs.input_ids[0])
+        usage.generated_tokens = len(output_ids)
+        usage.truncated = truncated
+    if truncated:
+        # a partial reply is neither cached nor a measure of reply length
+        metrics.counter("chat_turns.truncated").inc()
+        if not reply:
+            raise DeadlineExceeded()
+        return reply, output_ids
+
+    admission_controller.observe(len(output_ids), generation_seconds)
+    if key is not None:
+        await generation_cache.set(key, reply, output_ids)
+    if semantic_lookup is not None:
+        semantic_cache.add(semantic_lookup, reply, output_ids)
+    return reply, output_ids
+
+
+async def run_chat_turn(
+    chat_request: ChatRequest,
+    db: AsyncSession,
+    on_text: Callable[[str], Awaitable] | None = None,
+    deadline: float | None = None,
+) -> tuple[CachedConversation, str, bool]:
+    """
+    One chat turn: load or create the conversation, generate the reply and
+    store both messages. Shared by POST /chat and the chat WebSocket.
+    Returns the conversation, the reply and whether the reply was truncated
+    at the client's deadline (time.monotonic()); a truncated reply is stored
+    as it is.
+
+    Turns of a conversation queue behind each other, and a duplicate of a
+    turn in flight gets the result of the running one (see turn_coordinator).
+    """
+    # TODO: remove the dummy user id here after an auth system is added
+    key = (
+        settings.DUMMY_USER_ID,
+        chat_request.conversation_id,
+        chat_request.prompt,
+        chat_request.messages[0].content,
+    )
+    return await turn_coordinator.run(
+        key,
+        chat_request.conversation_id,
+        lambda: _run_chat_turn(chat_request, db, on_text, deadline),
+    )
+
+
+async def _run_chat_turn(
+    chat_request: ChatRequest,
+    db: AsyncSession,
+    on_text: Callable[[str], Awaitable] | None,
+    deadline: float | None,
+) -> tuple[CachedConversation, str, bool]:
+    received_at = datetime.now(timezone.utc)
+
+    # read-your-writes: turns still queued for this conversation go in first
+    if settings.MESSAGE_WRITE_BEHIND:
+        await message_writer.wait_for_conversation(chat_request.conversation_id)
+
+    conversation = None
+    if chat_request.conversation_id is not None:
+        conversation = await get_conversation_from_request_async(chat_request, db)
+    user_message = chat_request.messages[0].content
+
+    # the reservation covers the prompt and is settled at the turn's real
+    # cost, the whole of it goes back when the model did not run (admission,
+    # caches); a new conversation is created once the turn is admitted
+    # TODO: remove the dummy user id here after an auth system is added
+    reservation = await rate_limiter.reserve(
+        settings.DUMMY_USER_ID,
+        _estimate_prompt_tokens(chat_request, conversation)
+        + settings.chat_model["MAX_NEW_TOKENS"],
+    )
+    usage = GenerationUsage()
+    try:
+        if chat_request.conversation_id is None:
+            conversation = await get_conversation_from_request_async(chat_request, db)
+        complete_prompt = generate_prompt(conversation, user_message)
+        reply, output_ids = await generate_reply(
+            complete_prompt,
+            on_text,
+            user_id=conversation.user_id,
+            usage=usage,
+            deadline=deadline,
+        )
+    finally:
+        await rate_limiter.settle(reservation, usage.total_tokens)
+
+    token_ids = output_ids if settings.TRANSCRIPT_TOKEN_IDS else None
+    if settings.MESSAGE_WRITE_BEHIND:
+        await message_writer.enqueue(
+            conversation.id,
+            user_message,
+            reply,
+            received_at,
+            token_ids,
+            shard=db.info.get("shard"),
+        )
+    else:
+        await store_request_and_response_messages_async(
+            db, conversation.id, user_message, reply, token_ids, received_at
+        )
+    conversation_cache.append_turn(conversation, user_message, reply)
+    # read-your-writes: the user's next GETs must see this turn
+    replica_set.pin_user(conversation.user_id)
+
+    return conversation, reply, usage.truncated
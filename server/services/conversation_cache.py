@@ -0,0 +1,269 @@
+"""
+Read-through cache of conversation histories.
+
+Chat turns load the whole history of a conversation to build the model
+prompt. The cache keeps a compact snapshot of recent conversations so the
+next turn of an active chat is served from memory. The chat path updates a
+snapshot when it appends a turn; any other ORM write to a conversation or its
+messages invalidates it.
+
+Snapshots are per process, like the turn coordinator, and a hit reads
+nothing from the database. Every write path of this process keeps them
+current: the chat path appends to the snapshot, the write-behind writer
+invalidates the conversation of a turn it drops, the sync turn store
+invalidates, and ORM writes fire the events below. Writes by other workers
+are not seen: several workers need sticky routing by conversation, or
+CONVERSATION_CACHE_BACKEND=none.
+"""
+
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from config import settings
+from models import Conversation, Message
+from models.conversation import TranscriptEntry
+from models.message import SenderType
+from sqlalchemy import event
+from utils.metrics import metrics
+
+# Rough per-object overhead added to the text length when sizing entries
+ENTRY_OVERHEAD_BYTES = 256
+MESSAGE_OVERHEAD_BYTES = 96
+
+
+@dataclass(frozen=True)
+class CachedMessage:
+    sent_by: SenderType
+    content: str
+
+
+@dataclass(frozen=True)
+class CachedConversation:
+    """Immutable snapshot of a conversation, enough to build a prompt."""
+
+    id: int
+    user_id: int
+    title: str
+    prompt: str | None
+    messages: tuple[CachedMessage, ...] = field(default_factory=tuple)
+
+    @classmethod
+    def from_orm(cls, conversation: Conversation) -> "CachedConversation":
+        return cls(
+            id=conversation.id,
+            user_id=conversation.user_id,
+            title=conversation.title,
+            prompt=conversation.prompt,
+            messages=tuple(
+                CachedMessage(message.sent_by, message.content)
+                for message in conversation.messages
+            ),
+        )
+
+    @classmethod
+    def from_transcript(
+        cls, conversation: Conversation, entries: list[TranscriptEntry]
+    ) -> "CachedConversation":
+        return cls(
+            id=conversation.id,
+            user_id=conversation.user_id,
+            title=conversation.title,
+            prompt=conversation.prompt,
+            messages=tuple(
+                CachedMessage(entry.sent_by, entry.content) for entry in entries
+            ),
+        )
+
+    def with_turn(
+        self, user_message: str, assistant_message: str
+    ) -> "CachedConversation":
+        return CachedConversation(
+            id=self.id,
+            user_id=self.user_id,
+            title=self.title,
+            prompt=self.prompt,
+            messages=self.messages
+            + (
+                CachedMessage(SenderType.USER, user_message),
+                CachedMessage(SenderType.ASSISTANT, assistant_message),
+            ),
+        )
+
+    @property
+    def size_bytes(self) -> int:
+        return (
+            ENTRY_OVERHEAD_BYTES
+            + len(self.title)
+            + len(self.prompt or "")
+            + sum(MESSAGE_OVERHEAD_BYTES + len(m.content) for m in self.messages)
+        )
+
+
+class ConversationCacheBackend(ABC):
+    """Storage interface of the conversation cache."""
+
+    @abstractmethod
+    def get(self, conversation_id: int) -> CachedConversation | None:
+        """The snapshot of a conversation, None when it is not cached"""
+
+    @abstractmethod
+    def set(self, conversation: CachedConversation):
+        """Store a snapshot, replacing the one of the same conversation"""
+
+    @abstractmethod
+    def delete(self, conversation_id: int):
+        """Drop the snapshot of a conversation, if any"""
+
+    @abstractmethod
+    def clear(self):
+        """Drop every snapshot"""
+
+
+class NullCacheBackend(ConversationCacheBackend):
+    """Backend that stores nothing, every lookup goes to the database."""
+
+    def get(self, conversation_id: int) -> CachedConversation | None:
+        return None
+
+    def set(self, conversation: CachedConversation):
+        pass
+
+    def delete(self, conversation_id: int):
+        pass
+
+    def clear(self):
+        pass
+
+
+class InMemoryLRUCacheBackend(ConversationCacheBackend):
+    """LRU backend bounded by the estimated size of the cached histories."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: OrderedDict[int, CachedConversation] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, conversation_id: int) -> CachedConversation | None:
+        with self._lock:
+            conversation = self._entries.get(conversation_id)
+            if conversation is not None:
+                self._entries.move_to_end(conversation_id)
+            return conversation
+
+    def set(self, conversation: CachedConversation):
+        size = conversation.size_bytes
+        with self._lock:
+            self._remove(conversation.id)
+            if size > self.max_bytes:
+                return
+            self._entries[conversation.id] = conversation
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.size_bytes
+                metrics.counter("conversation_cache.evictions").inc()
+
+    def delete(self, conversation_id: int):
+        with self._lock:
+            self._remove(conversation_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _remove(self, conversation_id: int):
+        conversation = self._entries.pop(conversation_id, None)
+        if conversation is not None:
+            self.current_bytes -= conversation.size_bytes
+
+
+class ConversationCache:
+    def __init__(self, backend: ConversationCacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+        metrics.gauge("conversation_cache.hit_rate", lambda: self.hit_rate)
+        metrics.gauge(
+            "conversation_cache.bytes",
+            lambda: getattr(self.backend, "current_bytes", 0),
+        )
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    async def get_or_load(
+        self,
+        conversation_id: int,
+        loader: Callable[[], Awaitable[CachedConversation | None]],
+    ) -> CachedConversation | None:
+        """Return the cached snapshot, or load it with `loader` and cache it."""
+        cached = self.backend.get(conversation_id)
+        if cached is not None:
+            self.hits += 1
+            metrics.counter("conversation_cache.hits").inc()
+            return cached
+
+        self.misses += 1
+        metrics.counter("conversation_cache.misses").inc()
+        snapshot = await loader()
+        if snapshot is not None:
+            self.backend.set(snapshot)
+        return snapshot
+
+    def put(self, conversation: Conversation) -> CachedConversation:
+        snapshot = CachedConversation.from_orm(conversation)
+        self.backend.set(snapshot)
+        return snapshot
+
+    def append_turn(
+        self,
+        conversation: CachedConversation,
+        user_message: str,
+        assistant_message: str,
+    ) -> CachedConversation:
+        """Cache the history as it is after a chat turn was stored."""
+        snapshot = conversation.with_turn(user_message, assistant_message)
+        self.backend.set(snapshot)
+        return snapshot
+
+    def invalidate(self, conversation_id: int):
+        self.backend.delete(conversation_id)
+
+    def clear(self):
+        self.backend.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+CACHE_BACKENDS = {
+    "memory": lambda: InMemoryLRUCacheBackend(settings.CONVERSATION_CACHE_MAX_BYTES),
+    "none": NullCacheBackend,
+}
+
+conversation_cache = ConversationCache(
+    CACHE_BACKENDS[settings.CONVERSATION_CACHE_BACKEND]()
+)
+
+
+@event.listens_for(Message, "after_insert")
+@event.listens_for(Message, "after_update")
+@event.listens_for(Message, "after_delete")
+def _invalidate_on_message_write(mapper, connection, message):
+    conversation_cache.invalidate(message.conversation_id)
+
+
+@event.listens_for(Conversation, "after_update")
+@event.listens_for(Conversation, "after_delete")
+def _invalidate_on_conversation_write(mapper, connection, conversation):
+    conversation_cache.invalidate(conversation.id)
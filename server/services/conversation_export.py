@@ -0,0 +1,530 @@
+"""
+Streaming export and import of conversations.
+
+Conversations are read in chunks of EXPORT_CHUNK_SIZE (keyset pagination on
+the id) and the messages of a chunk are streamed with yield_per, so memory
+stays bounded by one chunk whatever the size of the history. Archived
+conversations are exported from their compressed blobs.
+
+Formats:
+- NDJSON: one record per line, the {"type": "conversation", ...} records of a
+  chunk followed by the {"type": "message", ...} records of its messages.
+- Arrow: record batches of one table, conversations or messages, written as
+  an Arrow IPC stream or a Parquet file. Needs pyarrow.
+
+Imported conversations get new ids, their messages follow them.
+
+    python -m services.conversation_export export backup.ndjson [--user-id N]
+    python -m services.conversation_export export backup/ --format parquet
+    python -m services.conversation_export import backup.ndjson --user-id N
+    python -m services.conversation_export import backup/ --user-id N
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Iterator
+
+from models import Conversation, ConversationArchive, Message
+from models.message import SenderType
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+from utils.metrics import metrics
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Conversations read per chunk
+EXPORT_CHUNK_SIZE = 500
+# Message rows fetched per round trip, and rows per Arrow record batch
+MESSAGE_BATCH_SIZE = 2000
+# Records inserted per transaction on import
+IMPORT_BATCH_SIZE = 2000
+
+TABLES = ("conversations", "messages")
+
+
+class InvalidImportRecord(ValueError):
+    """A record of an import batch could not be imported, at `index` in the batch"""
+
+    def __init__(self, index: int, error: Exception):
+        super().__init__(f"{type(error).__name__}: {error}")
+        self.index = index
+
+
+@dataclass
+class TransferReport:
+    conversations: int = 0
+    messages: int = 0
+    bytes: int = 0
+    skipped: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    finished: float | None = None
+
+    @property
+    def seconds(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rows_per_second(self) -> float:
+        seconds = self.seconds
+        return (self.conversations + self.messages) / seconds if seconds else 0.0
+
+    def finish(self, name: str) -> "TransferReport":
+        """Stop the clock and record the throughput under <name>.*"""
+        self.finished = time.perf_counter()
+        metrics.counter(f"{name}.conversations").inc(self.conversations)
+        metrics.counter(f"{name}.messages").inc(self.messages)
+        metrics.histogram(f"{name}.rows_per_second").observe(self.rows_per_second)
+        return self
+
+    def summary(self) -> str:
+        summary = (
+            f"{self.conversations} conversations, {self.messages} messages "
+            f"in {self.seconds:.2f}s ({self.rows_per_second:,.0f} rows/s"
+        )
+        if self.bytes:
+            megabytes = self.bytes / 1024 / 1024
+            summary += f", {megabytes:.1f} MB, {megabytes / self.seconds:.1f} MB/s"
+        return summary + ")"
+
+
+def _isoformat(value: datetime | None) -> str | None:
+    return value.isoformat() if value is not None else None
+
+
+def _as_datetime(value) -> datetime | None:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def _as_utc(value: datetime | None) -> datetime | None:
+    # SQLite and MySQL DATETIME return naive values, they are stored in UTC
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def iter_conversation_chunks(
+    db: Session, user_id: int | None = None, chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator[list]:
+    """Conversation rows in id order, chunk_size at a time"""
+    conversations = Conversation.__table__
+    last_id = 0
+    while True:
+        query = (
+            select(
+                conversations.c.id,
+                conversations.c.user_id,
+                conversations.c.title,
+                conversations.c.prompt,
+                conversations.c.created_at,
+                conversations.c.updated_at,
+                conversations.c.archived,
+            )
+            .where(conversations.c.id > last_id)
+            .order_by(conversations.c.id)
+            .limit(chunk_size)
+        )
+        if user_id is not None:
+            query = query.where(conversations.c.user_id == user_id)
+
+        chunk = db.execute(query).all()
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1].id
+
+
+def conversation_record(row) -> dict:
+    return {
+        "id": row.id,
+        "user_id": row.user_id,
+        "title": row.title,
+        "prompt": row.prompt,
+        "created_at": row.created_at,
+        "updated_at": row.updated_at,
+    }
+
+
+def iter_message_records(db: Session, chunk: list) -> Iterator[dict]:
+    """Messages of a chunk of conversations, hot rows first, then archived ones"""
+    messages = Message.__table__
+    result = db.execute(
+        select(
+            messages.c.id,
+            messages.c.conversation_id,
+            messages.c.sent_by,
+            messages.c.content,
+            messages.c.created_at,
+            messages.c.updated_at,
+        )
+        .where(messages.c.conversation_id.in_([row.id for row in chunk]))
+        .order_by(messages.c.conversation_id, messages.c.created_at, messages.c.id)
+        .execution_options(yield_per=MESSAGE_BATCH_SIZE)
+    )
+    for row in result:
+        yield {
+            "id": row.id,
+            "conversation_id": row.conversation_id,
+            "sent_by": row.sent_by.value,
+            "content": row.content,
+            "created_at": row.created_at,
+            "updated_at": row.updated_at,
+        }
+
+    # one blob at a time, a blob holds a single conversation
+    for conversation_id in [row.id for row in chunk if row.archived]:
+        payload = db.execute(
+            select(ConversationArchive.payload).where(
+                ConversationArchive.conversation_id == conversation_id
+            )
+        ).scalar_one_or_none()
+        if payload is None:
+            continue
+        for message in ConversationArchive.decode_messages(payload):
+            yield {
+                **message,
+                "conversation_id": conversation_id,
+                "sent_by": message["sent_by"].value,
+            }
+
+
+def export_ndjson(
+    db: Session, user_id: int | None = None, report: TransferReport | None = None
+) -> Iterator[bytes]:
+    """NDJSON export, yielded in pieces of at most one chunk"""
+    report = report if report is not None else TransferReport()
+
+    def encode(record_type: str, record: dict) -> str:
+        record = {
+            key: _isoformat(value) if isinstance(value, datetime) else value
+            for key, value in record.items()
+        }
+        return json.dumps({"type": record_type, **record}, ensure_ascii=False)
+
+    for chunk in iter_conversation_chunks(db, user_id):
+        lines = [encode("conversation", conversation_record(row)) for row in chunk]
+        report.conversations += len(chunk)
+        for message in iter_message_records(db, chunk):
+            lines.append(encode("message", message))
+            report.messages += 1
+            if len(lines) >= MESSAGE_BATCH_SIZE:
+                data = ("\n".join(lines) + "\n").encode("utf-8")
+                report.bytes += len(data)
+                yield data
+                lines = []
+        if lines:
+            data = ("\n".join(lines) + "\n").encode("utf-8")
+            report.bytes += len(data)
+            yield data
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Arrow and Parquet export need pyarrow to be installed")
+
+
+def arrow_schema(table: str):
+    _require_pyarrow()
+    timestamp = pa.timestamp("us", tz="UTC")
+    if table == "conversations":
+        return pa.schema(
+            [
+                ("id", pa.int64()),
+                ("user_id", pa.int64()),
+                ("title", pa.string()),
+                ("prompt", pa.string()),
+                ("created_at", timestamp),
+                ("updated_at", timestamp),
+            ]
+        )
+    if table == "messages":
+        return pa.schema(
+            [
+                ("id", pa.int64()),
+                ("conversation_id", pa.int64()),
+                ("sent_by", pa.string()),
+                ("content", pa.string()),
+                ("created_at", timestamp),
+                ("updated_at", timestamp),
+            ]
+        )
+    raise ValueError(f"Unknown table: {table}")
+
+
+def iter_record_batches(
+    db: Session,
+    table: str,
+    user_id: int | None = None,
+    report: TransferReport | None = None,
+) -> Iterator:
+    """Arrow record batches of one table"""
+    schema = arrow_schema(table)
+    report = report if report is not None else TransferReport()
+
+    def to_batch(records: list[dict]):
+        for record in records:
+            record["created_at"] = _as_utc(record["created_at"])
+            record["updated_at"] = _as_utc(record["updated_at"])
+        batch = pa.RecordBatch.from_pylist(records, schema=schema)
+        report.bytes += batch.nbytes
+        return batch
+
+    for chunk in iter_conversation_chunks(db, user_id):
+        if table == "conversations":
+            report.conversations += len(chunk)
+            yield to_batch([conversation_record(row) for row in chunk])
+            continue
+
+        records = []
+        for message in iter_message_records(db, chunk):
+            records.append(message)
+            if len(records) >= MESSAGE_BATCH_SIZE:
+                report.messages += len(records)
+                yield to_batch(records)
+                records = []
+        if records:
+            report.messages += len(records)
+            yield to_batch(records)
+
+
+class _ByteSink:
+    """File-like object collecting what the Arrow IPC writer writes"""
+
+    def __init__(self):
+        self.pieces: list[bytes] = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.pieces.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.pieces)
+        self.pieces = []
+        return data
+
+
+def export_arrow_stream(
+    db: Session,
+    table: str,
+    user_id: int | None = None,
+    report: TransferReport | None = None,
+) -> Iterator[bytes]:
+    """Arrow IPC stream of one table, yielded batch by batch"""
+    schema = arrow_schema(table)
+    sink = _ByteSink()
+    writer = pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), schema)
+    for batch in iter_record_batches(db, table, user_id, report):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def export_parquet(
+    session_factories: list,
+    directory: str,
+    user_id: int | None = None,
+    report: TransferReport | None = None,
+) -> TransferReport:
+    """
+    Write <directory>/conversations.parquet and <directory>/messages.parquet
+    from every database in session_factories (one per shard).
+    """
+    _require_pyarrow()
+    report = report if report is not None else TransferReport()
+    os.makedirs(directory, exist_ok=True)
+    for table in TABLES:
+        path = os.path.join(directory, f"{table}.parquet")
+        with pq.ParquetWriter(path, arrow_schema(table)) as writer:
+            for session_factory in session_factories:
+                with session_factory() as db:
+                    for batch in iter_record_batches(db, table, user_id, report):
+                        writer.write_batch(batch)
+    return report
+
+
+class ConversationImporter:
+    """
+    Insert exported records batch by batch. Conversations get new ids (from
+    `allocate_id` when given, else from the database) and their messages are
+    attached to them; messages of conversations not imported are skipped.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        user_id: int | None = None,
+        allocate_id: Callable[[int], int | None] | None = None,
+        report: TransferReport | None = None,
+    ):
+        self.db = db
+        self.user_id = user_id
+        self.allocate_id = allocate_id
+        self.report = report if report is not None else TransferReport()
+        # exported conversation id -> imported id
+        self.id_map: dict[int, int] = {}
+
+    def import_records(self, records: Iterable[dict]) -> TransferReport:
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+        return self.report
+
+    def import_batch(self, records: list[dict]):
+        """
+        Insert a batch of records in one transaction. Raises
+        InvalidImportRecord for a malformed record, leaving the transaction
+        to be rolled back.
+        """
+        message_rows = []
+        for index, record in enumerate(records):
+            try:
+                self._add_record(record, message_rows)
+            except (KeyError, TypeError, ValueError, DataError, IntegrityError) as e:
+                raise InvalidImportRecord(index, e) from e
+
+        if message_rows:
+            self.db.execute(insert(Message.__table__), message_rows)
+            self.report.messages += len(message_rows)
+        self.db.commit()
+
+    def _add_record(self, record: dict, message_rows: list[dict]):
+        """Insert a conversation record, or add a message record to message_rows"""
+        if record["type"] == "conversation":
+            user_id = self.user_id if self.user_id is not None else record["user_id"]
+            values = {
+                "user_id": user_id,
+                "title": record["title"],
+                "prompt": record["prompt"],
+                "created_at": _as_datetime(record["created_at"]),
+                "updated_at": _as_datetime(record.get("updated_at")),
+                # rebuilt from the messages on first use
+                "transcript": None,
+            }
+            new_id = self.allocate_id(user_id) if self.allocate_id else None
+            if new_id is not None:
+                values["id"] = new_id
+            result = self.db.execute(insert(Conversation.__table__).values(**values))
+            self.id_map[record["id"]] = result.inserted_primary_key[0]
+            self.report.conversations += 1
+            return
+
+        conversation_id = self.id_map.get(record["conversation_id"])
+        if conversation_id is None:
+            self.report.skipped += 1
+            return
+        message_rows.append(
+            {
+                "conversation_id": conversation_id,
+                "sent_by": SenderType(record["sent_by"]),
+                "content": record["content"],
+                "created_at": _as_datetime(record["created_at"]),
+                "updated_at": _as_datetime(record.get("updated_at")),
+            }
+        )
+
+
+def finish_after(
+    chunks: Iterator[bytes], report: TransferReport, name: str
+) -> Iterator[bytes]:
+    """Pass chunks through, then finish and log the report once the stream is done"""
+    yield from chunks
+    logger.info(f"{name}: {report.finish(name).summary()}")
+
+
+def iter_ndjson_records(lines: Iterable[bytes | str]) -> Iterator[dict]:
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_parquet_records(directory: str) -> Iterator[dict]:
+    """Records of a Parquet export, conversations first"""
+    _require_pyarrow()
+    for table in TABLES:
+        parquet_file = pq.ParquetFile(os.path.join(directory, f"{table}.parquet"))
+        record_type = table[:-1]
+        for batch in parquet_file.iter_batches(batch_size=MESSAGE_BATCH_SIZE):
+            for record in batch.to_pylist():
+                yield {"type": record_type, **record}
+
+
+def main():
+    from database import shard_map
+    from database.mysql import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Export or import conversations")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="export conversations to a file")
+    export.add_argument("path", help="NDJSON file, or directory for Parquet")
+    export.add_argument("--format", choices=["ndjson", "parquet"], default="ndjson")
+    export.add_argument("--user-id", type=int)
+    load = commands.add_parser("import", help="import an export")
+    load.add_argument("path", help="NDJSON file, or directory of a Parquet export")
+    load.add_argument("--user-id", type=int, help="owner of the imported conversations")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        report = TransferReport()
+        session_factories = list(shard_map.session_factories.values()) or [SessionLocal]
+        if args.format == "parquet":
+            export_parquet(session_factories, args.path, args.user_id, report)
+        else:
+            with open(args.path, "wb") as out:
+                for session_factory in session_factories:
+                    with session_factory() as db:
+                        for data in export_ndjson(db, args.user_id, report):
+                            out.write(data)
+        print(f"exported {report.finish('export').summary()}")
+        return
+
+    if shard_map.sharded and args.user_id is None:
+        parser.error("--user-id is required when conversations are sharded")
+    if shard_map.sharded:
+        with SessionLocal() as directory:
+            shard = shard_map.shard_for_user(directory, args.user_id)
+        session_factory = shard_map.session_factories[shard]
+    else:
+        session_factory = SessionLocal
+
+    with session_factory() as db:
+        importer = ConversationImporter(
+            db, args.user_id, allocate_id=shard_map.allocate_conversation_id
+        )
+        if os.path.isdir(args.path):
+            report = importer.import_records(iter_parquet_records(args.path))
+        else:
+            with open(args.path, "rb") as lines:
+                report = importer.import_records(iter_ndjson_records(lines))
+    print(f"imported {report.finish('import').summary()}, {report.skipped} skipped")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,125 @@
+"""
+Delta sync of a user's conversations.
+
+A sync token records the highest conversation id and message id a client
+has received. /sync returns the conversations and messages above them with
+the next token, so keeping a client current costs work proportional to what
+changed. The listing endpoint sends a token with the full history in the
+X-Sync-Token header, to start syncing from.
+
+Ids are enough because conversations and messages are only ever created:
+nothing edits or deletes them, and archiving keeps message ids. Ids are
+per shard, so a token names its shard and is expired once the user is moved
+to another one. It also expires after ARCHIVE_AFTER_DAYS, when messages the
+client has not seen may have been archived.
+
+Ids are assigned at insert, not at commit: a transaction still open can
+commit a lower id than one already read. Tokens therefore stop before rows
+younger than SYNC_SETTLE_SECONDS, and a client may receive those rows
+twice: it keys them by id.
+"""
+
+import base64
+import json
+import time
+from dataclasses import asdict, dataclass
+
+from config import settings
+from models import Conversation
+from sqlalchemy.orm import Session
+from utils.metrics import metrics
+
+SYNC_TOKEN_VERSION = 1
+# Messages returned per sync, has_more tells the client to sync again
+SYNC_MESSAGE_LIMIT = 1000
+
+
+class SyncTokenExpired(Exception):
+    """The token can no longer be synced from, the client must reload everything"""
+
+
+@dataclass
+class SyncToken:
+    conversation_id: int = 0
+    message_id: int = 0
+    shard: str | None = None
+    issued_at: float = 0.0
+
+    def encode(self) -> str:
+        data = json.dumps(
+            {"v": SYNC_TOKEN_VERSION, **asdict(self)}, separators=(",", ":")
+        )
+        return (
+            base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+        )
+
+    @classmethod
+    def decode(cls, token: str) -> "SyncToken":
+        """Raises ValueError for a malformed token"""
+        try:
+            data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+            if data.pop("v") != SYNC_TOKEN_VERSION:
+                raise ValueError("unknown sync token version")
+            return cls(
+                conversation_id=int(data["conversation_id"]),
+                message_id=int(data["message_id"]),
+                shard=data["shard"],
+                issued_at=float(data["issued_at"]),
+            )
+        except (
+            KeyError,
+            TypeError,
+            AttributeError,
+            UnicodeDecodeError,
+            json.JSONDecodeError,
+        ) as e:
+            raise ValueError(f"invalid sync token: {e}") from e
+
+
+def current_token(db: Session, user_id: int) -> SyncToken:
+    """Token covering everything the user has now"""
+    conversation_id, message_id = Conversation.get_sync_marks(
+        db, user_id, settings.SYNC_SETTLE_SECONDS
+    )
+    return SyncToken(conversation_id, message_id, db.info.get("shard"), time.time())
+
+
+def sync(
+    db: Session, user_id: int, token: SyncToken | None, limit: int = SYNC_MESSAGE_LIMIT
+) -> dict:
+    """Changes after the token, or the whole history without one"""
+    token = token or SyncToken(shard=db.info.get("shard"))
+    if token.shard != db.info.get("shard"):
+        metrics.counter("sync.expired_tokens").inc()
+        raise SyncTokenExpired("the conversations moved to another shard")
+    max_age = settings.ARCHIVE_AFTER_DAYS * 86400
+    if token.issued_at and max_age and time.time() - token.issued_at > max_age:
+        metrics.counter("sync.expired_tokens").inc()
+        raise SyncTokenExpired("older than the archiving age")
+
+    changes = Conversation.get_changes(
+        db,
+        user_id,
+        token.conversation_id,
+        token.message_id,
+        limit,
+        settings.SYNC_SETTLE_SECONDS,
+    )
+    next_token = SyncToken(
+        conversation_id=changes.last_conversation_id,
+        message_id=changes.last_message_id,
+        shard=token.shard,
+        # a partial page keeps the expiry of the token it continues
+        issued_at=(
+            token.issued_at if changes.has_more and token.issued_at else time.time()
+        ),
+    )
+
+    metrics.counter("sync.requests").inc()
+    metrics.histogram("sync.messages").observe(len(changes.messages))
+    return {
+        "conversations": changes.conversations,
+        "messages": changes.messages,
+        "sync_token": next_token.encode(),
+        "has_more": changes.has_more,
+    }
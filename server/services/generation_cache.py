@@ -0,0 +1,312 @@
+"""
+Exact-match cache of generated replies.
+
+With greedy decoding, the same rendered prompt (system prompt, history and
+new message) on the same model and generation parameters always gives the
+same reply, so common first messages need not run the model again. Replies
+are cached under a hash of all three, in an in-memory LRU tier and, when
+GENERATION_CACHE_DIR is set, an SQLite tier on disk that survives restarts.
+
+Sampled generations differ from run to run and are never cached; the
+caller checks `is_cacheable` before using the cache.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from config import settings
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ENTRY_OVERHEAD_BYTES = 128
+DISK_CACHE_FILE = "generation_cache.sqlite3"
+
+
+@dataclass(frozen=True)
+class CachedGeneration:
+    reply: str
+    token_ids: tuple[int, ...]
+    expires_at: float
+
+    @property
+    def size_bytes(self) -> int:
+        return (
+            ENTRY_OVERHEAD_BYTES
+            + len(self.reply.encode("utf-8"))
+            + 8 * len(self.token_ids)
+        )
+
+
+def cache_key(model_name: str, rendered_prompt: str, params: dict) -> str:
+    """Hash of everything the reply of a greedy generation depends on"""
+    material = json.dumps(
+        {"model": model_name, "prompt": rendered_prompt, "params": params},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.blake2b(material.encode("utf-8"), digest_size=20).hexdigest()
+
+
+def is_cacheable(params: dict) -> bool:
+    return not params.get("do_sample")
+
+
+class MemoryTier:
+    """LRU bounded by the estimated size of the cached replies."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: OrderedDict[str, CachedGeneration] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> CachedGeneration | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CachedGeneration):
+        with self._lock:
+            self._remove(key)
+            if entry.size_bytes > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.current_bytes += entry.size_bytes
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.size_bytes
+                metrics.counter("generation_cache.memory_evictions").inc()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry.size_bytes
+
+
+class DiskTier:
+    """
+    SQLite file of cached replies, bounded by the size of the stored entries.
+    Past the bound the least recently used tenth is deleted.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS generations ("
+            " key TEXT PRIMARY KEY, reply TEXT NOT NULL, token_ids TEXT NOT NULL,"
+            " size INTEGER NOT NULL, expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS ix_generations_accessed_at"
+            " ON generations (accessed_at)"
+        )
+        self._connection.commit()
+        self.current_bytes = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM generations"
+        ).fetchone()[0]
+
+    def get(self, key: str) -> CachedGeneration | None:
+        now = time.time()
+        with self._lock, self._rollback_on_error():
+            row = self._connection.execute(
+                "SELECT reply, token_ids, expires_at FROM generations WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            if row[2] <= now:
+                self._delete(key)
+                self._connection.commit()
+                return None
+            self._connection.execute(
+                "UPDATE generations SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._connection.commit()
+        return CachedGeneration(row[0], tuple(json.loads(row[1])), row[2])
+
+    def set(self, key: str, entry: CachedGeneration):
+        if entry.size_bytes > self.max_bytes:
+            return
+        with self._lock, self._rollback_on_error():
+            self._delete(key)
+            self._connection.execute(
+                "INSERT INTO generations VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    entry.reply,
+                    json.dumps(entry.token_ids),
+                    entry.size_bytes,
+                    entry.expires_at,
+                    time.time(),
+                ),
+            )
+            self.current_bytes += entry.size_bytes
+            if self.current_bytes > self.max_bytes:
+                self._evict()
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM generations")
+            self._connection.commit()
+            self.current_bytes = 0
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    @contextmanager
+    def _rollback_on_error(self):
+        """Leave no half-done transaction, nor a size counting it, behind an error"""
+        current_bytes = self.current_bytes
+        try:
+            yield
+        except sqlite3.Error:
+            self.current_bytes = current_bytes
+            self._connection.rollback()
+            raise
+
+    def _delete(self, key: str):
+        row = self._connection.execute(
+            "SELECT size FROM generations WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            self._connection.execute("DELETE FROM generations WHERE key = ?", (key,))
+            self.current_bytes -= row[0]
+
+    def _evict(self):
+        self._connection.execute(
+            "DELETE FROM generations WHERE expires_at <= ?", (time.time(),)
+        )
+        count = self._connection.execute("SELECT COUNT(*) FROM generations").fetchone()[
+            0
+        ]
+        self._connection.execute(
+            "DELETE FROM generations WHERE key IN ("
+            " SELECT key FROM generations ORDER BY accessed_at LIMIT ?)",
+            (max(count // 10, 1),),
+        )
+        self.current_bytes = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM generations"
+        ).fetchone()[0]
+        metrics.counter("generation_cache.disk_evictions").inc()
+
+
+class GenerationCache:
+    def __init__(
+        self,
+        memory: MemoryTier,
+        disk: DiskTier | None = None,
+        ttl_seconds: float = 0,
+        enabled: bool = True,
+    ):
+        self.memory = memory
+        self.disk = disk
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+        metrics.gauge("generation_cache.hit_rate", lambda: self.hit_rate)
+        metrics.gauge("generation_cache.bytes", lambda: self.memory.current_bytes)
+        metrics.gauge(
+            "generation_cache.disk_bytes",
+            lambda: self.disk.current_bytes if self.disk else 0,
+        )
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    async def get(self, key: str) -> CachedGeneration | None:
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.hits += 1
+            metrics.counter("generation_cache.memory_hits").inc()
+            return entry
+
+        if self.disk is not None:
+            try:
+                entry = await asyncio.to_thread(self.disk.get, key)
+            except sqlite3.Error:
+                # a broken disk tier is a miss, not a failed turn
+                logger.exception("Generation cache disk read failed")
+                metrics.counter("generation_cache.disk_errors").inc()
+                entry = None
+            if entry is not None:
+                self.hits += 1
+                metrics.counter("generation_cache.disk_hits").inc()
+                self.memory.set(key, entry)
+                return entry
+
+        self.misses += 1
+        metrics.counter("generation_cache.misses").inc()
+        return None
+
+    async def set(self, key: str, reply: str, token_ids: list[int]):
+        entry = CachedGeneration(
+            reply, tuple(token_ids), time.time() + self.ttl_seconds
+        )
+        self.memory.set(key, entry)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.set, key, entry)
+            except sqlite3.Error:
+                logger.exception("Generation cache disk write failed")
+                metrics.counter("generation_cache.disk_errors").inc()
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def _disk_tier() -> DiskTier | None:
+    if not settings.GENERATION_CACHE_ENABLED or not settings.GENERATION_CACHE_DIR:
+        return None
+    os.makedirs(settings.GENERATION_CACHE_DIR, exist_ok=True)
+    return DiskTier(
+        os.path.join(settings.GENERATION_CACHE_DIR, DISK_CACHE_FILE),
+        settings.GENERATION_CACHE_DISK_MAX_BYTES,
+    )
+
+
+generation_cache = GenerationCache(
+    MemoryTier(settings.GENERATION_CACHE_MAX_BYTES),
+    _disk_tier(),
+    ttl_seconds=settings.GENERATION_CACHE_TTL_SECONDS,
+    enabled=settings.GENERATION_CACHE_ENABLED,
+)
@@ -0,0 +1,212 @@
+"""
+Scheduling of generations on the chat model.
+
+At most GENERATION_CONCURRENCY generations run at once; the others wait in
+a queue whose order is set by SCHEDULER_POLICY:
+
+- "fifo": arrival order.
+- "wfq": weighted fair queuing per user. Each job is tagged with a virtual
+  finish time, the user's previous tag plus its predicted cost divided by
+  the user's weight (SCHEDULER_USER_WEIGHTS), so a user sending many long
+  requests only delays their own later ones.
+- "sjf": shortest predicted job first, the cost being prompt tokens plus
+  max_new_tokens. Best mean wait, but long jobs can wait for as long as
+  shorter ones keep coming.
+
+Queue waits are recorded per policy (scheduler.<policy>.queue_wait_seconds)
+to compare them on real traffic.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+from config import settings
+from utils.metrics import metrics
+
+
+@dataclass(order=True)
+class Job:
+    priority: float
+    sequence: int
+    user_id: int = field(compare=False)
+    cost: float = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    granted: asyncio.Future = field(compare=False)
+    started_at: float | None = field(default=None, compare=False)
+
+
+class SchedulingPolicy(ABC):
+    """Order of the waiting jobs."""
+
+    name: str
+
+    @abstractmethod
+    def push(self, job: Job):
+        """Queue a waiting job"""
+
+    @abstractmethod
+    def pop(self) -> Job:
+        """Remove and return the job to run next"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of waiting jobs"""
+
+
+class FIFOPolicy(SchedulingPolicy):
+    name = "fifo"
+
+    def __init__(self):
+        self._jobs: deque[Job] = deque()
+
+    def push(self, job: Job):
+        self._jobs.append(job)
+
+    def pop(self) -> Job:
+        return self._jobs.popleft()
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+
+class _HeapPolicy(SchedulingPolicy):
+    def __init__(self):
+        self._jobs: list[Job] = []
+
+    def push(self, job: Job):
+        job.priority = self.priority(job)
+        heapq.heappush(self._jobs, job)
+
+    def pop(self) -> Job:
+        return heapq.heappop(self._jobs)
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    @abstractmethod
+    def priority(self, job: Job) -> float:
+        """Sort key of a job, lowest runs first"""
+
+
+class ShortestJobFirstPolicy(_HeapPolicy):
+    name = "sjf"
+
+    def priority(self, job: Job) -> float:
+        return job.cost
+
+
+class WeightedFairQueuingPolicy(_HeapPolicy):
+    name = "wfq"
+
+    def __init__(self, weights: dict[int, float] | None = None):
+        super().__init__()
+        self.weights = weights or {}
+        self.virtual_time = 0.0
+        self._last_finish: dict[int, float] = {}
+
+    def priority(self, job: Job) -> float:
+        start = max(self.virtual_time, self._last_finish.get(job.user_id, 0.0))
+        finish = start + job.cost / self.weights.get(job.user_id, 1.0)
+        self._last_finish[job.user_id] = finish
+        return finish
+
+    def pop(self) -> Job:
+        job = super().pop()
+        # self-clocked: virtual time is the finish tag of the job last served
+        self.virtual_time = max(self.virtual_time, job.priority)
+        if not self._jobs:
+            # idle: users start over level, past tags must not hold anyone back
+            self._last_finish.clear()
+        return job
+
+
+class GenerationScheduler:
+    def __init__(self, policy: SchedulingPolicy, concurrency: int = 1):
+        self.policy = policy
+        self.concurrency = concurrency
+        self.running_jobs: dict[int, Job] = {}
+        self._sequence = itertools.count()
+
+        metrics.gauge("scheduler.queue_length", lambda: len(self.policy))
+        metrics.gauge("scheduler.running", lambda: self.running)
+
+    @property
+    def running(self) -> int:
+        return len(self.running_jobs)
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, cost: float):
+        """Wait for the turn of a generation and hold a slot while it runs."""
+        job = await self.acquire(user_id, cost)
+        try:
+            yield job
+        finally:
+            self.release(job)
+
+    async def acquire(self, user_id: int, cost: float) -> Job:
+        job = Job(
+            priority=0.0,
+            sequence=next(self._sequence),
+            user_id=user_id,
+            cost=cost,
+            enqueued_at=time.perf_counter(),
+            granted=asyncio.get_running_loop().create_future(),
+        )
+        self.policy.push(job)
+        self._grant()
+        try:
+            await job.granted
+        except asyncio.CancelledError:
+            if job.granted.done() and not job.granted.cancelled():
+                # the slot was handed over as the waiter was cancelled
+                self.release(job)
+            else:
+                # left in the queue, skipped when it comes up
+                job.granted.cancel()
+            raise
+        return job
+
+    def release(self, job: Job):
+        del self.running_jobs[job.sequence]
+        self._grant()
+
+    def _grant(self):
+        while self.running < self.concurrency and len(self.policy):
+            job = self.policy.pop()
+            if job.granted.done():
+                continue
+            job.started_at = time.perf_counter()
+            self.running_jobs[job.sequence] = job
+            job.granted.set_result(None)
+            self._dispatched(job)
+
+    def _dispatched(self, job: Job):
+        name = self.policy.name
+        metrics.counter(f"scheduler.{name}.dispatched").inc()
+        metrics.histogram(f"scheduler.{name}.queue_wait_seconds").observe(
+            job.started_at - job.enqueued_at
+        )
+
+
+def make_policy(name: str) -> SchedulingPolicy:
+    if name == "fifo":
+        return FIFOPolicy()
+    if name == "wfq":
+        weights = settings.SCHEDULER_USER_WEIGHTS
+        return WeightedFairQueuingPolicy(
+            {int(user_id): weight for user_id, weight in weights.items()}
+        )
+    if name == "sjf":
+        return ShortestJobFirstPolicy()
+    raise ValueError(f"Unknown scheduling policy: {name}")
+
+
+generation_scheduler = GenerationScheduler(
+    make_policy(settings.SCHEDULER_POLICY), settings.GENERATION_CONCURRENCY
+)
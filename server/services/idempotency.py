@@ -0,0 +1,129 @@
+"""
+Idempotency keys for chat requests.
+
+A client that times out and retries a chat request sends the same
+Idempotency-Key header again. The first request with a key runs; a retry
+while it is still running waits for it, and a retry after it completed gets
+the stored result for IDEMPOTENCY_TTL_SECONDS. Either way the model does not
+generate again and the turn is stored once.
+
+Keys are scoped to the user and bound to the request they were first used
+with: reusing a key for a different request is rejected. Failed requests are
+not stored, a retry runs them again.
+
+Results are kept per process, like the conversation cache, and are not
+shared across workers: a retry that reaches another worker runs again.
+Several workers need sticky routing by user for retries to be replayed.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable
+
+from config import settings
+from pydantic import BaseModel
+from utils.metrics import metrics
+from utils.single_flight import FlightCancelled, SingleFlight
+
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a different request."""
+
+
+class IdempotencyKeyInUse(Exception):
+    """A different request with the key is still in progress."""
+
+
+@dataclass(frozen=True)
+class StoredResult:
+    fingerprint: str
+    value: Any
+    expires_at: float
+
+
+def fingerprint(request: BaseModel) -> str:
+    return hashlib.blake2b(
+        request.model_dump_json().encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._results: OrderedDict[Hashable, StoredResult] = OrderedDict()
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+
+        metrics.gauge("idempotency.stored", lambda: len(self._results))
+
+    def get(self, scope: Hashable) -> StoredResult | None:
+        with self._lock:
+            stored = self._results.get(scope)
+            if stored is not None and stored.expires_at <= time.monotonic():
+                del self._results[scope]
+                return None
+            return stored
+
+    def put(self, scope: Hashable, request_fingerprint: str, value: Any):
+        with self._lock:
+            self._results.pop(scope, None)
+            self._results[scope] = StoredResult(
+                request_fingerprint, value, time.monotonic() + self.ttl_seconds
+            )
+            # entries share one TTL, so the oldest expires first
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+                metrics.counter("idempotency.evictions").inc()
+
+    async def run(
+        self,
+        user_id: int,
+        key: str,
+        request_fingerprint: str,
+        call: Callable[[], Awaitable[Any]],
+    ) -> tuple[Any, bool]:
+        """
+        Run `call` once per user and key. Returns its result and whether it
+        was replayed from an earlier request rather than run by this one.
+        """
+        scope = (user_id, key)
+        while True:
+            stored = self.get(scope)
+            if stored is not None:
+                if stored.fingerprint != request_fingerprint:
+                    raise IdempotencyKeyReused(key)
+                metrics.counter("idempotency.replayed").inc()
+                return stored.value, True
+
+            flight = self._flights.get(scope)
+            if flight is None:
+                break
+            if flight.tag != request_fingerprint:
+                raise IdempotencyKeyInUse(key)
+            metrics.counter("idempotency.joined").inc()
+            try:
+                return await self._flights.join(flight), True
+            except FlightCancelled:
+                pass  # the original request was cancelled, look again
+
+        async def call_and_store() -> Any:
+            value = await call()
+            # stored before the flight ends, so no retry falls between the two
+            self.put(scope, request_fingerprint, value)
+            return value
+
+        value = await self._flights.run(scope, call_and_store, request_fingerprint)
+        return value, False
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+
+idempotency_store = IdempotencyStore(
+    settings.IDEMPOTENCY_TTL_SECONDS, settings.IDEMPOTENCY_MAX_ENTRIES
+)
@@ -0,0 +1,304 @@
+"""
+Write-behind persistence of chat turns.
+
+When enabled, a finished turn is appended to a local journal file and
+acknowledged right away; a background task inserts queued turns into the
+messages table in batched multi-row INSERTs. The journal is replayed on
+startup, so turns accepted before a crash are not lost, and everything still
+queued is flushed on shutdown.
+
+Every worker process journals to its own file: it locks the first free slot
+n and writes MESSAGE_WRITE_BEHIND_JOURNAL.n, so a restarted worker takes
+over the slot, and the turns, of a worker that died. Journal I/O runs on a
+thread of its own, in the order it was queued, never on the event loop.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+
+from config import settings
+from models import Conversation, Message
+from models.conversation import TranscriptEntry
+from models.message import SenderType
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from utils.metrics import metrics
+
+from .conversation_cache import conversation_cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingTurn:
+    conversation_id: int
+    user_message: str
+    assistant_message: str
+    user_created_at: str
+    assistant_created_at: str
+    assistant_token_ids: list[int] | None = None
+    # None for the main database when storage is not sharded
+    shard: str | None = None
+
+    def to_rows(self) -> list[dict]:
+        return [
+            {
+                "conversation_id": self.conversation_id,
+                "sent_by": SenderType.USER,
+                "content": self.user_message,
+                "created_at": datetime.fromisoformat(self.user_created_at),
+            },
+            {
+                "conversation_id": self.conversation_id,
+                "sent_by": SenderType.ASSISTANT,
+                "content": self.assistant_message,
+                "created_at": datetime.fromisoformat(self.assistant_created_at),
+            },
+        ]
+
+    def to_transcript_entries(self) -> list[TranscriptEntry]:
+        return [
+            TranscriptEntry(SenderType.USER, self.user_message),
+            TranscriptEntry(
+                SenderType.ASSISTANT, self.assistant_message, self.assistant_token_ids
+            ),
+        ]
+
+
+class MessageWriteBehindQueue:
+    def __init__(self, journal_path: str, batch_size: int, flush_interval: float):
+        # the journal of this process is journal_base.<slot>, claimed on start
+        self.journal_base = journal_path
+        self.journal_path: str | None = None
+        self._slot_lock = None
+        self._journal_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="message-journal"
+        )
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: list[PendingTurn] = []
+        self._session_factory = None
+        self._shard_session_factories: dict = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+
+        metrics.gauge("message_writer.pending_turns", lambda: len(self._pending))
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self, session_factory, shard_session_factories: dict | None = None):
+        """Replay the journal and start the background writer."""
+        self._session_factory = session_factory
+        self._shard_session_factories = shard_session_factories or {}
+        self.journal_path = await self._journal_io(self._claim_slot)
+        # turns journaled by the previous holder of the slot
+        self._pending = await self._journal_io(self._read_journal, self.journal_path)
+        if self._pending:
+            logger.info(f"Replaying {len(self._pending)} journaled chat turns")
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background writer and flush every queued turn."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        await self.flush()
+        await self._journal_io(self._release_slot)
+
+    async def enqueue(
+        self,
+        conversation_id: int,
+        user_message: str,
+        assistant_message: str,
+        user_created_at: datetime,
+        assistant_token_ids: list[int] | None = None,
+        shard: str | None = None,
+    ):
+        """Journal a finished turn and queue it for the background writer."""
+        turn = PendingTurn(
+            conversation_id=conversation_id,
+            user_message=user_message,
+            assistant_message=assistant_message,
+            user_created_at=user_created_at.isoformat(),
+            assistant_created_at=datetime.now(timezone.utc).isoformat(),
+            assistant_token_ids=assistant_token_ids,
+            shard=shard,
+        )
+        # queued before the append is, so a journal rewrite queued meanwhile keeps it
+        self._pending.append(turn)
+        try:
+            await self._journal_io(self._append_journal, turn)
+        except OSError as e:
+            # the turn may already be written, it stays queued without the journal
+            metrics.counter("message_writer.journal_errors").inc()
+            logger.error(f"Could not journal a chat turn, it is only queued: {e}")
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def has_pending(self, conversation_id: int) -> bool:
+        return any(turn.conversation_id == conversation_id for turn in self._pending)
+
+    async def wait_for_conversation(self, conversation_id: int | None):
+        """Make queued turns of a conversation visible before its history is read."""
+        if conversation_id is not None and self.has_pending(conversation_id):
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Insert all queued turns. Returns the number of turns written."""
+        written = 0
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._next_batch()
+                started = time.perf_counter()
+                written += await self._write_batch(batch)
+                # enqueue only appends, so the batch is still the head of the list
+                del self._pending[: len(batch)]
+                await self._journal_io(self._rewrite_journal, list(self._pending))
+
+                metrics.histogram("message_writer.flush_seconds").observe(
+                    time.perf_counter() - started
+                )
+                metrics.histogram("message_writer.batch_turns").observe(len(batch))
+        return written
+
+    def _next_batch(self) -> list[PendingTurn]:
+        """Leading queued turns that go to the same database, at most batch_size"""
+        shard = self._pending[0].shard
+        batch = []
+        for turn in self._pending[: self.batch_size]:
+            if turn.shard != shard:
+                break
+            batch.append(turn)
+        return batch
+
+    async def _write_batch(self, batch: list[PendingTurn]) -> int:
+        rows = [row for turn in batch for row in turn.to_rows()]
+        transcripts: dict[int, list[TranscriptEntry]] = {}
+        for turn in batch:
+            transcripts.setdefault(turn.conversation_id, []).extend(
+                turn.to_transcript_entries()
+            )
+
+        shard = batch[0].shard
+        session_factory = (
+            self._session_factory
+            if shard is None
+            else self._shard_session_factories[shard]
+        )
+        async with session_factory() as db:
+            try:
+                await db.execute(insert(Message), rows)
+                for conversation_id, entries in transcripts.items():
+                    await db.execute(
+                        Conversation.append_transcript_statement(
+                            conversation_id, entries
+                        )
+                    )
+                await db.commit()
+                return len(batch)
+            except IntegrityError:
+                await db.rollback()
+
+            # A turn whose conversation is gone can never be written, keep the rest
+            written = 0
+            for turn in batch:
+                try:
+                    await db.execute(insert(Message), turn.to_rows())
+                    await db.execute(
+                        Conversation.append_transcript_statement(
+                            turn.conversation_id, turn.to_transcript_entries()
+                        )
+                    )
+                    await db.commit()
+                    written += 1
+                except IntegrityError as e:
+                    await db.rollback()
+                    metrics.counter("message_writer.dropped_turns").inc()
+                    # the cached history already holds the turn
+                    conversation_cache.invalidate(turn.conversation_id)
+                    logger.error(
+                        f"Dropping chat turn for conversation {turn.conversation_id}: {e}"
+                    )
+            return written
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing chat turns, will retry: {e}")
+
+    def _journal_io(self, function, *args) -> asyncio.Future:
+        return asyncio.get_running_loop().run_in_executor(
+            self._journal_executor, function, *args
+        )
+
+    def _claim_slot(self) -> str:
+        """Lock the first journal slot no other process holds, returns its journal"""
+        slot = 0
+        while True:
+            lock_file = open(f"{self.journal_base}.{slot}.lock", "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                slot += 1
+                continue
+            self._slot_lock = lock_file
+            return f"{self.journal_base}.{slot}"
+
+    def _release_slot(self):
+        if self._slot_lock is not None:
+            self._slot_lock.close()
+            self._slot_lock = None
+        self.journal_path = None
+
+    @staticmethod
+    def _read_journal(path: str) -> list[PendingTurn]:
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding="utf-8") as journal:
+            return [PendingTurn(**json.loads(line)) for line in journal if line.strip()]
+
+    def _append_journal(self, turn: PendingTurn):
+        with open(self.journal_path, "a", encoding="utf-8") as journal:
+            journal.write(json.dumps(asdict(turn)) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def _rewrite_journal(self, pending: list[PendingTurn]):
+        temp_path = f"{self.journal_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as journal:
+            for turn in pending:
+                journal.write(json.dumps(asdict(turn)) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(temp_path, self.journal_path)
+
+
+message_writer = MessageWriteBehindQueue(
+    journal_path=settings.MESSAGE_WRITE_BEHIND_JOURNAL,
+    batch_size=settings.MESSAGE_WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=settings.MESSAGE_WRITE_BEHIND_FLUSH_INTERVAL,
+)
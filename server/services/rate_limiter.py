@@ -0,0 +1,186 @@
+"""
+Per-user rate limit in model tokens.
+
+Request counts do not reflect load: a turn on a long history costs far more
+prefill than a short one. Each user has a token bucket holding up to
+RATE_LIMIT_BURST_TOKENS and refilled at RATE_LIMIT_TOKENS_PER_MINUTE.
+
+Before a turn is admitted, its prompt tokens, estimated from the length of
+the prompt, and max_new_tokens are taken from the bucket; when there are
+not enough, the turn is rejected with the time until there will be. Once
+the turn completes it is settled at its real cost, prompt (prefill) plus
+generated tokens, so a turn above its estimate can put the bucket in debt
+and delay the next turn. Replies served from a cache cost nothing.
+
+Buckets live in memory, per worker, or in the database
+(RATE_LIMIT_BACKEND=database) to be shared by all workers.
+"""
+
+import asyncio
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable
+
+from config import settings
+from models import RateLimitBucket
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from utils.metrics import metrics
+
+# rough length of a token in characters, for costs known before tokenizing
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimated token count of a text, before it is tokenized."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit exceeded, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+@dataclass
+class Reservation:
+    key: str
+    tokens: float
+
+
+class RateLimitBackend(ABC):
+    """Storage of the token buckets."""
+
+    # blocking backends are called off the event loop
+    blocking = False
+
+    @abstractmethod
+    def take(self, key: str, amount: float, capacity: float, rate: float) -> float:
+        """Take `amount` tokens if the bucket holds them: 0, else seconds to wait"""
+
+    @abstractmethod
+    def adjust(self, key: str, delta: float, capacity: float, rate: float):
+        """Give back (positive) or charge (negative) tokens"""
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _refilled(self, key: str, capacity: float, rate: float, now: float) -> float:
+        tokens, updated_at = self._buckets.get(key, (capacity, now))
+        return min(capacity, tokens + max(now - updated_at, 0.0) * rate)
+
+    def take(self, key: str, amount: float, capacity: float, rate: float) -> float:
+        with self._lock:
+            now = self.clock()
+            tokens = self._refilled(key, capacity, rate, now)
+            if tokens < amount:
+                self._buckets[key] = (tokens, now)
+                return (amount - tokens) / rate
+            self._buckets[key] = (tokens - amount, now)
+            return 0.0
+
+    def adjust(self, key: str, delta: float, capacity: float, rate: float):
+        with self._lock:
+            now = self.clock()
+            tokens = min(capacity, self._refilled(key, capacity, rate, now) + delta)
+            self._buckets[key] = (tokens, now)
+
+
+class DatabaseRateLimitBackend(RateLimitBackend):
+    """Buckets in the rate_limit_buckets table, updated under a row lock."""
+
+    blocking = True
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        clock: Callable[[], float] = time.time,
+    ):
+        self.session_factory = session_factory
+        self.clock = clock
+
+    def _run(self, method, key: str, value: float, capacity: float, rate: float):
+        # a worker creating the same new bucket concurrently wins, then retry
+        for attempt in range(2):
+            with self.session_factory() as db:
+                try:
+                    return method(db, key, value, capacity, rate, self.clock())
+                except IntegrityError:
+                    db.rollback()
+                    if attempt:
+                        raise
+
+    def take(self, key: str, amount: float, capacity: float, rate: float) -> float:
+        return self._run(RateLimitBucket.take, key, amount, capacity, rate)
+
+    def adjust(self, key: str, delta: float, capacity: float, rate: float):
+        self._run(RateLimitBucket.adjust, key, delta, capacity, rate)
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        backend: RateLimitBackend,
+        tokens_per_minute: float,
+        burst_tokens: float | None = None,
+    ):
+        self.backend = backend
+        self.rate = tokens_per_minute / 60
+        self.capacity = burst_tokens or tokens_per_minute
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    async def _call(self, method, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def reserve(self, user_id: int, tokens: float) -> Reservation | None:
+        """
+        Take the admission cost of a turn, or raise RateLimitExceeded.
+        None when rate limiting is off.
+        """
+        if not self.enabled:
+            return None
+        key = f"user:{user_id}"
+        # a turn costing more than the burst may still run from a full bucket
+        tokens = min(tokens, self.capacity)
+        wait = await self._call(
+            self.backend.take, key, tokens, self.capacity, self.rate
+        )
+        if wait > 0:
+            metrics.counter("rate_limit.rejected").inc()
+            raise RateLimitExceeded(wait)
+        return Reservation(key, tokens)
+
+    async def settle(self, reservation: Reservation | None, tokens: float):
+        """Charge the real cost of a completed turn against its reservation."""
+        if reservation is None:
+            return
+        metrics.counter("rate_limit.charged_tokens").inc(tokens)
+        delta = reservation.tokens - tokens
+        if delta:
+            await self._call(
+                self.backend.adjust, reservation.key, delta, self.capacity, self.rate
+            )
+
+
+def _backend() -> RateLimitBackend:
+    if settings.RATE_LIMIT_BACKEND == "database":
+        from database.mysql import SessionLocal
+
+        return DatabaseRateLimitBackend(SessionLocal)
+    return InMemoryRateLimitBackend()
+
+
+rate_limiter = RateLimiter(
+    _backend(), settings.RATE_LIMIT_TOKENS_PER_MINUTE, settings.RATE_LIMIT_BURST_TOKENS
+)
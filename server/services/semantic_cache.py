@@ -0,0 +1,260 @@
+"""
+Semantic cache of first-turn replies (opt-in, SEMANTIC_CACHE_ENABLED).
+
+Many first messages are paraphrases of each other ("hi", "hello there").
+The first message of a conversation is embedded, and when a stored message
+with the same model, system prompt and generation parameters is similar
+enough (cosine similarity at least SEMANTIC_CACHE_THRESHOLD), its reply is
+served without running the model.
+
+Embeddings are the mean of the last hidden states over the message tokens,
+from the loaded chat model or, with SEMANTIC_CACHE_ENCODER, from a small
+local encoder. Embedding is a forward pass outside the generation
+scheduler, so lookups embed at most SEMANTIC_CACHE_EMBED_CONCURRENCY
+messages at once and the rest wait. The index is a NumPy matrix of normalized vectors searched
+with one matrix-vector product, bounded by SEMANTIC_CACHE_MAX_ENTRIES:
+expired entries are reused first, then the least recently used.
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+import chat_model_loader
+import numpy as np
+from config import settings
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+INITIAL_CAPACITY = 256
+ENCODER_MAX_TOKENS = 512
+
+
+@dataclass(frozen=True)
+class SemanticHit:
+    reply: str
+    token_ids: tuple[int, ...]
+    similarity: float
+
+
+@dataclass(frozen=True)
+class SemanticLookup:
+    """Result of a lookup; on a miss, the embedding is kept to store the reply."""
+
+    namespace: int
+    embedding: np.ndarray
+    hit: SemanticHit | None
+
+
+def namespace(model_name: str, system_prompt: str, params: dict) -> int:
+    """Prompts with the same model, system prompt and parameters share replies"""
+    material = repr((model_name, system_prompt, sorted(params.items(), key=str)))
+    digest = hashlib.blake2b(material.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+class VectorIndex:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._expires_at[: self._size] > time.time()))
+
+    def clear(self):
+        self._size = 0
+        self._vectors: np.ndarray | None = None
+        self._namespaces = np.zeros(0, dtype=np.int64)
+        self._expires_at = np.zeros(0, dtype=np.float64)
+        self._last_used = np.zeros(0, dtype=np.float64)
+        self._replies: list[tuple[str, tuple[int, ...]] | None] = []
+
+    def search(
+        self, namespace: int, vector: np.ndarray, threshold: float
+    ) -> SemanticHit | None:
+        now = time.time()
+        with self._lock:
+            if self._size == 0 or self._vectors.shape[1] != vector.shape[0]:
+                return None
+            size = self._size
+            scores = self._vectors[:size] @ vector
+            usable = (self._namespaces[:size] == namespace) & (
+                self._expires_at[:size] > now
+            )
+            scores[~usable] = -np.inf
+            slot = int(scores.argmax())
+            if scores[slot] < threshold:
+                return None
+            self._last_used[slot] = now
+            reply, token_ids = self._replies[slot]
+            return SemanticHit(reply, token_ids, float(scores[slot]))
+
+    def add(self, namespace: int, vector: np.ndarray, reply: str, token_ids: list[int]):
+        now = time.time()
+        with self._lock:
+            if self._vectors is not None and self._vectors.shape[1] != vector.shape[0]:
+                # a different encoder, the stored vectors cannot be compared
+                self.clear()
+            slot = self._free_slot(vector.shape[0], now)
+            self._vectors[slot] = vector
+            self._namespaces[slot] = namespace
+            self._expires_at[slot] = now + self.ttl_seconds
+            self._last_used[slot] = now
+            self._replies[slot] = (reply, tuple(token_ids))
+
+    def _free_slot(self, dimension: int, now: float) -> int:
+        expired = np.flatnonzero(self._expires_at[: self._size] <= now)
+        if expired.size:
+            return int(expired[0])
+        if self._size < self.max_entries:
+            if self._vectors is None or self._size == len(self._vectors):
+                self._grow(dimension)
+            self._size += 1
+            return self._size - 1
+        metrics.counter("semantic_cache.evictions").inc()
+        return int(self._last_used[: self._size].argmin())
+
+    def _grow(self, dimension: int):
+        capacity = min(max(2 * self._size, INITIAL_CAPACITY), self.max_entries)
+        vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        if self._vectors is not None:
+            vectors[: self._size] = self._vectors[: self._size]
+        self._vectors = vectors
+        extra = capacity - len(self._namespaces)
+        self._namespaces = np.concatenate([self._namespaces, np.zeros(extra, np.int64)])
+        self._expires_at = np.concatenate([self._expires_at, np.zeros(extra)])
+        self._last_used = np.concatenate([self._last_used, np.zeros(extra)])
+        self._replies.extend([None] * extra)
+
+
+class ModelEmbedder:
+    """
+    Mean-pooled last hidden states of a transformers model. Without a model
+    name, the loaded chat model is used.
+    """
+
+    def __init__(self, model_name: str | None = None):
+        self.model_name = model_name
+        self._model = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not self.model_name:
+            return chat_model_loader.model, chat_model_loader.tokenizer
+        with self._lock:
+            if self._model is None:
+                from transformers import AutoModel, AutoTokenizer
+
+                self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                self._model = AutoModel.from_pretrained(self.model_name).eval()
+        return self._model, self._tokenizer
+
+    def __call__(self, text: str) -> np.ndarray:
+        import torch
+
+        model, tokenizer = self._load()
+        if model is None or tokenizer is None:
+            raise RuntimeError("Embedding model not loaded")
+
+        inputs = tokenizer(
+            [text],
+            return_tensors="pt",
+            truncation=True,
+            max_length=ENCODER_MAX_TOKENS,
+        ).to(model.device)
+        with torch.no_grad():
+            # the base model skips the language modeling head of a chat model
+            hidden = model.base_model(**inputs).last_hidden_state
+        mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1)
+        return pooled[0].float().cpu().numpy()
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        embedder: Callable[[str], np.ndarray],
+        index: VectorIndex,
+        threshold: float,
+        enabled: bool = True,
+        embed_concurrency: int = 1,
+    ):
+        self.embedder = embedder
+        self.index = index
+        self.threshold = threshold
+        self.enabled = enabled
+        self._embedding = asyncio.Semaphore(embed_concurrency)
+        self.hits = 0
+        self.misses = 0
+
+        metrics.gauge("semantic_cache.hit_rate", lambda: self.hit_rate)
+        metrics.gauge("semantic_cache.entries", lambda: len(self.index))
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    async def lookup(self, namespace: int, text: str) -> SemanticLookup | None:
+        """Embed a first message and look for a similar one, None if that fails"""
+        started = time.perf_counter()
+        try:
+            async with self._embedding:
+                lookup = await asyncio.to_thread(self._lookup, namespace, text)
+        except Exception as e:
+            logger.warning(f"Semantic cache embedding failed: {e}")
+            metrics.counter("semantic_cache.errors").inc()
+            return None
+        if lookup is None:
+            return None
+
+        metrics.histogram("semantic_cache.lookup_seconds").observe(
+            time.perf_counter() - started
+        )
+        if lookup.hit is None:
+            self.misses += 1
+            metrics.counter("semantic_cache.misses").inc()
+        else:
+            self.hits += 1
+            metrics.counter("semantic_cache.hits").inc()
+            metrics.histogram("semantic_cache.hit_similarity").observe(
+                lookup.hit.similarity
+            )
+        return lookup
+
+    def _lookup(self, namespace: int, text: str) -> SemanticLookup | None:
+        # in a worker thread: the search of a large index takes milliseconds
+        vector = np.asarray(self.embedder(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        vector /= norm
+        hit = self.index.search(namespace, vector, self.threshold)
+        return SemanticLookup(namespace, vector, hit)
+
+    def add(self, lookup: SemanticLookup, reply: str, token_ids: list[int]):
+        self.index.add(lookup.namespace, lookup.embedding, reply, token_ids)
+
+    def clear(self):
+        self.index.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+semantic_cache = SemanticCache(
+    ModelEmbedder(settings.SEMANTIC_CACHE_ENCODER or None),
+    VectorIndex(
+        settings.SEMANTIC_CACHE_MAX_ENTRIES, settings.SEMANTIC_CACHE_TTL_SECONDS
+    ),
+    settings.SEMANTIC_CACHE_THRESHOLD,
+    enabled=settings.SEMANTIC_CACHE_ENABLED,
+    embed_concurrency=settings.SEMANTIC_CACHE_EMBED_CONCURRENCY,
+)
@@ -0,0 +1,279 @@
+"""
+Move users between conversation shards.
+
+    python -m services.shard_rebalancer move <user_id> <shard>
+    python -m services.shard_rebalancer pin-existing <shard>
+
+`move` copies the conversations and messages of a user to the target shard
+and points the directory at it. Workers keep routing the user to the source
+until their cached shard expires (SHARD_ASSIGNMENT_TTL_SECONDS) and finish
+the requests they routed before, so the move then waits --settle-seconds,
+copies what was written to the source meanwhile and only then deletes the
+source rows. Copying is idempotent, a move interrupted before the directory
+switch can simply be run again.
+
+`pin-existing` records every user without a shard on the given shard, without
+moving data. Run it once when a database that already holds conversations
+becomes a shard.
+"""
+
+import argparse
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from config import settings
+from database.sharding import ShardMap, copy_user_to_shard, shard_map
+from models import Conversation, ConversationArchive, Message, User, UserShard
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from .conversation_cache import conversation_cache
+
+logger = logging.getLogger(__name__)
+
+# Conversations copied per transaction
+REBALANCE_BATCH_SIZE = 100
+
+# Default wait after the directory switch: the cached shard must expire in
+# every worker and requests routed before the switch, generation included,
+# must finish
+DEFAULT_SETTLE_SECONDS = settings.SHARD_ASSIGNMENT_TTL_SECONDS + 120
+
+
+@dataclass
+class RebalanceReport:
+    user_id: int
+    source: str
+    target: str
+    conversations: int = 0
+    messages: int = 0
+
+
+def _copy_conversations(
+    src: Session, dst: Session, conversation_ids: list[int]
+) -> list[int]:
+    """
+    Copy conversations with their messages, replacing leftovers of an
+    interrupted run. Returns the source ids of the copied messages.
+    """
+    conversations = Conversation.__table__
+    messages = Message.__table__
+
+    # archive blobs keep message ids of the source shard, restore them first
+    archived = src.execute(
+        select(conversations.c.id).where(
+            conversations.c.id.in_(conversation_ids), conversations.c.archived.is_(True)
+        )
+    ).scalars()
+    for conversation_id in list(archived):
+        ConversationArchive.restore(src, conversation_id)
+
+    conversation_rows = (
+        src.execute(
+            select(conversations).where(conversations.c.id.in_(conversation_ids))
+        )
+        .mappings()
+        .all()
+    )
+    message_rows = (
+        src.execute(
+            select(messages)
+            .where(messages.c.conversation_id.in_(conversation_ids))
+            .order_by(messages.c.conversation_id, messages.c.created_at, messages.c.id)
+        )
+        .mappings()
+        .all()
+    )
+
+    dst.execute(
+        delete(messages).where(messages.c.conversation_id.in_(conversation_ids))
+    )
+    dst.execute(delete(conversations).where(conversations.c.id.in_(conversation_ids)))
+    dst.execute(insert(conversations), [dict(row) for row in conversation_rows])
+    if message_rows:
+        dst.execute(insert(messages), [_without_id(row) for row in message_rows])
+    dst.commit()
+    return [row["id"] for row in message_rows]
+
+
+def _without_id(row) -> dict:
+    # message ids are per shard, the target assigns new ones in the same order
+    return {name: value for name, value in row.items() if name != "id"}
+
+
+def _copy_new_messages(
+    src: Session, dst: Session, conversation_ids: list[int], copied: set[int]
+) -> int:
+    """Copy the messages stored on the source after their conversation was copied"""
+    messages = Message.__table__
+    rows = [
+        row
+        for row in src.execute(
+            select(messages)
+            .where(messages.c.conversation_id.in_(conversation_ids))
+            .order_by(messages.c.conversation_id, messages.c.created_at, messages.c.id)
+        ).mappings()
+        if row["id"] not in copied
+    ]
+    if not rows:
+        return 0
+    dst.execute(insert(messages), [_without_id(row) for row in rows])
+    # the copied transcripts miss these turns, they are rebuilt from the messages
+    dst.execute(
+        update(Conversation.__table__)
+        .where(Conversation.id.in_({row["conversation_id"] for row in rows}))
+        .values(transcript=None, version=Conversation.version + 1)
+    )
+    dst.commit()
+    return len(rows)
+
+
+def _user_conversation_ids(db: Session, user_id: int) -> list[int]:
+    return list(
+        db.execute(
+            select(Conversation.id)
+            .where(Conversation.user_id == user_id)
+            .order_by(Conversation.id)
+        ).scalars()
+    )
+
+
+def _batches(ids: list[int]):
+    for start in range(0, len(ids), REBALANCE_BATCH_SIZE):
+        yield ids[start : start + REBALANCE_BATCH_SIZE]
+
+
+def rebalance_user(
+    shards: ShardMap,
+    user_id: int,
+    target: str,
+    settle_seconds: float = 0.0,
+    sleep: Callable[[float], None] = time.sleep,
+) -> RebalanceReport:
+    """
+    Move the conversations of a user to the target shard. Writes routed to
+    the source within settle_seconds of the directory switch are carried over.
+    """
+    if target not in shards.names:
+        raise ValueError(f"Unknown shard: {target}")
+
+    with shards.directory_session_factory() as directory:
+        user = directory.get(User, user_id)
+        if user is None:
+            raise ValueError(f"Unknown user: {user_id}")
+
+        source = shards.shard_for_user(directory, user_id)
+        report = RebalanceReport(user_id=user_id, source=source, target=target)
+        if source == target:
+            return report
+
+        src = shards.session_factories[source]()
+        dst = shards.session_factories[target]()
+        try:
+            conversation_ids = _user_conversation_ids(src, user_id)
+
+            copy_user_to_shard(dst, user)
+            copied: set[int] = set()
+            for batch in _batches(conversation_ids):
+                copied.update(_copy_conversations(src, dst, batch))
+
+            UserShard.assign(directory, user_id, target)
+            shards.forget(user_id)
+            sleep(settle_seconds)
+
+            # writes of workers that still routed the user to the source
+            src.expire_all()
+            current_ids = _user_conversation_ids(src, user_id)
+            new_ids = sorted(set(current_ids) - set(conversation_ids))
+            for batch in _batches(new_ids):
+                copied.update(_copy_conversations(src, dst, batch))
+            late_messages = 0
+            for batch in _batches(conversation_ids):
+                late_messages += _copy_new_messages(src, dst, batch, copied)
+            report.conversations = len(current_ids)
+            report.messages = len(copied) + late_messages
+            conversation_ids = current_ids
+
+            for batch in _batches(conversation_ids):
+                src.execute(delete(Message).where(Message.conversation_id.in_(batch)))
+                src.execute(delete(Conversation).where(Conversation.id.in_(batch)))
+                src.commit()
+        finally:
+            src.close()
+            dst.close()
+
+    for conversation_id in conversation_ids:
+        conversation_cache.invalidate(conversation_id)
+
+    logger.info(
+        f"Moved user {user_id} from {source} to {target}: "
+        f"{report.conversations} conversations, {report.messages} messages"
+    )
+    return report
+
+
+def pin_existing_users(shards: ShardMap, shard: str) -> int:
+    """Record every user without a shard on `shard`. Returns the number of users pinned."""
+    if shard not in shards.names:
+        raise ValueError(f"Unknown shard: {shard}")
+
+    with shards.directory_session_factory() as directory:
+        user_ids = list(
+            directory.execute(
+                select(User.id)
+                .outerjoin(UserShard, UserShard.user_id == User.id)
+                .where(UserShard.user_id.is_(None))
+            ).scalars()
+        )
+        if not user_ids:
+            return 0
+
+        with shards.session_factories[shard]() as db:
+            for user_id in user_ids:
+                copy_user_to_shard(db, directory.get(User, user_id))
+        directory.execute(
+            insert(UserShard),
+            [{"user_id": user_id, "shard": shard} for user_id in user_ids],
+        )
+        directory.commit()
+    return len(user_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    move = commands.add_parser("move", help="move a user to another shard")
+    move.add_argument("user_id", type=int)
+    move.add_argument("shard")
+    move.add_argument(
+        "--settle-seconds",
+        type=float,
+        default=DEFAULT_SETTLE_SECONDS,
+        help="wait after the directory switch before deleting the source rows",
+    )
+    pin = commands.add_parser("pin-existing", help="place unassigned users on a shard")
+    pin.add_argument("shard")
+    args = parser.parse_args()
+
+    if not shard_map.sharded:
+        parser.error("SHARD_DATABASE_URLS is not configured")
+
+    if args.command == "move":
+        report = rebalance_user(
+            shard_map, args.user_id, args.shard, args.settle_seconds
+        )
+        print(
+            f"user {report.user_id}: {report.source} -> {report.target}, "
+            f"{report.conversations} conversations, {report.messages} messages"
+        )
+    else:
+        print(
+            f"pinned {pin_existing_users(shard_map, args.shard)} users to {args.shard}"
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
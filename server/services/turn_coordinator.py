@@ -0,0 +1,85 @@
+"""
+Ordering and de-duplication of chat turns.
+
+Turns of one conversation run one after the other: each reads the history
+the previous one wrote, and their messages are never interleaved. A turn
+submitted again while the same turn is still in flight (same user,
+conversation, prompt and message, e.g. a double click or a client retry)
+does not generate again: it waits for the running job and gets its result.
+
+Both are per process, like the conversation cache. Several workers need
+sticky routing by conversation to keep these guarantees.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from utils.metrics import metrics
+from utils.single_flight import FlightCancelled, SingleFlight
+
+T = TypeVar("T")
+
+
+class _ConversationLock:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class TurnCoordinator:
+    def __init__(self):
+        self._locks: dict[int, _ConversationLock] = {}
+        self._flights = SingleFlight()
+        metrics.gauge("chat_turns.in_flight", lambda: len(self._flights))
+
+    @asynccontextmanager
+    async def conversation_lock(self, conversation_id: int | None):
+        """Hold the turn slot of a conversation. New conversations have none."""
+        if conversation_id is None:
+            yield
+            return
+
+        entry = self._locks.setdefault(conversation_id, _ConversationLock())
+        entry.users += 1
+        started = time.perf_counter()
+        try:
+            async with entry.lock:
+                metrics.histogram("chat_turns.queue_seconds").observe(
+                    time.perf_counter() - started
+                )
+                yield
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                del self._locks[conversation_id]
+
+    async def run(
+        self,
+        key: Hashable,
+        conversation_id: int | None,
+        turn: Callable[[], Awaitable[T]],
+    ) -> T:
+        """
+        Run a turn after the earlier turns of its conversation, or wait for
+        the in-flight turn with the same key and return its result.
+        """
+        while (flight := self._flights.get(key)) is not None:
+            metrics.counter("chat_turns.deduplicated").inc()
+            try:
+                return await self._flights.join(flight)
+            except FlightCancelled:
+                pass  # the job we attached to was cancelled, run the turn ourselves
+
+        async def locked_turn() -> T:
+            async with self.conversation_lock(conversation_id):
+                return await turn()
+
+        return await self._flights.run(key, locked_turn)
+
+    def is_busy(self, conversation_id: int) -> bool:
+        return conversation_id in self._locks
+
+
+turn_coordinator = TurnCoordinator()
@@ -31,5 +31,14 @@ else
     exit 1
 fi
 
+# migrate every conversation shard, see SHARD_DATABASE_URLS
+for shard in $(uv run python -c "from config import settings; print(' '.join(settings.SHARD_DATABASE_URLS))"); do
+    echo "Running database migrations on shard ${shard}..."
+    if ! uv run alembic -x shard="${shard}" upgrade head; then
+        echo "Database migrations failed on shard ${shard}!"
+        exit 1
+    fi
+done
+
 echo "Starting FastAPI server..."
 exec uv run uvicorn main:app --host 0.0.0.0 --port 8000 --reload
@@ -9,34 +9,65 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import pytest
+import pytest_asyncio
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from models.base import Base
 from routers import user_router
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
 
-@pytest.fixture
-def db_engine():
-    """Create a test database engine using SQLite in memory with thread safety."""
-    engine = create_engine(
-        "sqlite:///:memory:",
-        echo=False,
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
-    
-    # Enable foreign key constraints for SQLite
-    from sqlalchemy import event
+def _enable_sqlite_foreign_keys(engine):
+    """Enable foreign key constraints for SQLite"""
+
     @event.listens_for(engine, "connect")
     def set_sqlite_pragma(dbapi_connection, connection_record):
         cursor = dbapi_connection.cursor()
         cursor.execute("PRAGMA foreign_keys=ON")
         cursor.close()
-    
+
+
+@pytest.fixture(autouse=True)
+def clear_conversation_cache():
+    """Every test starts with its own database, so cached histories must not leak."""
+    from services.conversation_cache import conversation_cache
+
+    conversation_cache.clear()
+    yield
+    conversation_cache.clear()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """SQLite file shared by the sync and the async test engines."""
+    return tmp_path / "test.db"
+
+
+@pytest.fixture
+def db_engine(db_path):
+    """Create a test database engine using a temporary SQLite file with thread safety."""
+    engine = create_engine(
+        f"sqlite:///{db_path}",
+        echo=False,
+        connect_args={"check_same_thread": False},
+    )
+    _enable_sqlite_foreign_keys(engine)
+
     Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def async_db_engine(db_engine, db_path):
+    """Create an aiosqlite engine on the same database as db_engine."""
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{db_path}", echo=False, poolclass=NullPool
+    )
+    _enable_sqlite_foreign_keys(engine.sync_engine)
     return engine
 
 
@@ -52,8 +83,18 @@ def db_session(db_engine):
         session.close()
 
 
+@pytest_asyncio.fixture
+async def async_db_session(async_db_engine):
+    """Create an async database session for testing."""
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_db_engine, expire_on_commit=False
+    )
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
 @pytest.fixture
-def test_app(db_session):
+def test_app(db_session, async_db_engine):
     """Create a test FastAPI app with database dependency override."""
     app = FastAPI(title="Test App")
 
@@ -63,10 +104,19 @@ def test_app(db_session):
         finally:
             pass
 
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_db_engine, expire_on_commit=False
+    )
+
+    async def override_get_async_db():
+        async with AsyncSessionLocal() as session:
+            yield session
+
     # Import and override the dependency
-    from database import get_mysql_db
+    from database import get_async_mysql_db, get_mysql_db
 
     app.dependency_overrides[get_mysql_db] = override_get_db
+    app.dependency_overrides[get_async_mysql_db] = override_get_async_db
 
     # Add routers
     from fastapi import APIRouter
@@ -83,3 +133,43 @@ def client(test_app):
     """Create a test client."""
     with TestClient(test_app) as test_client:
         yield test_client
+
+
+@pytest.fixture
+def users(db_session):
+    """Create two users, the owner of the test data and another one."""
+    from models.user import User
+
+    owner = User(id=1, username="owner", email="owner@example.com", password_hash="hashed")
+    other = User(id=2, username="other", email="other@example.com", password_hash="hashed")
+    db_session.add_all([owner, other])
+    db_session.commit()
+    return owner, other
+
+
+@pytest.fixture
+def make_conversation_client():
+    """Create test clients of the conversation router, reading from a given session."""
+    from contextlib import ExitStack
+
+    from fastapi import APIRouter
+    from database import get_mysql_db
+    from routers import conversation_router
+
+    with ExitStack() as stack:
+
+        def make(session):
+            app = FastAPI(title="Test App")
+            app.dependency_overrides[get_mysql_db] = lambda: session
+            api_router = APIRouter(prefix="/api")
+            api_router.include_router(conversation_router)
+            app.include_router(api_router)
+            return stack.enter_context(TestClient(app))
+
+        yield make
+
+
+@pytest.fixture
+def conversation_client(db_session, make_conversation_client):
+    """Create a test client of the conversation router on the test database."""
+    return make_conversation_client(db_session)
@@ -0,0 +1,125 @@
+"""
+Test cases for admission control of chat turns.
+"""
+
+import asyncio
+import time
+
+import pytest
+import pytest_asyncio
+from services.admission_controller import AdmissionController, DeadlineExceeded, Overloaded
+from services.generation_scheduler import FIFOPolicy, GenerationScheduler
+
+
+@pytest.fixture
+def scheduler():
+    return GenerationScheduler(FIFOPolicy())
+
+
+@pytest_asyncio.fixture
+async def load(scheduler):
+    """Hold the scheduler's slot and queue a number of jobs behind it"""
+    waiting = []
+
+    async def load(queued: int):
+        await scheduler.acquire(1, 10)
+        waiting.extend(
+            asyncio.create_task(scheduler.acquire(1, 10)) for _ in range(queued)
+        )
+        await asyncio.sleep(0)
+
+    yield load
+    for task in waiting:
+        task.cancel()
+
+
+@pytest.fixture
+def controller(scheduler):
+    # replies of 100 tokens at 100 tokens a second: 1s a job
+    controller = AdmissionController(scheduler, wait_slo_seconds=2, reject_factor=2)
+    controller.observe(100, 1.0)
+    return controller
+
+
+class TestEstimatedWait:
+    """Test the wait estimate from the queue and the generation speed."""
+
+    def test_idle(self, controller):
+        """Test a turn waits nothing while a slot is free."""
+        assert controller.estimated_wait() == 0
+
+    def test_unknown_speed(self, scheduler):
+        """Test nothing is estimated before a generation was observed."""
+        assert AdmissionController(scheduler, wait_slo_seconds=2).estimated_wait() == 0
+
+    @pytest.mark.asyncio
+    async def test_queued_jobs(self, controller, load):
+        """Test the wait is the rest of the running job plus each queued job."""
+        await load(3)
+
+        assert controller.estimated_wait() == pytest.approx(4.0, abs=0.1)
+
+    @pytest.mark.asyncio
+    async def test_concurrency(self, controller, scheduler, load):
+        """Test the wait is shared among the scheduler's slots."""
+        scheduler.concurrency = 2
+        await scheduler.acquire(1, 10)
+        await load(2)
+
+        assert controller.estimated_wait() == pytest.approx(2.0, abs=0.1)
+
+    def test_moving_average(self, controller):
+        """Test the speed follows new generations without jumping to them."""
+        controller.observe(100, 0.5)
+
+        assert 100 < controller.tokens_per_second < 200
+
+
+class TestAdmit:
+    """Test turns are admitted, shortened or rejected by the estimated wait."""
+
+    @pytest.mark.asyncio
+    async def test_admitted(self, controller, load):
+        """Test a turn within the SLO keeps its max_new_tokens."""
+        await load(0)
+
+        assert controller.admit(512) == 512
+
+    @pytest.mark.asyncio
+    async def test_degraded(self, controller, load):
+        """Test a turn above the SLO generates half as many tokens."""
+        await load(2)
+
+        assert controller.admit(512) == 256
+        controller.degraded_max_new_tokens = 64
+        assert controller.admit(512) == 64
+
+    @pytest.mark.asyncio
+    async def test_rejected(self, controller, load):
+        """Test a turn above the reject factor is rejected with the estimated wait."""
+        await load(5)
+
+        with pytest.raises(Overloaded) as raised:
+            controller.admit(512)
+        assert raised.value.retry_after == pytest.approx(6.0, abs=0.1)
+
+    @pytest.mark.asyncio
+    async def test_disabled(self, scheduler, load):
+        """Test every turn is admitted in full without an SLO."""
+        controller = AdmissionController(scheduler, wait_slo_seconds=0)
+        controller.observe(1, 100.0)
+        await load(50)
+
+        assert controller.admit(512) == 512
+
+    @pytest.mark.asyncio
+    async def test_deadline(self, scheduler, load):
+        """Test a turn is rejected when its wait outlasts its deadline, even without an SLO."""
+        controller = AdmissionController(scheduler, wait_slo_seconds=0)
+        controller.observe(100, 1.0)
+
+        assert controller.admit(512, time.monotonic() + 1) == 512
+        await load(2)
+        assert controller.admit(512, time.monotonic() + 10) == 512
+        with pytest.raises(DeadlineExceeded):
+            controller.admit(512, time.monotonic() + 2)
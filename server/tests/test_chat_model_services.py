@@ -12,6 +12,8 @@ from models.conversation import Conversation
 from models.message import Message, SenderType
 from models.user import User
 from services.chat_model_services import get_conversation_from_request, _generate_conversation_history, generate_prompt
+from services.chat_model_services import get_conversation_from_request_async, store_request_and_response_messages_async
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 class TestGetConversationFromRequest:
@@ -915,3 +917,71 @@ class TestGeneratePrompt:
         ]
         
         assert result == expected
+
+
+class TestAsyncConversationServices:
+    """Test the async service variants used by the event-loop routes."""
+
+    def _create_dummy_user(self, db_session: Session) -> User:
+        """Helper method to create a user with DUMMY_USER_ID."""
+        test_user = User(
+            id=1,
+            username="testuser",
+            email="test@example.com",
+            password_hash="hashed_password"
+        )
+        db_session.add(test_user)
+        db_session.commit()
+        return test_user
+
+    @pytest.mark.asyncio
+    async def test_create_new_conversation_async(self, db_session: Session, async_db_session: AsyncSession):
+        """Test a new conversation is created with an empty, already loaded message list."""
+        self._create_dummy_user(db_session)
+
+        chat_request = ChatRequest(
+            messages=[ChatMessage(role=ChatRole.USER, content="Hello async")]
+        )
+
+        conversation = await get_conversation_from_request_async(chat_request, async_db_session)
+
+        assert conversation.id is not None
+        assert conversation.title == "Hello async"
+        assert conversation.prompt == "You are a helpful and friendly assistant."
+        assert len(conversation.messages) == 0
+        assert generate_prompt(conversation, "Hi")[-1] == {"role": "user", "content": "Hi"}
+
+    @pytest.mark.asyncio
+    async def test_store_and_reload_messages_async(self, db_session: Session, async_db_session: AsyncSession):
+        """Test stored messages come back in order through the async loader."""
+        self._create_dummy_user(db_session)
+        conversation = Conversation.create_conversation(db_session, 1, "Title", "Prompt")
+
+        await store_request_and_response_messages_async(
+            async_db_session, conversation.id, "Question", "Answer"
+        )
+        async_db_session.expunge_all()
+
+        chat_request = ChatRequest(
+            conversation_id=conversation.id,
+            messages=[ChatMessage(role=ChatRole.USER, content="Next")]
+        )
+        loaded = await get_conversation_from_request_async(chat_request, async_db_session)
+
+        assert [m.content for m in loaded.messages] == ["Question", "Answer"]
+        assert [m.sent_by for m in loaded.messages] == [SenderType.USER, SenderType.ASSISTANT]
+
+        # Rows written through the async engine are visible to the sync session
+        assert db_session.query(Message).filter(
+            Message.conversation_id == conversation.id
+        ).count() == 2
+
+    @pytest.mark.asyncio
+    async def test_nonexistent_conversation_id_returns_none_async(self, async_db_session: AsyncSession):
+        """Test that a missing conversation id returns None."""
+        chat_request = ChatRequest(
+            conversation_id=99999,
+            messages=[ChatMessage(role=ChatRole.USER, content="Hello")]
+        )
+
+        assert await get_conversation_from_request_async(chat_request, async_db_session) is None
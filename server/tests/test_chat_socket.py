@@ -0,0 +1,264 @@
+"""
+Test cases for the chat WebSocket and the chat turn shared with POST /chat.
+
+The chat model is not loaded in tests, generation is replaced by a fake that
+streams the words of a canned reply.
+"""
+
+import time
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from models.conversation import Conversation
+from models.message import Message
+from models.user import User
+from services import chat_model_services
+from services.idempotency import idempotency_store
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+
+@pytest.fixture
+def fake_generation(monkeypatch):
+    """Replies "Reply to <message>", streamed word by word"""
+    prompts = []
+
+    async def generate_reply(complete_prompt, on_text=None, user_id=None, usage=None, max_new_tokens=None, deadline=None):
+        prompts.append(complete_prompt)
+        reply = f"Reply to {complete_prompt[-1]['content']}"
+        if on_text is not None:
+            for word in reply.split(" "):
+                await on_text(word + " ")
+        return reply, [1, 2, 3]
+
+    monkeypatch.setattr(chat_model_services, "generate_reply", generate_reply)
+    return prompts
+
+
+@pytest.fixture
+def user(db_session: Session):
+    user = User(id=1, username="testuser", email="test@example.com", password_hash="hashed")
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+@pytest.fixture
+def client(db_session, async_db_engine):
+    from database import get_async_mysql_db
+    from routers import chat_model_router
+
+    session_factory = async_sessionmaker(bind=async_db_engine, expire_on_commit=False)
+    sessions = []
+
+    async def override_get_async_db():
+        async with session_factory() as session:
+            sessions.append(session)
+            yield session
+
+    app = FastAPI()
+    app.dependency_overrides[get_async_mysql_db] = override_get_async_db
+    api_router = APIRouter(prefix="/api")
+    api_router.include_router(chat_model_router)
+    app.include_router(api_router)
+    with TestClient(app) as test_client:
+        test_client.sessions = sessions
+        yield test_client
+
+
+def _turn(turn_id: str, content: str, conversation_id: int | None = None) -> dict:
+    return {
+        "type": "turn",
+        "turn_id": turn_id,
+        "conversation_id": conversation_id,
+        "messages": [{"role": "user", "content": content}],
+    }
+
+
+def _receive_turn(websocket) -> tuple[str, dict]:
+    """Streamed text of a turn and its final event"""
+    text = ""
+    while True:
+        event = websocket.receive_json()
+        if event["type"] != "token":
+            return text, event
+        text += event["text"]
+
+
+class TestChatSocket:
+    """Test the /api/ws/chat endpoint."""
+
+    def test_turns_for_several_conversations(self, client, db_session, user, fake_generation):
+        """Test one socket streams and stores turns of a new and an existing conversation."""
+        existing = Conversation.create_conversation(db_session, user.id, "Existing", "Prompt")
+        Conversation.append_turn(db_session, existing.id, "Earlier", "Earlier reply")
+
+        with client.websocket_connect("/api/ws/chat") as websocket:
+            websocket.send_json(_turn("t1", "Hello"))
+            websocket.send_json(_turn("t2", "Again", existing.id))
+            first_text, first = _receive_turn(websocket)
+            second_text, second = _receive_turn(websocket)
+
+        assert first == {
+            "type": "done", "turn_id": "t1", "conversation_id": first["conversation_id"], "messages": "Reply to Hello",
+            "truncated": False,
+        }
+        assert first_text.strip() == "Reply to Hello"
+        assert (second["turn_id"], second["conversation_id"]) == ("t2", existing.id)
+        assert second_text.strip() == "Reply to Again"
+        # the history of the existing conversation went into its prompt
+        assert [m["content"] for m in fake_generation[1][1:]] == ["Earlier", "Earlier reply", "Again"]
+        # one session for the whole connection
+        assert len(client.sessions) == 1
+
+        db_session.expire_all()
+        created = Conversation.get_by_id(db_session, first["conversation_id"], with_messages=True)
+        assert [m.content for m in created.messages] == ["Hello", "Reply to Hello"]
+        assert len(Conversation.get_by_id(db_session, existing.id, with_messages=True).messages) == 4
+
+    def test_ping(self, client, user):
+        """Test a ping is answered with a pong."""
+        with client.websocket_connect("/api/ws/chat") as websocket:
+            websocket.send_json({"type": "ping"})
+            assert websocket.receive_json() == {"type": "pong"}
+
+    def test_invalid_events_keep_the_socket_open(self, client, user, fake_generation):
+        """Test invalid turns and unknown events get an error event, later turns still run."""
+        with client.websocket_connect("/api/ws/chat") as websocket:
+            websocket.send_json({"type": "turn", "turn_id": "bad", "messages": []})
+            invalid = websocket.receive_json()
+            websocket.send_json({"type": "unknown"})
+            unknown = websocket.receive_json()
+            websocket.send_json(_turn("good", "Hello"))
+            _, done = _receive_turn(websocket)
+
+        assert (invalid["type"], invalid["turn_id"]) == ("error", "bad")
+        assert unknown["type"] == "error"
+        assert (done["type"], done["turn_id"]) == ("done", "good")
+
+    def test_model_not_loaded(self, client, user):
+        """Test a turn without a loaded model ends with an error event."""
+        with client.websocket_connect("/api/ws/chat") as websocket:
+            websocket.send_json(_turn("t1", "Hello"))
+            event = websocket.receive_json()
+
+        assert event["type"] == "error"
+        assert event["turn_id"] == "t1"
+        assert "not loaded" in event["detail"]
+
+
+class TestChatEndpoint:
+    """Test POST /api/chat runs the shared chat turn."""
+
+    @pytest.fixture
+    def loaded_model(self, monkeypatch):
+        import chat_model_loader
+
+        monkeypatch.setattr(chat_model_loader, "model", object())
+        monkeypatch.setattr(chat_model_loader, "tokenizer", object())
+        yield
+        idempotency_store.clear()
+
+    def test_chat_turn_is_stored(self, client, db_session, user, fake_generation, loaded_model):
+        """Test a POST replies with the generated text and stores the turn."""
+        response = client.post("/api/chat", json={"messages": [{"role": "user", "content": "Hello"}]})
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body["messages"] == "Reply to Hello"
+        conversation = Conversation.get_by_id(db_session, body["conversation_id"], with_messages=True)
+        assert [m.content for m in conversation.messages] == ["Hello", "Reply to Hello"]
+
+    def test_idempotent_retry(self, client, db_session, user, fake_generation, loaded_model):
+        """Test a retry with the same Idempotency-Key replays the reply without a new turn."""
+        request = {"messages": [{"role": "user", "content": "Hello"}]}
+        headers = {"Idempotency-Key": "retry-1"}
+
+        first = client.post("/api/chat", json=request, headers=headers)
+        retry = client.post("/api/chat", json=request, headers=headers)
+
+        assert first.status_code == retry.status_code == 200
+        assert "idempotent-replayed" not in first.headers
+        assert retry.headers["idempotent-replayed"] == "true"
+        assert retry.json() == first.json()
+        assert len(fake_generation) == 1
+        conversation = Conversation.get_by_id(db_session, first.json()["conversation_id"], with_messages=True)
+        assert len(conversation.messages) == 2
+
+    def test_idempotency_key_reused_for_another_request(self, client, user, fake_generation, loaded_model):
+        """Test a key sent again with a different request is rejected with 422."""
+        headers = {"Idempotency-Key": "retry-2"}
+
+        client.post("/api/chat", json={"messages": [{"role": "user", "content": "Hello"}]}, headers=headers)
+        response = client.post("/api/chat", json={"messages": [{"role": "user", "content": "Bye"}]}, headers=headers)
+
+        assert response.status_code == 422
+        assert len(fake_generation) == 1
+
+    def test_rate_limited_turn(self, client, user, fake_generation, loaded_model, monkeypatch):
+        """Test a rejected turn answers 429 with Retry-After and does not run."""
+        from services.rate_limiter import RateLimitExceeded
+
+        async def reserve(user_id, tokens):
+            raise RateLimitExceeded(2.5)
+
+        monkeypatch.setattr(chat_model_services.rate_limiter, "reserve", reserve)
+
+        response = client.post("/api/chat", json={"messages": [{"role": "user", "content": "Hello"}]})
+
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "3"
+        assert fake_generation == []
+
+    def test_overloaded_turn(self, client, db_session, user, loaded_model, monkeypatch):
+        """Test a turn shed by admission control answers 503 with Retry-After and stores nothing."""
+        from services.admission_controller import Overloaded
+
+        async def generate_reply(complete_prompt, on_text=None, user_id=None, usage=None, max_new_tokens=None, deadline=None):
+            raise Overloaded(4.2)
+
+        monkeypatch.setattr(chat_model_services, "generate_reply", generate_reply)
+
+        response = client.post("/api/chat", json={"messages": [{"role": "user", "content": "Hello"}]})
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "5"
+        assert db_session.query(Message).count() == 0
+
+    def test_request_timeout_truncates_reply(self, client, db_session, user, loaded_model, monkeypatch):
+        """Test Request-Timeout reaches generation and a partial reply is returned marked truncated."""
+        deadlines = []
+
+        async def generate_reply(complete_prompt, on_text=None, user_id=None, usage=None, max_new_tokens=None, deadline=None):
+            deadlines.append(deadline - time.monotonic())
+            usage.truncated = True
+            return "Partial", [1]
+
+        monkeypatch.setattr(chat_model_services, "generate_reply", generate_reply)
+
+        response = client.post(
+            "/api/chat", json={"messages": [{"role": "user", "content": "Hello"}]}, headers={"Request-Timeout": "30"}
+        )
+
+        assert response.status_code == 200
+        assert response.json()["truncated"] is True
+        assert 0 < deadlines[0] <= 30
+        conversation = Conversation.get_by_id(db_session, response.json()["conversation_id"], with_messages=True)
+        assert [m.content for m in conversation.messages] == ["Hello", "Partial"]
+
+    def test_request_timeout_rejected_at_admission(self, client, db_session, user, loaded_model, monkeypatch):
+        """Test a turn that would wait past its Request-Timeout answers 504 and stores nothing."""
+        from services.admission_controller import DeadlineExceeded
+
+        async def generate_reply(complete_prompt, on_text=None, user_id=None, usage=None, max_new_tokens=None, deadline=None):
+            raise DeadlineExceeded()
+
+        monkeypatch.setattr(chat_model_services, "generate_reply", generate_reply)
+
+        response = client.post(
+            "/api/chat", json={"messages": [{"role": "user", "content": "Hello"}]}, headers={"Request-Timeout": "2"}
+        )
+
+        assert response.status_code == 504
+        assert db_session.query(Message).count() == 0
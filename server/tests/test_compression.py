@@ -0,0 +1,135 @@
+"""
+Test cases for the response compression middleware.
+
+Bodies are read raw from the test client, which would otherwise decode them.
+"""
+
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+from utils.compression import CompressionMiddleware, choose_encoding, decompress
+
+LISTING = [{"conversation_id": i, "title": f"Conversation {i}", "messages": ["hello"] * 20} for i in range(50)]
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, encodings=["zstd", "br", "gzip"], minimum_size=1024)
+
+    @app.get("/listing")
+    def listing():
+        return JSONResponse(LISTING)
+
+    @app.get("/small")
+    def small():
+        return JSONResponse({"ok": True})
+
+    @app.get("/stream")
+    def stream():
+        def pieces():
+            for item in LISTING:
+                yield (json.dumps(item) + "\n").encode("utf-8")
+
+        return StreamingResponse(pieces(), media_type="application/x-ndjson")
+
+    @app.get("/image")
+    def image():
+        return Response(b"\x89PNG" * 1024, media_type="image/png")
+
+    @app.get("/encoded")
+    def encoded():
+        body = json.dumps(LISTING).encode("utf-8")
+        return Response(body, media_type="application/json", headers={"Content-Encoding": "identity"})
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def _get_raw(client: TestClient, url: str, accept_encoding: str):
+    with client.stream("GET", url, headers={"Accept-Encoding": accept_encoding}) as response:
+        return response, b"".join(response.iter_raw())
+
+
+class TestChooseEncoding:
+    """Test Accept-Encoding negotiation."""
+
+    def test_preference_breaks_ties(self):
+        """Test the configured order decides between equally accepted encodings."""
+        assert choose_encoding("gzip, br, zstd", ["zstd", "br", "gzip"]) == "zstd"
+        assert choose_encoding("gzip, br", ["zstd", "br", "gzip"]) == "br"
+
+    def test_q_values(self):
+        """Test higher q-values win and q=0 refuses an encoding."""
+        assert choose_encoding("br;q=0.5, gzip", ["br", "gzip"]) == "gzip"
+        assert choose_encoding("gzip;q=0, br;q=0", ["br", "gzip"]) is None
+        assert choose_encoding("*;q=0.1, br;q=0", ["br", "gzip"]) == "gzip"
+
+    def test_no_accepted_encoding(self):
+        """Test identity is used without Accept-Encoding or with unknown encodings."""
+        assert choose_encoding("", ["gzip"]) is None
+        assert choose_encoding("deflate", ["gzip"]) is None
+
+
+class TestCompressionMiddleware:
+    """Test responses are compressed as negotiated."""
+
+    def test_gzip_response(self, client):
+        """Test a large JSON response is gzipped, smaller, and decodes to the same body."""
+        response, raw = _get_raw(client, "/listing", "gzip")
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert "accept-encoding" in response.headers["vary"].lower()
+        assert int(response.headers["content-length"]) == len(raw)
+        body = decompress(raw, "gzip")
+        assert json.loads(body) == LISTING
+        assert len(raw) < len(body) / 5
+
+    def test_small_response_is_not_compressed(self, client):
+        """Test bodies under the minimum size go out as they are."""
+        response, raw = _get_raw(client, "/small", "gzip")
+
+        assert "content-encoding" not in response.headers
+        assert json.loads(raw) == {"ok": True}
+
+    def test_identity_without_accept_encoding(self, client):
+        """Test a client that accepts no encoding gets the plain body."""
+        response, raw = _get_raw(client, "/listing", "identity")
+
+        assert "content-encoding" not in response.headers
+        assert json.loads(raw) == LISTING
+
+    def test_streamed_response_is_compressed(self, client):
+        """Test a streamed response is compressed without a content length and decodes fully."""
+        response, raw = _get_raw(client, "/stream", "gzip")
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        lines = decompress(raw, "gzip").decode("utf-8").splitlines()
+        assert [json.loads(line) for line in lines] == LISTING
+
+    @pytest.mark.parametrize("encoding,module", [("br", "brotli"), ("zstd", "zstandard")])
+    def test_optional_encodings(self, client, encoding, module):
+        """Test brotli and zstd, whole and streamed, when their packages are installed."""
+        pytest.importorskip(module)
+
+        response, raw = _get_raw(client, "/listing", encoding)
+        assert response.headers["content-encoding"] == encoding
+        assert json.loads(decompress(raw, encoding)) == LISTING
+
+        response, raw = _get_raw(client, "/stream", encoding)
+        assert response.headers["content-encoding"] == encoding
+        assert len(decompress(raw, encoding).splitlines()) == len(LISTING)
+
+    def test_excluded_and_encoded_responses_pass_through(self, client):
+        """Test excluded content types and bodies that already have an encoding are not touched."""
+        response, raw = _get_raw(client, "/image", "gzip")
+        assert "content-encoding" not in response.headers
+        assert raw == b"\x89PNG" * 1024
+
+        response, raw = _get_raw(client, "/encoded", "gzip")
+        assert response.headers["content-encoding"] == "identity"
+        assert json.loads(raw) == LISTING
@@ -0,0 +1,143 @@
+"""
+Test cases for archiving cold conversations and rehydrating them on access.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from models.conversation import Conversation
+from models.conversation_archive import ConversationArchive
+from models.message import Message, SenderType
+from models.user import User
+from services.archiver import archive_cold_conversations
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+OLD = datetime.now(timezone.utc) - timedelta(days=90)
+
+
+def _create_conversation(db_session: Session, created_at: datetime, messages: int) -> Conversation:
+    user = db_session.query(User).first()
+    if user is None:
+        user = User(username="testuser", email="test@example.com", password_hash="hashed_password")
+        db_session.add(user)
+        db_session.commit()
+
+    conversation = Conversation(user_id=user.id, title="Title", prompt="Prompt", created_at=created_at)
+    db_session.add(conversation)
+    db_session.commit()
+    for i in range(messages):
+        db_session.add(
+            Message(
+                conversation_id=conversation.id,
+                sent_by=SenderType.USER if i % 2 == 0 else SenderType.ASSISTANT,
+                content=f"Message {i} " + "repetitive text " * 20,
+                created_at=created_at + timedelta(minutes=i),
+            )
+        )
+    db_session.commit()
+    return conversation
+
+
+class TestArchiveColdConversations:
+    """Test selection and compression of cold conversations."""
+
+    def test_only_inactive_conversations_are_archived(self, db_session: Session):
+        """Test a conversation is archived only when all its activity is older than the cutoff."""
+        cold = _create_conversation(db_session, OLD, messages=4)
+        recent = _create_conversation(db_session, datetime.now(timezone.utc), messages=2)
+        old_but_active = _create_conversation(db_session, OLD, messages=1)
+        Message.create_message(db_session, old_but_active.id, SenderType.USER, "still chatting")
+
+        report = archive_cold_conversations(db_session, older_than_days=30, batch_size=10)
+
+        assert report.conversations == 1
+        assert report.messages == 4
+        assert report.compressed_bytes < report.raw_bytes
+        assert report.space_saving > 0.5
+
+        db_session.expire_all()
+        assert db_session.get(Conversation, cold.id).archived is True
+        assert db_session.get(Conversation, recent.id).archived is False
+        assert db_session.get(Conversation, old_but_active.id).archived is False
+        assert db_session.query(Message).filter(Message.conversation_id == cold.id).count() == 0
+        assert db_session.get(ConversationArchive, cold.id).message_count == 4
+
+    def test_batch_size_limits_one_run(self, db_session: Session):
+        """Test one run archives at most batch_size conversations."""
+        for _ in range(3):
+            _create_conversation(db_session, OLD, messages=1)
+
+        assert archive_cold_conversations(db_session, 30, batch_size=2).conversations == 2
+        assert archive_cold_conversations(db_session, 30, batch_size=2).conversations == 1
+        assert archive_cold_conversations(db_session, 30, batch_size=2).conversations == 0
+
+    def test_message_stored_while_archiving_is_kept(self, db_session: Session, db_engine, monkeypatch):
+        """Test a message committed by another writer while archiving is neither lost nor archived."""
+        conversation = _create_conversation(db_session, OLD, messages=2)
+        encode_messages = ConversationArchive.encode_messages
+
+        def encode_during_write(rows):
+            with db_engine.begin() as connection:
+                connection.execute(
+                    insert(Message).values(conversation_id=conversation.id, sent_by=SenderType.USER, content="late")
+                )
+            return encode_messages(rows)
+
+        monkeypatch.setattr(ConversationArchive, "encode_messages", staticmethod(encode_during_write))
+
+        assert ConversationArchive.archive(db_session, conversation) is None
+
+        db_session.expire_all()
+        assert db_session.get(Conversation, conversation.id).archived is False
+        assert db_session.get(ConversationArchive, conversation.id) is None
+        contents = [m.content for m in db_session.query(Message).filter(Message.conversation_id == conversation.id)]
+        assert len(contents) == 3
+        assert "late" in contents
+
+
+class TestRehydrateOnAccess:
+    """Test archived conversations come back to hot storage when read."""
+
+    def test_get_by_id_rehydrates_messages(self, db_session: Session):
+        """Test get_by_id restores the messages with their ids and order."""
+        conversation = _create_conversation(db_session, OLD, messages=5)
+        original = [(m.id, m.sent_by, m.content) for m in conversation.messages]
+        archive_cold_conversations(db_session, 30, 10)
+
+        restored = Conversation.get_by_id(db_session, conversation.id, with_messages=True)
+
+        assert restored.archived is False
+        assert [(m.id, m.sent_by, m.content) for m in restored.messages] == original
+        assert db_session.get(ConversationArchive, conversation.id) is None
+
+    def test_rehydrated_conversation_is_not_archived_again_immediately(self, db_session: Session):
+        """Test access counts as activity for the next archiver run."""
+        conversation = _create_conversation(db_session, OLD, messages=2)
+        archive_cold_conversations(db_session, 30, 10)
+        Conversation.get_by_id(db_session, conversation.id)
+
+        assert archive_cold_conversations(db_session, 30, 10).conversations == 0
+
+    @pytest.mark.asyncio
+    async def test_get_by_id_async_rehydrates_messages(self, db_session: Session, async_db_session):
+        """Test the async loader used by the chat route restores archived messages too."""
+        conversation = _create_conversation(db_session, OLD, messages=3)
+        archive_cold_conversations(db_session, 30, 10)
+
+        restored = await Conversation.get_by_id_async(async_db_session, conversation.id, with_messages=True)
+
+        assert restored.archived is False
+        assert [m.content.split()[1] for m in restored.messages] == ["0", "1", "2"]
+
+    def test_listing_reads_archived_messages_without_rehydrating(self, db_session: Session):
+        """Test the user listing shows archived messages and leaves them archived."""
+        conversation = _create_conversation(db_session, OLD, messages=3)
+        archive_cold_conversations(db_session, 30, 10)
+
+        listing = Conversation.get_listing_by_user_id(db_session, conversation.user_id)
+
+        assert [m["content"].split()[1] for m in listing[0]["messages"]] == ["0", "1", "2"]
+        assert listing[0]["messages"][0]["sender"] == "user"
+        db_session.expire_all()
+        assert db_session.get(Conversation, conversation.id).archived is True
@@ -0,0 +1,173 @@
+"""
+Test cases for the conversation history cache.
+"""
+
+import pytest
+from models.conversation import Conversation
+from models.message import Message, SenderType
+from models.user import User
+from schemas.chat_model import ChatMessage, ChatRequest, ChatRole
+from services.chat_model_services import (
+    get_conversation_from_request_async,
+    store_request_and_response_messages,
+    store_request_and_response_messages_async,
+)
+from services.conversation_cache import (
+    CachedConversation,
+    CachedMessage,
+    ConversationCache,
+    InMemoryLRUCacheBackend,
+    conversation_cache,
+)
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+def _snapshot(conversation_id: int, content: str = "") -> CachedConversation:
+    return CachedConversation(
+        id=conversation_id,
+        user_id=1,
+        title="Title",
+        prompt="Prompt",
+        messages=(CachedMessage(SenderType.USER, content),),
+    )
+
+
+@pytest.fixture
+def conversation(db_session: Session):
+    user = User(username="testuser", email="test@example.com", password_hash="hashed")
+    db_session.add(user)
+    db_session.commit()
+    conversation = Conversation.create_conversation(db_session, user.id, "Title", "Prompt")
+    Message.create_message(db_session, conversation.id, SenderType.USER, "Hello")
+    return conversation
+
+
+def _request(conversation_id: int) -> ChatRequest:
+    return ChatRequest(
+        conversation_id=conversation_id,
+        messages=[ChatMessage(role=ChatRole.USER, content="Next")],
+    )
+
+
+class TestInMemoryLRUCacheBackend:
+    """Test size accounting and LRU eviction."""
+
+    def test_evicts_least_recently_used_when_over_budget(self):
+        """Test the oldest untouched entry goes first once max_bytes is exceeded."""
+        entry_size = _snapshot(1, "x" * 100).size_bytes
+        backend = InMemoryLRUCacheBackend(max_bytes=entry_size * 2)
+        backend.set(_snapshot(1, "x" * 100))
+        backend.set(_snapshot(2, "x" * 100))
+        backend.get(1)
+
+        backend.set(_snapshot(3, "x" * 100))
+
+        assert backend.get(1) is not None
+        assert backend.get(2) is None
+        assert backend.get(3) is not None
+        assert backend.current_bytes == entry_size * 2
+
+    def test_entry_larger_than_budget_is_not_cached(self):
+        """Test a single oversized history is never stored."""
+        backend = InMemoryLRUCacheBackend(max_bytes=10)
+        backend.set(_snapshot(1, "x" * 100))
+
+        assert backend.get(1) is None
+        assert backend.current_bytes == 0
+
+
+class TestConversationCache:
+    """Test read-through loading, append updates and write invalidation."""
+
+    @pytest.mark.asyncio
+    async def test_second_load_is_served_from_cache(self, conversation, async_db_session):
+        """Test the second turn of a conversation does not hit the database."""
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            loaded = await Conversation.get_by_id_async(async_db_session, conversation.id, with_messages=True)
+            return CachedConversation.from_orm(loaded)
+
+        cache = ConversationCache(InMemoryLRUCacheBackend(max_bytes=1024 * 1024))
+        first = await cache.get_or_load(conversation.id, loader)
+        second = await cache.get_or_load(conversation.id, loader)
+
+        assert first is second
+        assert len(calls) == 1
+        assert cache.hit_rate == 0.5
+        assert [m.content for m in second.messages] == ["Hello"]
+
+    @pytest.mark.asyncio
+    async def test_missing_conversation_is_not_cached(self, async_db_session):
+        """Test a miss for an unknown id returns None and stores nothing."""
+        async def loader():
+            return None
+
+        cache = ConversationCache(InMemoryLRUCacheBackend(max_bytes=1024))
+
+        assert await cache.get_or_load(99999, loader) is None
+        assert len(cache.backend) == 0
+
+    @pytest.mark.asyncio
+    async def test_append_turn_updates_cached_history(self, conversation, async_db_session):
+        """Test the chat path's append is visible on the next cached read."""
+        loaded = await get_conversation_from_request_async(_request(conversation.id), async_db_session)
+
+        await store_request_and_response_messages_async(async_db_session, conversation.id, "Question", "Answer")
+        conversation_cache.append_turn(loaded, "Question", "Answer")
+        cached = await get_conversation_from_request_async(_request(conversation.id), async_db_session)
+
+        assert [m.content for m in cached.messages] == ["Hello", "Question", "Answer"]
+        assert conversation_cache.hits == 1
+
+    @pytest.mark.asyncio
+    async def test_external_message_write_invalidates(self, conversation, db_session, async_db_session):
+        """Test a message written outside the chat path drops the cached history."""
+        await get_conversation_from_request_async(_request(conversation.id), async_db_session)
+        assert conversation_cache.backend.get(conversation.id) is not None
+
+        Message.create_message(db_session, conversation.id, SenderType.ASSISTANT, "Edited elsewhere")
+
+        assert conversation_cache.backend.get(conversation.id) is None
+        async_db_session.expunge_all()
+        reloaded = await get_conversation_from_request_async(_request(conversation.id), async_db_session)
+        assert [m.content for m in reloaded.messages] == ["Hello", "Edited elsewhere"]
+
+    @pytest.mark.asyncio
+    async def test_conversation_update_invalidates(self, conversation, db_session, async_db_session):
+        """Test changing the conversation row (e.g. its prompt) drops the cached history."""
+        await get_conversation_from_request_async(_request(conversation.id), async_db_session)
+
+        conversation.prompt = "New prompt"
+        db_session.commit()
+
+        assert conversation_cache.backend.get(conversation.id) is None
+
+    @pytest.mark.asyncio
+    async def test_hit_reads_nothing_from_the_database(self, conversation, async_db_session, async_db_engine):
+        """Test a cached history is served without any query."""
+        await get_conversation_from_request_async(_request(conversation.id), async_db_session)
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(async_db_engine.sync_engine, "before_cursor_execute", record)
+        try:
+            await get_conversation_from_request_async(_request(conversation.id), async_db_session)
+        finally:
+            event.remove(async_db_engine.sync_engine, "before_cursor_execute", record)
+
+        assert statements == []
+        assert conversation_cache.hits == 1
+
+    @pytest.mark.asyncio
+    async def test_sync_store_invalidates(self, conversation, db_session, async_db_session):
+        """Test the sync store of a chat turn drops the cached history."""
+        await get_conversation_from_request_async(_request(conversation.id), async_db_session)
+
+        store_request_and_response_messages(db_session, conversation.id, "Question", "Answer")
+
+        assert conversation_cache.backend.get(conversation.id) is None
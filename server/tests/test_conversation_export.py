@@ -0,0 +1,232 @@
+"""
+Test cases for the streaming conversation export and import.
+"""
+
+import pytest
+from models.conversation import Conversation
+from models.conversation_archive import ConversationArchive
+from models.message import Message, SenderType
+from services import conversation_export
+from services.conversation_export import (
+    ConversationImporter,
+    TransferReport,
+    export_ndjson,
+    iter_ndjson_records,
+)
+from sqlalchemy.orm import Session, sessionmaker
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    """Chunks of 2 conversations and 3 message rows, to exercise chunking"""
+    monkeypatch.setattr(conversation_export, "EXPORT_CHUNK_SIZE", 2)
+    monkeypatch.setattr(conversation_export, "MESSAGE_BATCH_SIZE", 3)
+    monkeypatch.setattr(conversation_export, "IMPORT_BATCH_SIZE", 4)
+
+
+@pytest.fixture
+def conversations(db_session: Session, users):
+    """Five conversations of the owner with two turns each, the last one archived"""
+    owner, _ = users
+    created = []
+    for i in range(5):
+        conversation = Conversation.create_conversation(db_session, owner.id, f"Title {i}", "Prompt")
+        for turn in range(2):
+            Conversation.append_turn(db_session, conversation.id, f"Q{i}.{turn}", f"A{i}.{turn}")
+        created.append(conversation)
+    ConversationArchive.archive(db_session, created[-1])
+    return created
+
+
+def _export_records(db_session: Session, user_id: int | None = None) -> list[dict]:
+    data = b"".join(export_ndjson(db_session, user_id))
+    return list(iter_ndjson_records(data.splitlines()))
+
+
+class TestNdjsonExport:
+    """Test the NDJSON export stream."""
+
+    def test_export_streams_every_conversation_and_message(self, db_session, conversations, small_chunks):
+        """Test all rows are exported, in pieces, archived messages included."""
+        report = TransferReport()
+        pieces = list(export_ndjson(db_session, 1, report))
+
+        records = list(iter_ndjson_records(b"".join(pieces).splitlines()))
+        assert [r["type"] for r in records].count("conversation") == 5
+        assert [r["content"] for r in records if r["type"] == "message"][-4:] == [
+            "Q4.0", "A4.0", "Q4.1", "A4.1",
+        ]
+        assert (report.conversations, report.messages) == (5, 20)
+        assert report.bytes == sum(len(piece) for piece in pieces)
+        assert len(pieces) >= 6
+
+    def test_conversation_precedes_its_messages(self, db_session, conversations, small_chunks):
+        """Test a reader can attach every message to a conversation it has already seen."""
+        seen = set()
+        for record in _export_records(db_session):
+            if record["type"] == "conversation":
+                seen.add(record["id"])
+            else:
+                assert record["conversation_id"] in seen
+
+    def test_export_is_limited_to_the_user(self, db_session, conversations, users):
+        """Test other users' conversations are not exported."""
+        _, other = users
+        Conversation.create_conversation(db_session, other.id, "Other", "Prompt")
+
+        records = _export_records(db_session, other.id)
+
+        assert [r["title"] for r in records] == ["Other"]
+
+
+class TestConversationImport:
+    """Test importing exported records."""
+
+    def test_round_trip_into_another_user(self, db_session, conversations, users, small_chunks):
+        """Test an export imports as new conversations with the same messages."""
+        _, other = users
+        records = _export_records(db_session, 1)
+
+        report = ConversationImporter(db_session, other.id).import_records(records)
+
+        assert (report.conversations, report.messages, report.skipped) == (5, 20, 0)
+        imported = Conversation.get_by_user_id(db_session, other.id)
+        assert {c.id for c in imported}.isdisjoint({c.id for c in conversations})
+        last = Conversation.get_by_id(db_session, imported[-1].id, with_messages=True)
+        assert last.title == "Title 4"
+        assert last.transcript is None
+        assert [(m.sent_by, m.content) for m in last.messages][:2] == [
+            (SenderType.USER, "Q4.0"),
+            (SenderType.ASSISTANT, "A4.0"),
+        ]
+
+    def test_messages_without_conversation_are_skipped(self, db_session, users):
+        """Test orphan message records are counted and not inserted."""
+        records = [
+            {"type": "message", "conversation_id": 42, "sent_by": "user", "content": "Lost",
+             "created_at": "2026-01-01T00:00:00", "updated_at": None},
+        ]
+
+        report = ConversationImporter(db_session, 1).import_records(records)
+
+        assert report.skipped == 1
+        assert db_session.query(Message).count() == 0
+
+    def test_allocate_id_is_used_for_new_conversations(self, db_session, users):
+        """Test the importer asks the allocator for ids, as sharded storage does."""
+        records = [
+            {"type": "conversation", "id": 7, "user_id": 1, "title": "T", "prompt": "P",
+             "created_at": "2026-01-01T00:00:00+00:00", "updated_at": None},
+        ]
+
+        ConversationImporter(db_session, 1, allocate_id=lambda user_id: 1000).import_records(records)
+
+        assert db_session.get(Conversation, 1000).title == "T"
+
+
+class TestArrowExport:
+    """Test Arrow IPC and Parquet output."""
+
+    def test_arrow_stream_matches_ndjson(self, db_session, conversations, small_chunks):
+        """Test the Arrow IPC stream of each table holds the same rows as NDJSON."""
+        pa = pytest.importorskip("pyarrow")
+
+        messages = pa.ipc.open_stream(
+            b"".join(conversation_export.export_arrow_stream(db_session, "messages", 1))
+        ).read_all()
+        conversations_table = pa.ipc.open_stream(
+            b"".join(conversation_export.export_arrow_stream(db_session, "conversations", 1))
+        ).read_all()
+
+        assert messages.num_rows == 20
+        assert conversations_table.column("title").to_pylist() == [f"Title {i}" for i in range(5)]
+        assert messages.schema.field("created_at").type == pa.timestamp("us", tz="UTC")
+
+    def test_parquet_round_trip(self, db_session, db_engine, conversations, users, tmp_path, small_chunks):
+        """Test a Parquet export imports back with all rows."""
+        pytest.importorskip("pyarrow")
+        from sqlalchemy.orm import sessionmaker
+
+        _, other = users
+        report = conversation_export.export_parquet(
+            [sessionmaker(bind=db_engine)], str(tmp_path / "export"), user_id=1
+        )
+        assert (report.conversations, report.messages) == (5, 20)
+
+        imported = ConversationImporter(db_session, other.id).import_records(
+            conversation_export.iter_parquet_records(str(tmp_path / "export"))
+        )
+
+        assert (imported.conversations, imported.messages) == (5, 20)
+
+
+class TestExportEndpoints:
+    """Test the export and import endpoints."""
+
+    def test_export_then_import(self, conversation_client, db_session, conversations, small_chunks):
+        """Test an NDJSON export posted back to /import duplicates the history."""
+        exported = conversation_client.get("/api/export")
+        assert exported.status_code == 200
+        assert exported.headers["content-type"] == "application/x-ndjson"
+
+        response = conversation_client.post("/api/import", content=exported.content)
+
+        assert response.status_code == 200
+        body = response.json()
+        assert (body["conversations"], body["messages"], body["skipped"]) == (5, 20, 0)
+        assert len(Conversation.get_by_user_id(db_session, 1)) == 10
+
+    @pytest.mark.asyncio
+    async def test_streamed_export_returns_its_connection(self, db_engine, db_session, conversations):
+        """Test the export streams on a session of its own, after the request's session was closed."""
+        from routers.conversation import export_conversations
+
+        db_session.close()
+        db = sessionmaker(bind=db_engine)()
+        response = export_conversations("ndjson", "messages", db)
+        # FastAPI may close the request's dependencies before the body is sent
+        db.close()
+        body = b"".join([chunk async for chunk in response.body_iterator])
+
+        assert [r["type"] for r in iter_ndjson_records(body.splitlines())].count("conversation") == 5
+        assert db_engine.pool.checkedout() == 0
+
+    def test_arrow_export_endpoint(self, conversation_client, conversations):
+        """Test the Arrow format streams a readable IPC stream."""
+        pa = pytest.importorskip("pyarrow")
+
+        response = conversation_client.get("/api/export", params={"format": "arrow", "table": "conversations"})
+
+        assert response.status_code == 200
+        assert pa.ipc.open_stream(response.content).read_all().num_rows == 5
+
+    def test_import_rejects_invalid_records(self, conversation_client):
+        """Test malformed NDJSON returns 400."""
+        response = conversation_client.post("/api/import", content=b'{"type": "conversation"}\n')
+
+        assert response.status_code == 400
+        assert response.json()["detail"]["line"] == 1
+
+    def test_failed_import_reports_what_was_imported(self, conversation_client, db_session, conversations, monkeypatch):
+        """Test a record failing after committed batches returns 400 with its line and the imported counts."""
+        from routers import conversation as conversation_router
+
+        monkeypatch.setattr(conversation_router, "IMPORT_BATCH_SIZE", 3)
+        lines = conversation_client.get("/api/export").content.splitlines()
+        body = b"\n".join(lines[:6] + [b"[1, 2]"] + lines[6:]) + b"\n"
+
+        response = conversation_client.post("/api/import", content=body)
+
+        assert response.status_code == 400
+        detail = response.json()["detail"]
+        assert detail["line"] == 7
+        assert detail["imported"] == {"conversations": 5, "messages": 1}
+        assert "TypeError" in detail["error"]
+        assert len(Conversation.get_by_user_id(db_session, 1)) == 10
+
+    def test_unparsable_line_is_reported(self, conversation_client):
+        """Test a line that is not JSON is a 400 naming the line."""
+        response = conversation_client.post("/api/import", content=b"\n{not json\n")
+
+        assert response.status_code == 400
+        assert response.json()["detail"]["line"] == 2
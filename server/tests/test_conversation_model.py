@@ -841,3 +841,232 @@ class TestConversationGetById:
         assert hasattr(retrieved, 'updated_at')
         assert hasattr(retrieved, 'messages')
         assert isinstance(retrieved.messages, list)
+
+
+class TestConversationGetListingByUserId:
+    """Test the projection-based listing used by the user conversations endpoint."""
+
+    def _create_user(self, db_session: Session, username: str) -> User:
+        user = User(
+            username=username,
+            email=f"{username}@example.com",
+            password_hash="hashed_password"
+        )
+        db_session.add(user)
+        db_session.commit()
+        db_session.refresh(user)
+        return user
+
+    def test_listing_matches_orm_path(self, db_session: Session):
+        """Test the listing returns the same data as the ORM objects."""
+        from models.message import Message, SenderType
+
+        user = self._create_user(db_session, "testuser")
+        first = Conversation.create_conversation(db_session, user.id, "First", "Prompt 1")
+        second = Conversation.create_conversation(db_session, user.id, "Second", "")
+        for i in range(4):
+            sender = SenderType.USER if i % 2 == 0 else SenderType.ASSISTANT
+            Message.create_message(db_session, first.id, sender, f"Message {i}")
+
+        listing = Conversation.get_listing_by_user_id(db_session, user.id)
+
+        assert [conv["conversation_id"] for conv in listing] == [first.id, second.id]
+        assert listing[0]["title"] == "First"
+        assert listing[0]["prompt"] == "Prompt 1"
+        assert listing[0]["created_at"] == first.created_at.isoformat()
+        assert [msg["content"] for msg in listing[0]["messages"]] == [
+            "Message 0", "Message 1", "Message 2", "Message 3"
+        ]
+        assert [msg["sender"] for msg in listing[0]["messages"]] == [
+            "user", "assistant", "user", "assistant"
+        ]
+        assert listing[0]["messages"][0]["id"] == first.messages[0].id
+        assert listing[0]["messages"][0]["created_at"] == first.messages[0].created_at.isoformat()
+
+        # A conversation without messages still appears, with an empty list
+        assert listing[1]["messages"] == []
+
+    def test_listing_excludes_other_users(self, db_session: Session):
+        """Test only the requested user's conversations are returned."""
+        owner = self._create_user(db_session, "owner")
+        other = self._create_user(db_session, "other")
+        Conversation.create_conversation(db_session, owner.id, "Mine", "Prompt")
+        Conversation.create_conversation(db_session, other.id, "Theirs", "Prompt")
+
+        listing = Conversation.get_listing_by_user_id(db_session, owner.id)
+
+        assert [conv["title"] for conv in listing] == ["Mine"]
+
+    def test_listing_for_user_without_conversations(self, db_session: Session):
+        """Test a user without conversations gets an empty list."""
+        assert Conversation.get_listing_by_user_id(db_session, 99999) == []
+
+    def test_streamed_listing_spans_chunks_and_archives(self, db_session: Session, monkeypatch):
+        """Test the streamed listing crosses chunk boundaries and lists archived conversations in order."""
+        import models.conversation
+        from models.conversation_archive import ConversationArchive
+
+        monkeypatch.setattr(models.conversation, "LISTING_CHUNK_SIZE", 2)
+        user = self._create_user(db_session, "testuser")
+        conversations = []
+        for i in range(5):
+            conversation = Conversation.create_conversation(db_session, user.id, f"Title {i}", "Prompt")
+            Conversation.append_turn(db_session, conversation.id, f"Question {i}", f"Answer {i}")
+            conversations.append(conversation)
+        ConversationArchive.archive(db_session, conversations[2])
+
+        listing = [
+            (conversation["title"], [m["content"] for m in messages])
+            for conversation, messages in Conversation.iter_listing_by_user_id(db_session, user.id)
+        ]
+
+        assert listing == [(f"Title {i}", [f"Question {i}", f"Answer {i}"]) for i in range(5)]
+        assert db_session.get(Conversation, conversations[2].id).archived
+
+    def test_streamed_listing_tolerates_unread_messages(self, db_session: Session):
+        """Test skipping a conversation's messages does not shift them onto the next one."""
+        user = self._create_user(db_session, "testuser")
+        for i in range(3):
+            conversation = Conversation.create_conversation(db_session, user.id, f"Title {i}", "Prompt")
+            Conversation.append_turn(db_session, conversation.id, f"Question {i}", f"Answer {i}")
+
+        contents = [
+            [m["content"] for m in messages] if index != 1 else None
+            for index, (_, messages) in enumerate(Conversation.iter_listing_by_user_id(db_session, user.id))
+        ]
+
+        assert contents == [["Question 0", "Answer 0"], None, ["Question 2", "Answer 2"]]
+
+
+class TestConversationGetDetailById:
+    """Test the projection-based read used by the get conversation endpoint."""
+
+    def _create_conversation(self, db_session: Session) -> Conversation:
+        user = User(username="testuser", email="test@example.com", password_hash="hashed_password")
+        db_session.add(user)
+        db_session.commit()
+        conversation = Conversation.create_conversation(db_session, user.id, "Title", "Prompt")
+        Conversation.append_turn(db_session, conversation.id, "Question", "Answer")
+        return conversation
+
+    def test_detail_matches_response_schema(self, db_session: Session):
+        """Test the detail has the fields of GetConversationResponse, messages in order."""
+        from schemas.conversation import GetConversationResponse
+
+        conversation = self._create_conversation(db_session)
+
+        detail = Conversation.get_detail_by_id(db_session, conversation.id)
+
+        assert GetConversationResponse.model_validate(detail).model_dump() == detail
+        assert detail["created_at"] == conversation.created_at.isoformat()
+        assert [(m["sender"], m["content"]) for m in detail["messages"]] == [
+            ("user", "Question"), ("assistant", "Answer")
+        ]
+
+    def test_detail_restores_archived_conversation(self, db_session: Session):
+        """Test reading an archived conversation moves it back to hot storage."""
+        from models.conversation_archive import ConversationArchive
+
+        conversation = self._create_conversation(db_session)
+        ConversationArchive.archive(db_session, conversation)
+
+        detail = Conversation.get_detail_by_id(db_session, conversation.id)
+
+        assert [m["content"] for m in detail["messages"]] == ["Question", "Answer"]
+        assert not db_session.get(Conversation, conversation.id).archived
+
+    def test_detail_of_missing_conversation(self, db_session: Session):
+        """Test a missing conversation gives None."""
+        assert Conversation.get_detail_by_id(db_session, 99999) is None
+
+
+class TestConversationTranscript:
+    """Test the transcript snapshot column used by chat turns."""
+
+    def _create_conversation(self, db_session: Session) -> Conversation:
+        user = User(username="testuser", email="test@example.com", password_hash="hashed_password")
+        db_session.add(user)
+        db_session.commit()
+        return Conversation.create_conversation(db_session, user.id, "Title", "Prompt")
+
+    def test_encode_decode_round_trip(self):
+        """Test entries survive encoding, including newlines and token ids."""
+        from models.conversation import TranscriptEntry, decode_transcript, encode_transcript
+        from models.message import SenderType
+
+        entries = [
+            TranscriptEntry(SenderType.USER, "line one\nline two, \"quoted\""),
+            TranscriptEntry(SenderType.ASSISTANT, "héllo ✓", [101, 2009, 102]),
+        ]
+        encoded = encode_transcript(entries[:1]) + encode_transcript(entries[1:])
+
+        assert decode_transcript(encoded) == entries
+        assert decode_transcript("") == []
+
+    def test_append_turn_extends_transcript(self, db_session: Session):
+        """Test a chat turn stores both messages and appends them to the transcript."""
+        from models.conversation import decode_transcript
+        from models.message import SenderType
+
+        conversation = self._create_conversation(db_session)
+        Conversation.append_turn(db_session, conversation.id, "Q1", "A1", [7, 8])
+        Conversation.append_turn(db_session, conversation.id, "Q2", "A2")
+
+        db_session.refresh(conversation)
+        entries = decode_transcript(conversation.transcript)
+        assert [(e.sent_by, e.content) for e in entries] == [
+            (SenderType.USER, "Q1"),
+            (SenderType.ASSISTANT, "A1"),
+            (SenderType.USER, "Q2"),
+            (SenderType.ASSISTANT, "A2"),
+        ]
+        assert entries[1].token_ids == [7, 8]
+        assert len(conversation.messages) == 4
+
+    def test_orm_message_write_invalidates_transcript(self, db_session: Session):
+        """Test messages written outside chat turns reset the transcript without touching updated_at."""
+        from models.message import Message, SenderType
+
+        conversation = self._create_conversation(db_session)
+        Conversation.append_turn(db_session, conversation.id, "Q1", "A1")
+        db_session.refresh(conversation)
+        updated_at = conversation.updated_at
+
+        Message.create_message(db_session, conversation.id, SenderType.USER, "Edited elsewhere")
+
+        db_session.refresh(conversation)
+        assert conversation.transcript is None
+        assert conversation.updated_at == updated_at
+
+    @pytest.mark.asyncio
+    async def test_get_with_transcript_reads_snapshot(self, db_session: Session, async_db_session):
+        """Test a present transcript is returned without loading the messages."""
+        conversation = self._create_conversation(db_session)
+        Conversation.append_turn(db_session, conversation.id, "Q1", "A1")
+
+        loaded, entries = await Conversation.get_with_transcript_async(async_db_session, conversation.id)
+
+        assert loaded.id == conversation.id
+        assert [e.content for e in entries] == ["Q1", "A1"]
+        assert "messages" not in loaded.__dict__
+
+    @pytest.mark.asyncio
+    async def test_get_with_transcript_rebuilds_missing_snapshot(self, db_session: Session, async_db_session):
+        """Test a NULL transcript is rebuilt from the messages table and stored."""
+        from models.conversation import decode_transcript
+        from models.message import Message, SenderType
+
+        conversation = self._create_conversation(db_session)
+        Message.create_message(db_session, conversation.id, SenderType.USER, "Q1")
+        Message.create_message(db_session, conversation.id, SenderType.ASSISTANT, "A1")
+
+        loaded, entries = await Conversation.get_with_transcript_async(async_db_session, conversation.id)
+
+        assert [e.content for e in entries] == ["Q1", "A1"]
+        db_session.refresh(conversation)
+        assert decode_transcript(conversation.transcript) == entries
+
+    @pytest.mark.asyncio
+    async def test_get_with_transcript_not_found(self, async_db_session):
+        """Test an unknown id returns no conversation and no history."""
+        assert await Conversation.get_with_transcript_async(async_db_session, 99999) == (None, [])
@@ -5,13 +5,15 @@ These tests verify the behavior of conversation-related API endpoints
 using a real SQLite database in memory.
 """
 
+import json
+
 import pytest
 from datetime import datetime
 from fastapi.testclient import TestClient
 from models.conversation import Conversation
 from models.message import Message, SenderType
 from models.user import User
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, sessionmaker
 
 
 @pytest.fixture
@@ -359,6 +361,34 @@ class TestGetConversation:
         assert response.headers["content-type"] == "application/json"
 
 
+    def test_get_conversation_encoding_without_orjson(self, client_with_conversation, db_session, sample_conversation, monkeypatch):
+        """Test the standard library fallback encodes the same body as orjson."""
+        import utils.json_encoding
+
+        orjson = pytest.importorskip("orjson")
+        Conversation.append_turn(db_session, sample_conversation.id, 'Quote " and é', "Answer ✓")
+        url = f"/api/conv-with-msg/{sample_conversation.id}"
+        monkeypatch.setattr(utils.json_encoding, "orjson", orjson)
+        body = client_with_conversation.get(url).content
+        monkeypatch.setattr(utils.json_encoding, "orjson", None)
+
+        assert client_with_conversation.get(url).content == body
+        assert json.loads(body)["messages"][0]["content"] == 'Quote " and é'
+
+    def test_get_conversation_fallback_encoding(self, client_with_conversation, db_session, sample_conversation, monkeypatch):
+        """Test the standard library fallback writes compact UTF-8 JSON, as orjson does."""
+        import utils.json_encoding
+
+        Conversation.append_turn(db_session, sample_conversation.id, 'Quote " and é', "Answer ✓")
+        monkeypatch.setattr(utils.json_encoding, "orjson", None)
+
+        body = client_with_conversation.get(f"/api/conv-with-msg/{sample_conversation.id}").content
+
+        assert '"content":"Quote \\" and é"'.encode("utf-8") in body
+        assert "Answer ✓".encode("utf-8") in body
+        assert b": " not in body and b", " not in body
+
+
 class TestGetUserConversations:
     """Test cases for the GET /api/user-conv-with-msg/{user_id} endpoint."""
 
@@ -639,3 +669,172 @@ class TestGetUserConversations:
         
         assert response.status_code == 200
         assert response.headers["content-type"] == "application/json"
+
+    def test_get_user_conversations_is_streamed(self, client_with_conversation, db_session, sample_user, monkeypatch):
+        """Test a large listing is sent in several pieces that form the same JSON array."""
+        import routers.conversation
+
+        monkeypatch.setattr(routers.conversation, "LISTING_STREAM_CHUNK_BYTES", 256)
+        for i in range(5):
+            conv = Conversation.create_conversation(db_session, sample_user.id, f"Conversation {i}", "Prompt")
+            Conversation.append_turn(db_session, conv.id, f"Question {i} \"é\"", f"Answer {i}")
+
+        pieces = list(routers.conversation._stream_listing(db_session, sample_user.id))
+        response = client_with_conversation.get(f"/api/user-conv-with-msg/{sample_user.id}")
+
+        assert response.status_code == 200
+        assert len(pieces) > 1
+        assert b"".join(pieces) == response.content
+        data = json.loads(response.content)
+        assert data == Conversation.get_listing_by_user_id(db_session, sample_user.id)
+        assert data[4]["messages"][0]["content"] == 'Question 4 "é"'
+
+
+    @pytest.mark.asyncio
+    async def test_streamed_listing_returns_its_connection(self, db_engine, db_session, sample_conversation_with_messages):
+        """Test the listing streams on a session of its own, after the request's session was closed."""
+        from routers.conversation import get_user_conversations
+        from starlette.requests import Request
+
+        db_session.close()
+        db = sessionmaker(bind=db_engine)()
+        response = get_user_conversations(1, Request({"type": "http", "method": "GET", "headers": []}), db)
+        # FastAPI may close the request's dependencies before the body is sent
+        db.close()
+        body = b"".join([chunk async for chunk in response.body_iterator])
+
+        assert len(json.loads(body)) == 1
+        assert db_engine.pool.checkedout() == 0
+
+class TestConditionalGet:
+    """Test ETag validators and 304 answers of the conversation GET endpoints."""
+
+    def test_unchanged_conversation_answers_304(self, client_with_conversation, sample_conversation_with_messages):
+        """Test a matching If-None-Match gets an empty 304 with the same validators."""
+        conversation, _ = sample_conversation_with_messages
+        url = f"/api/conv-with-msg/{conversation.id}"
+
+        first = client_with_conversation.get(url)
+        etag = first.headers["etag"]
+        second = client_with_conversation.get(url, headers={"If-None-Match": etag})
+
+        assert etag.startswith('W/"')
+        assert "last-modified" in first.headers
+        assert first.headers["cache-control"] == "no-cache"
+        assert second.status_code == 304
+        assert second.content == b""
+        assert second.headers["etag"] == etag
+
+    def test_new_messages_change_the_etag(self, client_with_conversation, db_session, sample_conversation):
+        """Test chat turns and messages written outside a turn both invalidate the ETag."""
+        url = f"/api/conv-with-msg/{sample_conversation.id}"
+        etags = [client_with_conversation.get(url).headers["etag"]]
+
+        Conversation.append_turn(db_session, sample_conversation.id, "Question", "Answer")
+        etags.append(client_with_conversation.get(url).headers["etag"])
+        Message.create_message(db_session, sample_conversation.id, SenderType.USER, "Later")
+        response = client_with_conversation.get(url, headers={"If-None-Match": etags[-1]})
+
+        assert response.status_code == 200
+        assert len(response.json()["messages"]) == 3
+        assert len(set(etags + [response.headers["etag"]])) == 3
+
+    def test_edited_message_changes_the_etags(self, client_with_conversation, db_session, sample_conversation):
+        """Test editing a message, which keeps the count and latest id, changes both ETags."""
+        message = Message.create_message(db_session, sample_conversation.id, SenderType.USER, "Hello")
+        urls = [f"/api/conv-with-msg/{sample_conversation.id}", f"/api/user-conv-with-msg/{sample_conversation.user_id}"]
+        etags = [client_with_conversation.get(url).headers["etag"] for url in urls]
+
+        message.content = "Edited"
+        db_session.commit()
+
+        for url, etag in zip(urls, etags):
+            assert client_with_conversation.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+    def test_if_none_match_lists_and_wildcard(self, client_with_conversation, sample_conversation):
+        """Test If-None-Match with several tags, a strong form of the tag and '*'."""
+        url = f"/api/conv-with-msg/{sample_conversation.id}"
+        etag = client_with_conversation.get(url).headers["etag"]
+
+        for header in (f'"other", {etag}', etag[2:], "*"):
+            assert client_with_conversation.get(url, headers={"If-None-Match": header}).status_code == 304
+        assert client_with_conversation.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+    def test_304_leaves_archived_conversation_archived(self, client_with_conversation, db_session, sample_conversation):
+        """Test revalidating an archived conversation does not restore its messages."""
+        from models.conversation_archive import ConversationArchive
+
+        Conversation.append_turn(db_session, sample_conversation.id, "Question", "Answer")
+        ConversationArchive.archive(db_session, sample_conversation)
+        url = f"/api/conv-with-msg/{sample_conversation.id}"
+        archived_etag = Conversation.get_validator(db_session, sample_conversation.id).etag
+
+        assert client_with_conversation.get(url, headers={"If-None-Match": archived_etag}).status_code == 304
+        db_session.expire_all()
+        assert db_session.get(Conversation, sample_conversation.id).archived
+
+        restored = client_with_conversation.get(url)
+        assert len(restored.json()["messages"]) == 2
+        assert client_with_conversation.get(url, headers={"If-None-Match": restored.headers["etag"]}).status_code == 304
+
+    def test_missing_conversation_is_404(self, client_with_conversation):
+        """Test a conditional GET of a missing conversation is still a 404."""
+        response = client_with_conversation.get("/api/conv-with-msg/99999", headers={"If-None-Match": "*"})
+
+        assert response.status_code == 404
+
+    def test_listing_answers_304_until_a_change(self, client_with_conversation, db_session, sample_conversation):
+        """Test the listing ETag holds until a message or conversation is added."""
+        url = f"/api/user-conv-with-msg/{sample_conversation.user_id}"
+        etag = client_with_conversation.get(url).headers["etag"]
+
+        assert client_with_conversation.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+        Message.create_message(db_session, sample_conversation.id, SenderType.USER, "Hello")
+        after_message = client_with_conversation.get(url, headers={"If-None-Match": etag})
+        Conversation.create_conversation(db_session, sample_conversation.user_id, "Another", "Prompt")
+        after_conversation = client_with_conversation.get(
+            url, headers={"If-None-Match": after_message.headers["etag"]}
+        )
+
+        assert after_message.status_code == 200
+        assert after_conversation.status_code == 200
+        assert len(after_conversation.json()) == 2
+
+
+class TestSearchMessages:
+    """Test cases for the GET /api/search endpoint."""
+
+    def test_search_returns_ranked_page(self, client_with_conversation, db_session, sample_conversation):
+        """Test a search returns the matches of the current user, one page at a time."""
+        for i in range(3):
+            Message.create_message(db_session, sample_conversation.id, SenderType.USER, f"tell me about llamas {i}")
+        Message.create_message(db_session, sample_conversation.id, SenderType.ASSISTANT, "unrelated")
+
+        response = client_with_conversation.get("/api/search", params={"q": "llamas", "page_size": 2})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["query"] == "llamas"
+        assert data["page"] == 1
+        assert data["has_more"] is True
+        assert len(data["results"]) == 2
+        assert data["results"][0]["conversation_title"] == "Test Conversation"
+
+        response = client_with_conversation.get("/api/search", params={"q": "llamas", "page_size": 2, "page": 2})
+        data = response.json()
+        assert data["has_more"] is False
+        assert len(data["results"]) == 1
+
+    def test_search_without_matches(self, client_with_conversation, sample_conversation):
+        """Test a search without matches returns an empty page."""
+        response = client_with_conversation.get("/api/search", params={"q": "nothing"})
+
+        assert response.status_code == 200
+        assert response.json()["results"] == []
+
+    def test_search_validates_parameters(self, client_with_conversation):
+        """Test empty queries and invalid pages are rejected."""
+        assert client_with_conversation.get("/api/search", params={"q": ""}).status_code == 422
+        assert client_with_conversation.get("/api/search", params={"q": "x", "page": 0}).status_code == 422
+        assert client_with_conversation.get("/api/search", params={"q": "x", "page_size": 101}).status_code == 422
@@ -0,0 +1,145 @@
+"""
+Test cases for delta sync of conversations.
+"""
+
+import time
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from models.conversation import Conversation
+from models.conversation_archive import ConversationArchive
+from models.message import Message, SenderType
+from services.conversation_sync import SyncToken
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+
+@pytest.fixture(autouse=True)
+def settled(monkeypatch):
+    """Rows count as committed at once, unless a test sets a settle window"""
+    from config import settings
+
+    monkeypatch.setattr(settings, "SYNC_SETTLE_SECONDS", 0)
+
+
+def _create_conversation(db_session: Session, user_id: int, title: str, turns: int = 1) -> Conversation:
+    conversation = Conversation.create_conversation(db_session, user_id, title, "Prompt")
+    for turn in range(turns):
+        Conversation.append_turn(db_session, conversation.id, f"{title} Q{turn}", f"{title} A{turn}")
+    return conversation
+
+
+def _sync(client: TestClient, token: str | None = None, **params) -> dict:
+    if token is not None:
+        params["token"] = token
+    response = client.get("/api/sync", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+class TestConversationSync:
+    """Test the GET /api/sync endpoint."""
+
+    def test_sync_returns_only_changes(self, conversation_client, db_session, users):
+        """Test a sync returns everything first, then only what was created after the token."""
+        owner, other = users
+        first = _create_conversation(db_session, owner.id, "First")
+        _create_conversation(db_session, other.id, "Theirs")
+
+        initial = _sync(conversation_client)
+        unchanged = _sync(conversation_client, initial["sync_token"])
+        Conversation.append_turn(db_session, first.id, "Again", "Reply")
+        second = _create_conversation(db_session, owner.id, "Second", turns=0)
+        changed = _sync(conversation_client, unchanged["sync_token"])
+
+        assert [c["title"] for c in initial["conversations"]] == ["First"]
+        assert [m["content"] for m in initial["messages"]] == ["First Q0", "First A0"]
+        assert unchanged["conversations"] == [] and unchanged["messages"] == []
+        assert [c["conversation_id"] for c in changed["conversations"]] == [second.id]
+        assert [(m["conversation_id"], m["content"]) for m in changed["messages"]] == [
+            (first.id, "Again"), (first.id, "Reply")
+        ]
+        assert changed["has_more"] is False
+
+    def test_sync_pages_through_messages(self, conversation_client, db_session, users):
+        """Test a limited sync pages in id order, without gaps or repeats."""
+        owner, _ = users
+        for i in range(3):
+            _create_conversation(db_session, owner.id, f"Title {i}", turns=2)
+
+        pages = [_sync(conversation_client, limit=5)]
+        while pages[-1]["has_more"]:
+            pages.append(_sync(conversation_client, pages[-1]["sync_token"], limit=5))
+        ids = [m["id"] for page in pages for m in page["messages"]]
+
+        assert len(pages) == 3
+        assert ids == sorted(ids) and len(ids) == len(set(ids)) == 12
+        assert sum(len(page["conversations"]) for page in pages) == 3
+
+    def test_archived_conversations_are_synced_from_blobs(self, conversation_client, db_session, users):
+        """Test an archived conversation's messages are in the initial sync, and only there."""
+        owner, _ = users
+        archived = _create_conversation(db_session, owner.id, "Cold")
+        _create_conversation(db_session, owner.id, "Hot")
+        ConversationArchive.archive(db_session, archived)
+
+        initial = _sync(conversation_client)
+        ConversationArchive.restore(db_session, archived.id)
+        after_restore = _sync(conversation_client, initial["sync_token"])
+
+        assert [m["content"] for m in initial["messages"]] == ["Hot Q0", "Hot A0", "Cold Q0", "Cold A0"]
+        assert after_restore["messages"] == []
+
+    def test_listing_token_starts_the_sync(self, conversation_client, db_session, users):
+        """Test the X-Sync-Token of the listing covers the listed history."""
+        owner, _ = users
+        conversation = _create_conversation(db_session, owner.id, "First")
+
+        listing = conversation_client.get(f"/api/user-conv-with-msg/{owner.id}")
+        Message.create_message(db_session, conversation.id, SenderType.USER, "New")
+        changes = _sync(conversation_client, listing.headers["x-sync-token"])
+
+        assert [m["content"] for m in changes["messages"]] == ["New"]
+        assert changes["conversations"] == []
+
+    def test_invalid_token(self, conversation_client, users):
+        """Test a malformed token is a 400."""
+        for token in ("not-a-token", SyncToken().encode()[:-3]):
+            assert conversation_client.get("/api/sync", params={"token": token}).status_code == 400
+
+    def test_expired_tokens(self, conversation_client, users, monkeypatch):
+        """Test tokens of another shard, or older than the archiving age, are gone."""
+        from config import settings
+
+        moved = SyncToken(shard="a", issued_at=time.time()).encode()
+        assert conversation_client.get("/api/sync", params={"token": moved}).status_code == 410
+
+        monkeypatch.setattr(settings, "ARCHIVE_AFTER_DAYS", 30)
+        old = SyncToken(issued_at=time.time() - 31 * 86400).encode()
+        recent = SyncToken(issued_at=time.time() - 86400).encode()
+        assert conversation_client.get("/api/sync", params={"token": old}).status_code == 410
+        assert conversation_client.get("/api/sync", params={"token": recent}).status_code == 200
+
+    def test_token_stays_behind_unsettled_rows(self, conversation_client, db_session, users, monkeypatch):
+        """Test a token does not pass rows younger than the settle window, which are sent again."""
+        from config import settings
+
+        owner, _ = users
+        settled = _create_conversation(db_session, owner.id, "Settled")
+        db_session.execute(update(Message).values(created_at=datetime(2000, 1, 1)))
+        db_session.execute(update(Conversation).values(created_at=datetime(2000, 1, 1)))
+        db_session.commit()
+        recent = _create_conversation(db_session, owner.id, "Recent")
+        monkeypatch.setattr(settings, "SYNC_SETTLE_SECONDS", 60)
+
+        first = _sync(conversation_client, limit=3)
+        again = _sync(conversation_client, first["sync_token"])
+        listing = conversation_client.get(f"/api/user-conv-with-msg/{owner.id}")
+        token = SyncToken.decode(listing.headers["x-sync-token"])
+
+        assert [m["content"] for m in first["messages"]] == ["Settled Q0", "Settled A0", "Recent Q0"]
+        assert first["has_more"] is False
+        assert [c["conversation_id"] for c in again["conversations"]] == [recent.id]
+        assert [m["content"] for m in again["messages"]] == ["Recent Q0", "Recent A0"]
+        assert (token.conversation_id, token.message_id) == (settled.id, first["messages"][1]["id"])
@@ -0,0 +1,113 @@
+"""
+Test cases for the instrumented connection pool.
+
+These tests run the pool against a temporary SQLite file so checkout,
+overflow and warm-up behave like they do against MySQL.
+"""
+
+import pytest
+from database.pool import (
+    InstrumentedAsyncQueuePool,
+    InstrumentedQueuePool,
+    instrument_pool,
+    warm_up_async_pool,
+    warm_up_pool,
+)
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+from utils.metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.fixture
+def pooled_engine(db_path):
+    engine = create_engine(
+        f"sqlite:///{db_path}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=1,
+        pool_timeout=0.1,
+        pool_pre_ping=True,
+    )
+    instrument_pool(engine, "test")
+    yield engine
+    engine.dispose()
+
+
+class TestInstrumentedQueuePool:
+    """Test the pool gauges and the checkout wait histogram."""
+
+    def test_checkout_wait_is_recorded(self, pooled_engine):
+        """Test every checkout records its wait time."""
+        with pooled_engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+        wait = metrics.snapshot()["db_pool.test.checkout_wait_seconds"]
+        assert wait["count"] == 1
+        assert wait["max"] >= 0
+
+    def test_in_use_and_overflow_gauges(self, pooled_engine):
+        """Test in-use and overflow gauges follow open connections."""
+        first = pooled_engine.connect()
+        second = pooled_engine.connect()
+
+        snapshot = metrics.snapshot()
+        assert snapshot["db_pool.test.in_use"] == 2
+        assert snapshot["db_pool.test.overflow"] == 1
+        assert snapshot["db_pool.test.size"] == 1
+
+        first.close()
+        second.close()
+
+        snapshot = metrics.snapshot()
+        assert snapshot["db_pool.test.in_use"] == 0
+        assert snapshot["db_pool.test.overflow"] == 0
+
+    def test_exhausted_pool_times_out_and_records_wait(self, pooled_engine):
+        """Test checkout past pool_size + max_overflow waits pool_timeout then fails."""
+        first = pooled_engine.connect()
+        second = pooled_engine.connect()
+
+        with pytest.raises(PoolTimeoutError):
+            pooled_engine.connect()
+
+        assert metrics.snapshot()["db_pool.test.checkout_wait_seconds"]["max"] >= 0.1
+
+        first.close()
+        second.close()
+
+
+class TestPoolWarmUp:
+    """Test the startup connection warm-up."""
+
+    def test_warm_up_pool_fills_idle_connections(self, pooled_engine):
+        """Test warmed-up connections are returned to the pool as idle."""
+        assert warm_up_pool(pooled_engine, 1) == 1
+
+        snapshot = metrics.snapshot()
+        assert snapshot["db_pool.test.idle"] == 1
+        assert snapshot["db_pool.test.in_use"] == 0
+
+    @pytest.mark.asyncio
+    async def test_warm_up_async_pool(self, db_path):
+        """Test the async warm-up opens connections concurrently and releases them."""
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{db_path}",
+            poolclass=InstrumentedAsyncQueuePool,
+            pool_size=3,
+        )
+        instrument_pool(engine, "async_test")
+
+        assert await warm_up_async_pool(engine, 3) == 3
+
+        snapshot = metrics.snapshot()
+        assert snapshot["db_pool.async_test.idle"] == 3
+        assert snapshot["db_pool.async_test.checkout_wait_seconds"]["count"] == 3
+        await engine.dispose()
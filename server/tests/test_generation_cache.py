@@ -0,0 +1,309 @@
+"""
+Test cases for the exact-match generation cache.
+
+generate_reply runs on a fake model and tokenizer: the rendered prompt is
+the message contents joined, and every generation appends two tokens, or
+one when it runs out of max_time.
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import chat_model_loader
+import pytest
+from services import chat_model_services
+from services.admission_controller import DeadlineExceeded, Overloaded
+from services.generation_cache import (
+    CachedGeneration,
+    DiskTier,
+    GenerationCache,
+    MemoryTier,
+    cache_key,
+)
+
+
+class FakeIds(list):
+    def __getitem__(self, index):
+        item = super().__getitem__(index)
+        return FakeIds(item) if isinstance(index, slice) else item
+
+    def tolist(self):
+        return list(self)
+
+
+class FakeInputs(dict):
+    def __init__(self, ids):
+        super().__init__(input_ids=[FakeIds(ids)])
+        self.input_ids = self["input_ids"]
+
+    def to(self, device):
+        return self
+
+
+class FakeTokenizer:
+    def apply_chat_template(self, messages, **kwargs):
+        return "|".join(message["content"] for message in messages)
+
+    def __call__(self, texts, return_tensors):
+        return FakeInputs([1, 2, 3])
+
+    def decode(self, ids, skip_special_tokens):
+        return " ".join(f"token{i}" for i in ids)
+
+
+class FakeModel:
+    device = "cpu"
+
+    def __init__(self, do_sample: bool):
+        self.generation_config = SimpleNamespace(to_dict=lambda: {"do_sample": do_sample})
+        self.calls = 0
+
+    def generate(self, input_ids, max_new_tokens, **kwargs):
+        self.calls += 1
+        if "max_time" in kwargs:
+            time.sleep(kwargs["max_time"])
+            return [FakeIds(list(input_ids[0]) + [7])]
+        return [FakeIds(list(input_ids[0]) + [7, 8])]
+
+
+def _entry(reply: str = "Hello there", ttl: float = 60) -> CachedGeneration:
+    return CachedGeneration(reply, (1, 2), time.time() + ttl)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = GenerationCache(MemoryTier(1024 * 1024), ttl_seconds=60)
+    monkeypatch.setattr(chat_model_services, "generation_cache", cache)
+    return cache
+
+
+def _use_model(monkeypatch, do_sample: bool) -> FakeModel:
+    model = FakeModel(do_sample)
+    monkeypatch.setattr(chat_model_loader, "model", model)
+    monkeypatch.setattr(chat_model_loader, "tokenizer", FakeTokenizer())
+    monkeypatch.setitem(chat_model_services.settings.chat_model, "DO_SAMPLE", None)
+    return model
+
+
+PROMPT = [{"role": "system", "content": "Be brief"}, {"role": "user", "content": "hi"}]
+
+
+class TestCacheKey:
+    """Test what the cache key depends on."""
+
+    def test_key_covers_model_prompt_and_params(self):
+        """Test any change of model, rendered prompt or parameters changes the key."""
+        key = cache_key("model", "prompt", {"max_new_tokens": 100})
+
+        assert key == cache_key("model", "prompt", {"max_new_tokens": 100})
+        assert key != cache_key("other model", "prompt", {"max_new_tokens": 100})
+        assert key != cache_key("model", "prompt.", {"max_new_tokens": 100})
+        assert key != cache_key("model", "prompt", {"max_new_tokens": 50})
+
+
+class TestTiers:
+    """Test the memory and disk tiers."""
+
+    def test_memory_tier_evicts_least_recently_used(self):
+        """Test the memory tier stays under its size bound, evicting the oldest use first."""
+        size = _entry().size_bytes
+        tier = MemoryTier(max_bytes=2 * size)
+        tier.set("a", _entry())
+        tier.set("b", _entry())
+        tier.get("a")
+        tier.set("c", _entry())
+
+        assert tier.get("b") is None
+        assert tier.get("a") is not None and tier.get("c") is not None
+        assert tier.current_bytes == 2 * size
+
+    def test_expired_entries_are_misses(self, tmp_path):
+        """Test entries past their TTL are not served by either tier."""
+        memory = MemoryTier(max_bytes=1024)
+        disk = DiskTier(str(tmp_path / "cache.sqlite3"), max_bytes=1024)
+        memory.set("a", _entry(ttl=-1))
+        disk.set("a", _entry(ttl=-1))
+
+        assert memory.get("a") is None
+        assert disk.get("a") is None
+        assert disk.current_bytes == 0
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        """Test a reply written to the disk tier is read back by a new instance."""
+        path = str(tmp_path / "cache.sqlite3")
+        disk = DiskTier(path, max_bytes=1024 * 1024)
+        disk.set("a", _entry("Cached reply"))
+        disk.close()
+
+        reopened = DiskTier(path, max_bytes=1024 * 1024)
+        assert reopened.get("a").reply == "Cached reply"
+        assert reopened.get("a").token_ids == (1, 2)
+        assert reopened.current_bytes == _entry("Cached reply").size_bytes
+
+    def test_disk_tier_evicts_past_its_bound(self, tmp_path):
+        """Test the disk tier deletes least recently used entries past its size bound."""
+        size = _entry().size_bytes
+        disk = DiskTier(str(tmp_path / "cache.sqlite3"), max_bytes=20 * size)
+        for i in range(21):
+            disk.set(str(i), _entry())
+
+        assert disk.current_bytes <= 20 * size
+        assert disk.get("0") is None
+        assert disk.get("20") is not None
+
+    @pytest.mark.asyncio
+    async def test_disk_hit_is_promoted_to_memory(self, tmp_path):
+        """Test a disk hit is copied to the memory tier and counted as a hit."""
+        disk = DiskTier(str(tmp_path / "cache.sqlite3"), max_bytes=1024 * 1024)
+        disk.set("a", _entry())
+        cache = GenerationCache(MemoryTier(1024 * 1024), disk, ttl_seconds=60)
+
+        assert (await cache.get("a")).reply == "Hello there"
+        assert cache.memory.get("a") is not None
+        assert await cache.get("b") is None
+        assert cache.hit_rate == 0.5
+
+
+    @pytest.mark.asyncio
+    async def test_disk_errors_fall_through(self, tmp_path):
+        """Test a failing disk tier turns reads into misses and writes into memory-only writes."""
+        disk = DiskTier(str(tmp_path / "cache.sqlite3"), max_bytes=1024 * 1024)
+        cache = GenerationCache(MemoryTier(1024 * 1024), disk, ttl_seconds=60)
+        disk._connection.execute("DROP TABLE generations")
+
+        assert await cache.get("a") is None
+        await cache.set("a", "Hello there", [1, 2])
+
+        assert (await cache.get("a")).reply == "Hello there"
+        assert disk.current_bytes == 0
+
+class TestGenerateReplyCache:
+    """Test generate_reply uses the cache for greedy generations only."""
+
+    @pytest.mark.asyncio
+    async def test_greedy_reply_is_cached(self, cache, monkeypatch):
+        """Test the same prompt runs the model once and the cached reply is streamed at once."""
+        model = _use_model(monkeypatch, do_sample=False)
+        streamed = []
+
+        async def on_text(text):
+            streamed.append(text)
+
+        first = await chat_model_services.generate_reply(PROMPT)
+        second = await chat_model_services.generate_reply(PROMPT, on_text)
+        other = await chat_model_services.generate_reply(PROMPT[:1] + [{"role": "user", "content": "hello"}])
+
+        assert first == second == ("token7 token8", [7, 8])
+        assert streamed == ["token7 token8"]
+        assert other == first
+        assert model.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_sampling_bypasses_the_cache(self, cache, monkeypatch):
+        """Test sampled generations run the model every time and are not stored."""
+        model = _use_model(monkeypatch, do_sample=True)
+
+        await chat_model_services.generate_reply(PROMPT)
+        await chat_model_services.generate_reply(PROMPT)
+
+        assert model.calls == 2
+        assert len(cache.memory) == 0
+
+    @pytest.mark.asyncio
+    async def test_do_sample_setting_overrides_the_model(self, cache, monkeypatch):
+        """Test CHAT_MODEL_DO_SAMPLE=false makes a sampling model greedy and cacheable."""
+        model = _use_model(monkeypatch, do_sample=True)
+        monkeypatch.setitem(chat_model_services.settings.chat_model, "DO_SAMPLE", False)
+
+        await chat_model_services.generate_reply(PROMPT)
+        await chat_model_services.generate_reply(PROMPT)
+
+        assert model.calls == 1
+
+
+class TestDeadline:
+    """Test generate_reply stops at the client's deadline."""
+
+    @pytest.mark.asyncio
+    async def test_partial_reply_is_truncated_and_not_cached(self, cache, monkeypatch):
+        """Test generation is cut at the deadline and its partial reply is marked, not stored."""
+        model = _use_model(monkeypatch, do_sample=False)
+        usage = chat_model_services.GenerationUsage()
+
+        reply = await chat_model_services.generate_reply(
+            PROMPT, usage=usage, deadline=time.monotonic() + 0.05
+        )
+
+        assert reply == ("token7", [7])
+        assert usage.truncated
+        assert len(cache.memory) == 0
+        # without a deadline the full reply is generated and cached
+        assert await chat_model_services.generate_reply(PROMPT) == ("token7 token8", [7, 8])
+        assert model.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_expired_deadline_skips_generation(self, cache, monkeypatch):
+        """Test nothing is generated once the deadline has passed and the slot is given back."""
+        model = _use_model(monkeypatch, do_sample=False)
+
+        with pytest.raises(DeadlineExceeded):
+            await chat_model_services.generate_reply(PROMPT, deadline=time.monotonic() - 1)
+
+        assert model.calls == 0
+        assert chat_model_services.generation_scheduler.running == 0
+
+
+class TestAdmission:
+    """Test admission control only applies to replies that are generated."""
+
+    @pytest.mark.asyncio
+    async def test_cached_reply_is_served_when_overloaded(self, cache, monkeypatch):
+        """Test a cache hit is answered while a turn to generate is rejected."""
+        model = _use_model(monkeypatch, do_sample=False)
+        await chat_model_services.generate_reply(PROMPT)
+        monkeypatch.setattr(chat_model_services.admission_controller, "wait_slo_seconds", 1)
+        monkeypatch.setattr(chat_model_services.admission_controller, "estimated_wait", lambda: 10.0)
+
+        assert await chat_model_services.generate_reply(PROMPT) == ("token7 token8", [7, 8])
+        with pytest.raises(Overloaded):
+            await chat_model_services.generate_reply(PROMPT[:1] + [{"role": "user", "content": "hello"}])
+        assert model.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_degraded_reply_is_cached_under_its_own_key(self, cache, monkeypatch):
+        """Test a reply shortened under load does not answer the full-length generation later."""
+        model = _use_model(monkeypatch, do_sample=False)
+        degraded = [10]
+
+        def admit(max_new_tokens, deadline=None):
+            return degraded.pop() if degraded else max_new_tokens
+
+        monkeypatch.setattr(chat_model_services.admission_controller, "admit", admit)
+
+        await chat_model_services.generate_reply(PROMPT)
+        await chat_model_services.generate_reply(PROMPT)
+
+        assert model.calls == 2
+        assert len(cache.memory) == 2
+
+class TestGenerationErrors:
+    """Test a failing generation is raised to the caller."""
+
+    @pytest.mark.asyncio
+    async def test_streaming_generation_error_is_raised(self, cache, monkeypatch):
+        """Test a streamed generation that raises ends the stream, raises and gives the slot back."""
+        model = _use_model(monkeypatch, do_sample=False)
+
+        def generate(input_ids, max_new_tokens, **kwargs):
+            raise RuntimeError("CUDA out of memory")
+
+        monkeypatch.setattr(model, "generate", generate)
+
+        async def on_text(text):
+            pass
+
+        with pytest.raises(RuntimeError, match="out of memory"):
+            await asyncio.wait_for(chat_model_services.generate_reply(PROMPT, on_text), 5)
+
+        assert chat_model_services.generation_scheduler.running == 0
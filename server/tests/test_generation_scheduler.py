@@ -0,0 +1,127 @@
+"""
+Test cases for the scheduling policies of generations.
+"""
+
+import asyncio
+
+import pytest
+from services.generation_scheduler import (
+    FIFOPolicy,
+    GenerationScheduler,
+    ShortestJobFirstPolicy,
+    WeightedFairQueuingPolicy,
+    make_policy,
+)
+from utils.metrics import metrics
+
+
+async def _dispatch_order(scheduler: GenerationScheduler, jobs: list[tuple[str, int, float]]) -> list[str]:
+    """Queue (name, user_id, cost) jobs behind a running one and return the order they ran in"""
+    order = []
+
+    async def job(name, user_id, cost):
+        async with scheduler.slot(user_id, cost):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    running = await scheduler.acquire(0, 1)
+    tasks = [asyncio.create_task(job(*spec)) for spec in jobs]
+    await asyncio.sleep(0)
+    scheduler.release(running)
+    await asyncio.gather(*tasks)
+    return order
+
+
+class TestPolicies:
+    """Test the order each policy serves waiting jobs in."""
+
+    @pytest.mark.asyncio
+    async def test_fifo(self):
+        """Test FIFO serves jobs in arrival order whatever their user and cost."""
+        order = await _dispatch_order(
+            GenerationScheduler(FIFOPolicy()), [("a1", 1, 100), ("a2", 1, 100), ("b1", 2, 1)]
+        )
+
+        assert order == ["a1", "a2", "b1"]
+
+    @pytest.mark.asyncio
+    async def test_shortest_job_first(self):
+        """Test SJF serves the job with the smallest predicted cost first."""
+        order = await _dispatch_order(
+            GenerationScheduler(ShortestJobFirstPolicy()), [("long", 1, 500), ("short", 2, 20), ("medium", 3, 100)]
+        )
+
+        assert order == ["short", "medium", "long"]
+
+    @pytest.mark.asyncio
+    async def test_fair_queuing_interleaves_users(self):
+        """Test a user's burst does not delay another user's job behind all of it."""
+        jobs = [(f"a{i}", 1, 10) for i in range(4)] + [("b0", 2, 10)]
+        order = await _dispatch_order(GenerationScheduler(WeightedFairQueuingPolicy()), jobs)
+
+        assert order == ["a0", "b0", "a1", "a2", "a3"]
+
+    @pytest.mark.asyncio
+    async def test_fair_queuing_weights(self):
+        """Test a user with twice the weight is served about twice as often."""
+        jobs = [(f"a{i}", 1, 10) for i in range(4)] + [(f"b{i}", 2, 10) for i in range(4)]
+        order = await _dispatch_order(GenerationScheduler(WeightedFairQueuingPolicy({2: 2.0})), jobs)
+
+        assert set(order[:6]) >= {"b0", "b1", "b2", "b3"}
+        assert order[-2:] == ["a2", "a3"]
+
+    def test_make_policy(self):
+        """Test policies are built from their setting name."""
+        assert isinstance(make_policy("fifo"), FIFOPolicy)
+        assert isinstance(make_policy("wfq"), WeightedFairQueuingPolicy)
+        assert isinstance(make_policy("sjf"), ShortestJobFirstPolicy)
+        with pytest.raises(ValueError):
+            make_policy("random")
+
+
+class TestGenerationScheduler:
+    """Test slots, cancellation and metrics."""
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limit(self):
+        """Test no more than `concurrency` jobs hold a slot at once."""
+        scheduler = GenerationScheduler(FIFOPolicy(), concurrency=2)
+        peak = 0
+
+        async def job():
+            nonlocal peak
+            async with scheduler.slot(1, 10):
+                peak = max(peak, scheduler.running)
+                await asyncio.sleep(0.001)
+
+        await asyncio.gather(*(job() for _ in range(6)))
+
+        assert peak == 2
+        assert scheduler.running == 0
+        assert len(scheduler.policy) == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_is_skipped(self):
+        """Test a job cancelled while waiting never runs and does not hold up later ones."""
+        scheduler = GenerationScheduler(FIFOPolicy())
+        running = await scheduler.acquire(1, 10)
+        waiting = asyncio.create_task(scheduler.acquire(2, 10))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        scheduler.release(running)
+
+        # the cancelled job is still queued, a new one gets the free slot at once
+        await asyncio.wait_for(scheduler.acquire(3, 10), timeout=1)
+        assert scheduler.running == 1
+
+    @pytest.mark.asyncio
+    async def test_queue_wait_is_recorded_per_policy(self):
+        """Test each dispatch records its queue wait under the policy name."""
+        histogram = metrics.histogram("scheduler.sjf.queue_wait_seconds")
+        count = histogram.count
+
+        await _dispatch_order(GenerationScheduler(ShortestJobFirstPolicy()), [("a", 1, 10), ("b", 1, 20)])
+
+        assert histogram.count == count + 3
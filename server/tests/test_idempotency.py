@@ -0,0 +1,98 @@
+"""
+Test cases for the idempotency key store.
+"""
+
+import asyncio
+
+import pytest
+from services.idempotency import (
+    IdempotencyKeyInUse,
+    IdempotencyKeyReused,
+    IdempotencyStore,
+)
+
+
+def _counting_call(calls: list, value: str, delay: float = 0.01):
+    async def call():
+        calls.append(value)
+        await asyncio.sleep(delay)
+        return value
+
+    return call
+
+
+class TestIdempotencyStore:
+    """Test IdempotencyStore.run."""
+
+    @pytest.mark.asyncio
+    async def test_completed_result_is_replayed(self):
+        """Test a retry after completion gets the stored result without running."""
+        store = IdempotencyStore(ttl_seconds=60, max_entries=10)
+        calls = []
+
+        first = await store.run(1, "key", "fp", _counting_call(calls, "reply"))
+        retry = await store.run(1, "key", "fp", _counting_call(calls, "other"))
+
+        assert first == ("reply", False)
+        assert retry == ("reply", True)
+        assert calls == ["reply"]
+
+    @pytest.mark.asyncio
+    async def test_in_flight_retry_waits_for_the_original(self):
+        """Test a retry while the first request runs waits for it and shares its result."""
+        store = IdempotencyStore(ttl_seconds=60, max_entries=10)
+        calls = []
+
+        results = await asyncio.gather(
+            store.run(1, "key", "fp", _counting_call(calls, "reply")),
+            store.run(1, "key", "fp", _counting_call(calls, "other")),
+        )
+
+        assert results == [("reply", False), ("reply", True)]
+        assert calls == ["reply"]
+
+    @pytest.mark.asyncio
+    async def test_key_is_bound_to_its_request(self):
+        """Test a key reused for a different request is rejected, running or completed."""
+        store = IdempotencyStore(ttl_seconds=60, max_entries=10)
+        calls = []
+
+        running = asyncio.create_task(store.run(1, "key", "fp", _counting_call(calls, "reply")))
+        await asyncio.sleep(0)
+        with pytest.raises(IdempotencyKeyInUse):
+            await store.run(1, "key", "other fp", _counting_call(calls, "other"))
+        await running
+        with pytest.raises(IdempotencyKeyReused):
+            await store.run(1, "key", "other fp", _counting_call(calls, "other"))
+
+        # keys are scoped to the user
+        assert await store.run(2, "key", "other fp", _counting_call(calls, "other")) == ("other", False)
+
+    @pytest.mark.asyncio
+    async def test_failures_are_not_stored(self):
+        """Test a failed request raises in waiting retries and runs again on the next one."""
+        store = IdempotencyStore(ttl_seconds=60, max_entries=10)
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError("generation failed")
+
+        results = await asyncio.gather(
+            store.run(1, "key", "fp", failing), store.run(1, "key", "fp", failing), return_exceptions=True
+        )
+        assert [type(r) for r in results] == [ValueError, ValueError]
+
+        assert await store.run(1, "key", "fp", _counting_call([], "reply")) == ("reply", False)
+
+    @pytest.mark.asyncio
+    async def test_expiry_and_eviction(self):
+        """Test results expire after the TTL and the oldest are evicted past max_entries."""
+        store = IdempotencyStore(ttl_seconds=0, max_entries=10)
+        await store.run(1, "key", "fp", _counting_call([], "reply"))
+        assert store.get((1, "key")) is None
+
+        store = IdempotencyStore(ttl_seconds=60, max_entries=2)
+        for key in ("a", "b", "c"):
+            await store.run(1, key, "fp", _counting_call([], key))
+        assert store.get((1, "a")) is None
+        assert store.get((1, "c")).value == "c"
@@ -515,3 +515,89 @@ Here's some **bold text** and *italic text*.
         assert "# Heading 1" in message.content
         assert "**bold text**" in message.content
         assert "`inline code`" in message.content
+
+
+class TestMessageSearch:
+    """Test full-text search over messages (SQLite FTS5 in tests)."""
+
+    def _create_conversation(self, db_session: Session, username: str, title: str) -> Conversation:
+        user = db_session.query(User).filter(User.username == username).first()
+        if user is None:
+            user = User(username=username, email=f"{username}@example.com", password_hash="hashed_password")
+            db_session.add(user)
+            db_session.commit()
+            db_session.refresh(user)
+        return Conversation.create_conversation(db_session, user.id, title, "Test prompt")
+
+    def test_search_finds_matching_messages(self, db_session: Session):
+        """Test only messages containing the term are returned, with their conversation."""
+        conversation = self._create_conversation(db_session, "testuser", "Python help")
+        match = Message.create_message(db_session, conversation.id, SenderType.USER, "How do I sort a list in Python?")
+        Message.create_message(db_session, conversation.id, SenderType.ASSISTANT, "Use the sorted builtin.")
+
+        results = Message.search(db_session, conversation.user_id, "python", limit=10)
+
+        assert len(results) == 1
+        assert results[0]["message_id"] == match.id
+        assert results[0]["conversation_id"] == conversation.id
+        assert results[0]["conversation_title"] == "Python help"
+        assert results[0]["sender"] == "user"
+        assert results[0]["score"] > 0
+
+    def test_search_ranks_by_relevance(self, db_session: Session):
+        """Test a message with more occurrences of the terms ranks first."""
+        conversation = self._create_conversation(db_session, "testuser", "Ranking")
+        weak = Message.create_message(db_session, conversation.id, SenderType.USER, "a database question about many unrelated things here")
+        strong = Message.create_message(db_session, conversation.id, SenderType.USER, "database database index")
+
+        results = Message.search(db_session, conversation.user_id, "database index", limit=10)
+
+        assert [r["message_id"] for r in results] == [strong.id, weak.id]
+        assert results[0]["score"] > results[1]["score"]
+
+    def test_search_is_scoped_to_user(self, db_session: Session):
+        """Test messages of other users are never returned."""
+        mine = self._create_conversation(db_session, "owner", "Mine")
+        theirs = self._create_conversation(db_session, "other", "Theirs")
+        Message.create_message(db_session, mine.id, SenderType.USER, "secret recipe")
+        Message.create_message(db_session, theirs.id, SenderType.USER, "secret recipe")
+
+        results = Message.search(db_session, mine.user_id, "recipe", limit=10)
+
+        assert [r["conversation_id"] for r in results] == [mine.id]
+
+    def test_search_paginates(self, db_session: Session):
+        """Test limit and offset walk the ranked results without overlap."""
+        conversation = self._create_conversation(db_session, "testuser", "Pages")
+        for i in range(5):
+            Message.create_message(db_session, conversation.id, SenderType.USER, f"apple number {i}")
+
+        first = Message.search(db_session, conversation.user_id, "apple", limit=2, offset=0)
+        second = Message.search(db_session, conversation.user_id, "apple", limit=2, offset=2)
+        rest = Message.search(db_session, conversation.user_id, "apple", limit=2, offset=4)
+
+        ids = [r["message_id"] for r in first + second + rest]
+        assert len(ids) == 5
+        assert len(set(ids)) == 5
+
+    def test_search_ignores_query_syntax(self, db_session: Session):
+        """Test FTS operators and quotes in user input are treated as plain words."""
+        conversation = self._create_conversation(db_session, "testuser", "Syntax")
+        Message.create_message(db_session, conversation.id, SenderType.USER, "hello world")
+
+        assert len(Message.search(db_session, conversation.user_id, '"hello" AND -(world*', limit=10)) == 1
+        assert Message.search(db_session, conversation.user_id, '"* -', limit=10) == []
+
+    def test_search_index_follows_updates_and_deletes(self, db_session: Session):
+        """Test edited and deleted messages are reflected in the index."""
+        conversation = self._create_conversation(db_session, "testuser", "Sync")
+        message = Message.create_message(db_session, conversation.id, SenderType.USER, "original text")
+
+        message.content = "rewritten text"
+        db_session.commit()
+        assert Message.search(db_session, conversation.user_id, "original", limit=10) == []
+        assert len(Message.search(db_session, conversation.user_id, "rewritten", limit=10)) == 1
+
+        db_session.delete(conversation)
+        db_session.commit()
+        assert Message.search(db_session, conversation.user_id, "rewritten", limit=10) == []
@@ -0,0 +1,177 @@
+"""
+Test cases for the write-behind chat turn queue.
+
+The queue writes through the aiosqlite engine; assertions read the rows
+back through the sync session on the same database file.
+"""
+
+import os
+from datetime import datetime, timezone
+
+import pytest
+from models.conversation import Conversation, decode_transcript
+from models.message import Message, SenderType
+from models.user import User
+from services.conversation_cache import CachedConversation, conversation_cache
+from services.message_writer import MessageWriteBehindQueue
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+
+@pytest.fixture
+def conversation(db_session: Session):
+    user = User(username="testuser", email="test@example.com", password_hash="hashed")
+    db_session.add(user)
+    db_session.commit()
+    return Conversation.create_conversation(db_session, user.id, "Title", "Prompt")
+
+
+@pytest.fixture
+def session_factory(async_db_engine):
+    return async_sessionmaker(bind=async_db_engine, expire_on_commit=False)
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "turns.journal")
+
+
+def _count_messages(db_session: Session, conversation_id: int) -> int:
+    return db_session.query(Message).filter(
+        Message.conversation_id == conversation_id
+    ).count()
+
+
+class TestMessageWriteBehindQueue:
+    """Test batching, read-your-writes, shutdown flush and journal replay."""
+
+    @pytest.mark.asyncio
+    async def test_enqueue_defers_write_until_flush(self, db_session, conversation, session_factory, journal_path):
+        """Test a queued turn is journaled, then written as user + assistant rows."""
+        queue = MessageWriteBehindQueue(journal_path, batch_size=100, flush_interval=60)
+        await queue.start(session_factory)
+
+        await queue.enqueue(conversation.id, "Question", "Answer", datetime.now(timezone.utc))
+
+        assert queue.has_pending(conversation.id)
+        assert _count_messages(db_session, conversation.id) == 0
+
+        assert await queue.flush() == 1
+        await queue.stop()
+
+        messages = Conversation.get_by_id(db_session, conversation.id, with_messages=True).messages
+        assert [(m.sent_by, m.content) for m in messages] == [
+            (SenderType.USER, "Question"),
+            (SenderType.ASSISTANT, "Answer"),
+        ]
+        assert open(f"{journal_path}.0").read() == ""
+
+    @pytest.mark.asyncio
+    async def test_wait_for_conversation_gives_read_your_writes(self, db_session, conversation, session_factory, journal_path):
+        """Test the next turn of a conversation sees the turns queued before it."""
+        queue = MessageWriteBehindQueue(journal_path, batch_size=100, flush_interval=60)
+        await queue.start(session_factory)
+        await queue.enqueue(conversation.id, "Question", "Answer", datetime.now(timezone.utc))
+
+        await queue.wait_for_conversation(conversation.id)
+
+        assert not queue.has_pending(conversation.id)
+        assert _count_messages(db_session, conversation.id) == 2
+        await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_stop_flushes_all_pending_turns_in_batches(self, db_session, conversation, session_factory, journal_path):
+        """Test shutdown writes everything still queued, batch by batch."""
+        queue = MessageWriteBehindQueue(journal_path, batch_size=3, flush_interval=60)
+        await queue.start(session_factory)
+        for i in range(7):
+            await queue.enqueue(conversation.id, f"Q{i}", f"A{i}", datetime.now(timezone.utc))
+
+        await queue.stop()
+
+        assert _count_messages(db_session, conversation.id) == 14
+        contents = [m["content"] for m in Conversation.get_listing_by_user_id(db_session, conversation.user_id)[0]["messages"]]
+        assert contents[:4] == ["Q0", "A0", "Q1", "A1"]
+
+    @pytest.mark.asyncio
+    async def test_journal_is_replayed_after_crash(self, db_session, conversation, session_factory, journal_path):
+        """Test turns accepted before a crash are written by the next process."""
+        crashed = MessageWriteBehindQueue(journal_path, batch_size=100, flush_interval=60)
+        await crashed.start(session_factory)
+        await crashed.enqueue(conversation.id, "Question", "Answer", datetime.now(timezone.utc))
+        # the process dies: nothing is flushed and its slot lock goes away
+        crashed._task.cancel()
+        crashed._release_slot()
+
+        restarted = MessageWriteBehindQueue(journal_path, batch_size=100, flush_interval=60)
+        await restarted.start(session_factory)
+        assert restarted.has_pending(conversation.id)
+        await restarted.stop()
+
+        assert _count_messages(db_session, conversation.id) == 2
+
+    @pytest.mark.asyncio
+    async def test_turn_for_deleted_conversation_is_dropped(self, db_session, conversation, session_factory, journal_path):
+        """Test one unwritable turn does not block the rest of its batch."""
+        queue = MessageWriteBehindQueue(journal_path, batch_size=100, flush_interval=60)
+        await queue.start(session_factory)
+        await queue.enqueue(99999, "Lost", "Lost", datetime.now(timezone.utc))
+        await queue.enqueue(conversation.id, "Question", "Answer", datetime.now(timezone.utc))
+        conversation_cache.backend.set(CachedConversation(id=99999, user_id=1, title="Lost", prompt=None))
+
+        assert await queue.flush() == 1
+        await queue.stop()
+
+        assert _count_messages(db_session, conversation.id) == 2
+        assert conversation_cache.backend.get(99999) is None
+
+    @pytest.mark.asyncio
+    async def test_flush_extends_transcript(self, db_session, conversation, session_factory, journal_path):
+        """Test written turns are appended to the conversation transcript in order."""
+        queue = MessageWriteBehindQueue(journal_path, batch_size=100, flush_interval=60)
+        await queue.start(session_factory)
+        await queue.enqueue(conversation.id, "Q1", "A1", datetime.now(timezone.utc), [1, 2])
+        await queue.enqueue(conversation.id, "Q2", "A2", datetime.now(timezone.utc))
+        await queue.stop()
+
+        db_session.refresh(conversation)
+        entries = decode_transcript(conversation.transcript)
+        assert [(e.sent_by, e.content) for e in entries] == [
+            (SenderType.USER, "Q1"),
+            (SenderType.ASSISTANT, "A1"),
+            (SenderType.USER, "Q2"),
+            (SenderType.ASSISTANT, "A2"),
+        ]
+        assert entries[1].token_ids == [1, 2]
+
+    @pytest.mark.asyncio
+    async def test_turns_are_written_to_their_shard(self, db_session, conversation, session_factory, journal_path):
+        """Test a turn queued for a shard is written through that shard's sessions."""
+        queue = MessageWriteBehindQueue(journal_path, batch_size=100, flush_interval=60)
+        await queue.start(None, {"shard-a": session_factory})
+        await queue.enqueue(conversation.id, "Question", "Answer", datetime.now(timezone.utc), shard="shard-a")
+
+        assert await queue.flush() == 1
+        await queue.stop()
+
+        assert _count_messages(db_session, conversation.id) == 2
+
+    @pytest.mark.asyncio
+    async def test_each_queue_journals_to_its_own_slot(self, conversation, session_factory, journal_path):
+        """Test queues of different workers never share a journal, and a freed slot is reused."""
+        first = MessageWriteBehindQueue(journal_path, batch_size=100, flush_interval=60)
+        second = MessageWriteBehindQueue(journal_path, batch_size=100, flush_interval=60)
+        await first.start(session_factory)
+        await second.start(session_factory)
+        await second.enqueue(conversation.id, "Question", "Answer", datetime.now(timezone.utc))
+
+        assert (first.journal_path, second.journal_path) == (f"{journal_path}.0", f"{journal_path}.1")
+        assert not os.path.exists(first.journal_path)
+        assert "Question" in open(second.journal_path).read()
+
+        await first.stop()
+        third = MessageWriteBehindQueue(journal_path, batch_size=100, flush_interval=60)
+        await third.start(session_factory)
+        assert third.journal_path == f"{journal_path}.0"
+        await second.stop()
+        await third.stop()
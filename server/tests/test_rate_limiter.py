@@ -0,0 +1,175 @@
+"""
+Test cases for the per-user token rate limit.
+"""
+
+import pytest
+from models.conversation import Conversation
+from models.user import User
+from schemas.chat_model import ChatMessage, ChatRequest, ChatRole
+from services import chat_model_services
+from services.rate_limiter import (
+    DatabaseRateLimitBackend,
+    InMemoryRateLimitBackend,
+    RateLimiter,
+    RateLimitExceeded,
+)
+from sqlalchemy.orm import Session, sessionmaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture(params=["memory", "database"])
+def backend(request, db_engine, clock):
+    if request.param == "memory":
+        return InMemoryRateLimitBackend(clock)
+    return DatabaseRateLimitBackend(sessionmaker(bind=db_engine), clock)
+
+
+class TestBackends:
+    """Test the token bucket of both backends. Capacity 100, 10 tokens a second."""
+
+    def test_take_until_empty(self, backend):
+        """Test tokens are taken while the bucket holds them, then the wait is returned."""
+        assert backend.take("user:1", 60, 100, 10) == 0
+        assert backend.take("user:1", 40, 100, 10) == 0
+        assert backend.take("user:1", 20, 100, 10) == pytest.approx(2.0)
+        # another key has its own bucket
+        assert backend.take("user:2", 100, 100, 10) == 0
+
+    def test_refill(self, backend, clock):
+        """Test the bucket refills at the rate, up to its capacity."""
+        backend.take("user:1", 100, 100, 10)
+
+        clock.now += 3
+        assert backend.take("user:1", 30, 100, 10) == 0
+        clock.now += 3600
+        assert backend.take("user:1", 100, 100, 10) == 0
+        assert backend.take("user:1", 1, 100, 10) > 0
+
+    def test_debt(self, backend):
+        """Test a charge past the tokens left puts the bucket in debt."""
+        backend.take("user:1", 50, 100, 10)
+        backend.adjust("user:1", -100, 100, 10)
+
+        assert backend.take("user:1", 10, 100, 10) == pytest.approx(6.0)
+
+    def test_database_buckets_are_shared_by_workers(self, db_engine, clock):
+        """Test a database bucket drained by one worker is seen drained by another."""
+        session_factory = sessionmaker(bind=db_engine)
+        DatabaseRateLimitBackend(session_factory, clock).take("user:1", 100, 100, 10)
+
+        assert DatabaseRateLimitBackend(session_factory, clock).take("user:1", 10, 100, 10) == pytest.approx(1.0)
+
+
+class TestRateLimiter:
+    """Test reservations and settlement."""
+
+    @pytest.mark.asyncio
+    async def test_reserve_and_settle(self, clock):
+        """Test a turn reserves its admission cost and is settled at its real cost."""
+        limiter = RateLimiter(InMemoryRateLimitBackend(clock), tokens_per_minute=600, burst_tokens=300)
+
+        reservation = await limiter.reserve(1, 100)
+        await limiter.settle(reservation, 250)
+
+        with pytest.raises(RateLimitExceeded) as raised:
+            await limiter.reserve(1, 100)
+        assert raised.value.retry_after == pytest.approx(5.0)
+
+    @pytest.mark.asyncio
+    async def test_unused_reservation_goes_back(self, clock):
+        """Test a turn settled at no cost gives its whole reservation back."""
+        limiter = RateLimiter(InMemoryRateLimitBackend(clock), tokens_per_minute=600, burst_tokens=100)
+
+        await limiter.settle(await limiter.reserve(1, 100), 0)
+
+        assert await limiter.reserve(1, 100) is not None
+
+    @pytest.mark.asyncio
+    async def test_cost_above_burst_runs_from_a_full_bucket(self, clock):
+        """Test a turn costing more than the burst is admitted when the bucket is full."""
+        limiter = RateLimiter(InMemoryRateLimitBackend(clock), tokens_per_minute=60, burst_tokens=50)
+
+        assert (await limiter.reserve(1, 500)).tokens == 50
+
+    @pytest.mark.asyncio
+    async def test_disabled(self):
+        """Test nothing is limited without a rate."""
+        limiter = RateLimiter(InMemoryRateLimitBackend(), tokens_per_minute=0)
+
+        assert await limiter.reserve(1, 10**9) is None
+
+
+class TestChatTurnRateLimit:
+    """Test run_chat_turn is admitted and charged by the rate limiter."""
+
+    @pytest.mark.asyncio
+    async def test_turns_are_charged_prompt_and_generated_tokens(
+        self, db_session: Session, async_db_session, clock, monkeypatch
+    ):
+        """Test a long turn drains the bucket and the next turn is rejected before it starts."""
+        prompts = []
+
+        async def generate_reply(complete_prompt, on_text=None, user_id=None, usage=None, max_new_tokens=None, deadline=None):
+            prompts.append(complete_prompt)
+            usage.prompt_tokens, usage.generated_tokens = 900, 100
+            return "Reply", [1]
+
+        limiter = RateLimiter(InMemoryRateLimitBackend(clock), tokens_per_minute=600, burst_tokens=1000)
+        monkeypatch.setattr(chat_model_services, "generate_reply", generate_reply)
+        monkeypatch.setattr(chat_model_services, "rate_limiter", limiter)
+        db_session.add(User(id=1, username="testuser", email="test@example.com", password_hash="hashed"))
+        db_session.commit()
+
+        def request(content):
+            return ChatRequest(messages=[ChatMessage(role=ChatRole.USER, content=content)])
+
+        await chat_model_services.run_chat_turn(request("First"), async_db_session)
+        with pytest.raises(RateLimitExceeded) as raised:
+            await chat_model_services.run_chat_turn(request("Second"), async_db_session)
+
+        assert len(prompts) == 1
+        # max_new_tokens and the two tokens estimated for "Second"
+        assert raised.value.retry_after == pytest.approx(10.2)
+
+    @pytest.mark.asyncio
+    async def test_long_history_is_reserved_before_the_turn(
+        self, db_session: Session, async_db_session, clock, monkeypatch
+    ):
+        """Test a turn on a long history reserves its prompt and is rejected before it starts."""
+        prompts = []
+
+        async def generate_reply(complete_prompt, on_text=None, user_id=None, usage=None, max_new_tokens=None, deadline=None):
+            prompts.append(complete_prompt)
+            return "Reply", [1]
+
+        limiter = RateLimiter(InMemoryRateLimitBackend(clock), tokens_per_minute=600, burst_tokens=1000)
+        monkeypatch.setattr(chat_model_services, "generate_reply", generate_reply)
+        monkeypatch.setattr(chat_model_services, "rate_limiter", limiter)
+        db_session.add(User(id=1, username="testuser", email="test@example.com", password_hash="hashed"))
+        db_session.commit()
+        conversation = Conversation.create_conversation(db_session, 1, "Title", "x" * 4000)
+        await limiter.reserve(1, 100)
+
+        with pytest.raises(RateLimitExceeded) as raised:
+            await chat_model_services.run_chat_turn(
+                ChatRequest(
+                    conversation_id=conversation.id,
+                    messages=[ChatMessage(role=ChatRole.USER, content="Hello")],
+                ),
+                async_db_session,
+            )
+
+        assert prompts == []
+        assert raised.value.retry_after == pytest.approx(10.0)
@@ -0,0 +1,183 @@
+"""
+Test cases for read-replica routing.
+
+The primary and the replica are two SQLite files. Replication is simulated by
+copying the primary file over the replica, heartbeats are written directly.
+"""
+
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from models.base import Base
+from models.conversation import Conversation
+from models.conversation_archive import ConversationArchive
+from models.replication_heartbeat import ReplicationHeartbeat
+from models.user import User
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from tests.conftest import _enable_sqlite_foreign_keys
+
+from database.replicas import ReplicaSet
+
+
+@pytest.fixture
+def primary_path(tmp_path):
+    return tmp_path / "primary.db"
+
+
+@pytest.fixture
+def replica_path(tmp_path):
+    return tmp_path / "replica.db"
+
+
+@pytest.fixture
+def primary_session(primary_path):
+    engine = create_engine(f"sqlite:///{primary_path}")
+    _enable_sqlite_foreign_keys(engine)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def replicate(primary_session, primary_path, replica_path):
+    """Copy the committed state of the primary to the replica"""
+
+    def copy():
+        primary_session.commit()
+        shutil.copyfile(primary_path, replica_path)
+
+    return copy
+
+
+@pytest.fixture
+def replicas(replica_path, replicate):
+    replicate()
+    replica_set = ReplicaSet(
+        [f"sqlite:///{replica_path}"],
+        max_lag_seconds=2,
+        lag_check_interval=0,
+        pin_seconds=60,
+    )
+    yield replica_set
+    for replica in replica_set.replicas:
+        replica.engine.dispose()
+
+
+def _create_conversation(primary_session: Session) -> Conversation:
+    user = User(id=1, username="testuser", email="test@example.com", password_hash="hashed")
+    primary_session.add(user)
+    primary_session.commit()
+    conversation = Conversation.create_conversation(primary_session, user.id, "Title", "Prompt")
+    Conversation.append_turn(primary_session, conversation.id, "Question", "Answer")
+    return conversation
+
+
+class TestReplicaSet:
+    """Test lag-aware replica selection and read-your-writes pinning."""
+
+    def test_fresh_replica_serves_reads(self, primary_session, replicate, replicas):
+        """Test a replica with a recent heartbeat is chosen."""
+        ReplicationHeartbeat.beat(primary_session)
+        replicate()
+
+        replica = replicas.choose(user_id=1)
+
+        assert replica is replicas.replicas[0]
+        with replica.session_factory() as db:
+            assert db.info["replica"] == "replica0"
+
+    def test_lagging_replica_falls_back_to_primary(self, primary_session, replicate, replicas):
+        """Test a replica whose heartbeat is too old is skipped."""
+        ReplicationHeartbeat.beat(primary_session, datetime.now(timezone.utc) - timedelta(seconds=30))
+        replicate()
+
+        assert replicas.choose(user_id=1) is None
+        assert replicas.replicas[0].lag_seconds >= 30
+
+    def test_replica_without_heartbeat_is_not_used(self, replicas):
+        """Test an unknown lag is treated as too much lag."""
+        assert replicas.choose(user_id=1) is None
+
+    def test_lag_is_rechecked_after_the_interval(self, primary_session, replicate, replicas):
+        """Test the cached lag is only trusted for lag_check_interval seconds."""
+        replicas.lag_check_interval = 60
+        assert replicas.choose(user_id=1) is None
+
+        ReplicationHeartbeat.beat(primary_session)
+        replicate()
+        assert replicas.choose(user_id=1) is None
+
+        replicas.lag_check_interval = 0
+        assert replicas.choose(user_id=1) is not None
+
+    def test_pinned_user_reads_from_primary(self, primary_session, replicate, replicas):
+        """Test a user reads from the primary for pin_seconds after a chat turn."""
+        ReplicationHeartbeat.beat(primary_session)
+        replicate()
+
+        replicas.pin_user(1)
+        assert replicas.is_pinned(1)
+        assert replicas.choose(user_id=1) is None
+        assert replicas.choose(user_id=2) is not None
+
+        replicas.pin_seconds = 0.01
+        replicas.pin_user(1)
+        time.sleep(0.02)
+        assert not replicas.is_pinned(1)
+        assert replicas.choose(user_id=1) is not None
+
+    def test_no_replicas_configured(self):
+        """Test an empty replica set always reads from the primary."""
+        replica_set = ReplicaSet([], max_lag_seconds=2, lag_check_interval=1, pin_seconds=5)
+
+        replica_set.pin_user(1)
+        assert replica_set.choose(user_id=1) is None
+        assert not replica_set.is_pinned(1)
+
+
+class TestReadRouting:
+    """Test the GET conversation endpoints read through the replica dependency."""
+
+    def test_get_conversation_reads_from_replica(
+        self, primary_session, replicate, replicas, make_conversation_client, monkeypatch
+    ):
+        """Test a GET is served by the replica, and by the primary once the user is pinned."""
+        import database.replicas
+
+        conversation = _create_conversation(primary_session)
+        ReplicationHeartbeat.beat(primary_session)
+        replicate()
+        # a turn the replica has not received yet
+        Conversation.append_turn(primary_session, conversation.id, "Newer", "Reply")
+        monkeypatch.setattr(database.replicas, "replica_set", replicas)
+
+        client = make_conversation_client(primary_session)
+        from_replica = client.get(f"/api/conv-with-msg/{conversation.id}").json()
+        replicas.pin_user(conversation.user_id)
+        from_primary = client.get(f"/api/conv-with-msg/{conversation.id}").json()
+
+        assert len(from_replica["messages"]) == 2
+        assert len(from_primary["messages"]) == 4
+
+    def test_archived_conversation_is_restored_on_primary(self, primary_session, replicate, replicas):
+        """Test reading an archived conversation from a replica writes the restore to the primary."""
+        conversation = _create_conversation(primary_session)
+        ConversationArchive.archive(primary_session, conversation)
+        replicate()
+
+        replica_session = replicas.replicas[0].session_factory(info={"primary": primary_session})
+        try:
+            loaded = Conversation.get_by_id(replica_session, conversation.id, with_messages=True)
+        finally:
+            replica_session.close()
+
+        assert [m.content for m in loaded.messages] == ["Question", "Answer"]
+        primary_session.expire_all()
+        assert not primary_session.get(Conversation, conversation.id).archived
+        with replicas.replicas[0].session_factory() as db:
+            assert db.get(Conversation, conversation.id).archived
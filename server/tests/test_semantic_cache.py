@@ -0,0 +1,166 @@
+"""
+Test cases for the semantic cache of first-turn replies.
+
+Embeddings are bags of words over a small vocabulary, so paraphrases made of
+the same words are near-duplicates.
+"""
+
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+from services import chat_model_services
+from services.semantic_cache import SemanticCache, VectorIndex, namespace
+from tests.test_generation_cache import PROMPT, _use_model
+
+VOCABULARY = ["hi", "hello", "there", "how", "are", "you", "weather", "today"]
+
+
+def bag_of_words(text: str) -> np.ndarray:
+    words = text.lower().replace("?", "").split()
+    return np.array([words.count(word) for word in VOCABULARY], dtype=np.float32)
+
+
+def _unit(text: str) -> np.ndarray:
+    vector = bag_of_words(text)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = SemanticCache(bag_of_words, VectorIndex(max_entries=100, ttl_seconds=60), threshold=0.9)
+    monkeypatch.setattr(chat_model_services, "semantic_cache", cache)
+    return cache
+
+
+class TestVectorIndex:
+    """Test the NumPy vector index."""
+
+    def test_nearest_entry_above_threshold(self):
+        """Test the most similar entry is returned when it passes the threshold."""
+        index = VectorIndex(max_entries=10, ttl_seconds=60)
+        index.add(1, _unit("hello there"), "Hi!", [1])
+        index.add(1, _unit("weather today"), "Sunny.", [2])
+
+        hit = index.search(1, _unit("hello there hello there"), threshold=0.9)
+        assert (hit.reply, hit.token_ids) == ("Hi!", (1,))
+        assert hit.similarity == pytest.approx(1.0)
+        assert index.search(1, _unit("how are you"), threshold=0.9) is None
+
+    def test_namespaces_are_separate(self):
+        """Test entries of another model, system prompt or parameters are never returned."""
+        index = VectorIndex(max_entries=10, ttl_seconds=60)
+        index.add(1, _unit("hello there"), "Hi!", [1])
+
+        assert index.search(2, _unit("hello there"), threshold=0.9) is None
+
+    def test_least_recently_used_is_evicted(self):
+        """Test a full index replaces the least recently used entry."""
+        index = VectorIndex(max_entries=2, ttl_seconds=60)
+        index.add(1, _unit("hello"), "a", [])
+        index.add(1, _unit("weather"), "b", [])
+        time.sleep(0.001)
+        index.search(1, _unit("hello"), threshold=0.9)
+        index.add(1, _unit("how are you"), "c", [])
+
+        assert index.search(1, _unit("weather"), threshold=0.9) is None
+        assert index.search(1, _unit("hello"), threshold=0.9).reply == "a"
+        assert len(index) == 2
+
+    def test_expired_entries_are_misses_and_reused(self):
+        """Test expired entries are not served and their slot is taken first."""
+        index = VectorIndex(max_entries=10, ttl_seconds=0)
+        index.add(1, _unit("hello"), "a", [])
+        assert index.search(1, _unit("hello"), threshold=0.9) is None
+
+        index.ttl_seconds = 60
+        index.add(1, _unit("weather"), "b", [])
+        assert index._size == 1
+
+    def test_index_grows(self):
+        """Test the index grows past its initial capacity up to max_entries."""
+        index = VectorIndex(max_entries=1000, ttl_seconds=60)
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(600, 16)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        for i, vector in enumerate(vectors):
+            index.add(1, vector, str(i), [])
+
+        assert len(index) == 600
+        assert index.search(1, vectors[450], threshold=0.99).reply == "450"
+
+
+class TestSemanticCache:
+    """Test lookups through the embedder."""
+
+    @pytest.mark.asyncio
+    async def test_embeddings_are_bounded(self):
+        """Test a burst of lookups runs at most embed_concurrency embeddings at once."""
+        running, peak = [], []
+        lock = threading.Lock()
+
+        def embedder(text):
+            with lock:
+                running.append(text)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(text)
+            return bag_of_words(text)
+
+        cache = SemanticCache(embedder, VectorIndex(max_entries=100, ttl_seconds=60), threshold=0.9, embed_concurrency=2)
+        lookups = await asyncio.gather(*(cache.lookup(1, "hello there") for _ in range(8)))
+
+        assert all(lookup is not None for lookup in lookups)
+        assert max(peak) == 2
+
+class TestGenerateReplySemanticCache:
+    """Test generate_reply serves paraphrased first turns from the semantic cache."""
+
+    @pytest.mark.asyncio
+    async def test_paraphrase_is_served_from_the_cache(self, cache, monkeypatch):
+        """Test a paraphrased first message gets the stored reply without running the model."""
+        model = _use_model(monkeypatch, do_sample=True)
+        paraphrase = [PROMPT[0], {"role": "user", "content": "Hi hi"}]
+
+        first = await chat_model_services.generate_reply(PROMPT)
+        second = await chat_model_services.generate_reply(paraphrase)
+
+        assert second == first
+        assert model.calls == 1
+        assert cache.hit_rate == 0.5
+
+    @pytest.mark.asyncio
+    async def test_only_first_turns_with_the_same_system_prompt(self, cache, monkeypatch):
+        """Test later turns and first turns under another system prompt run the model."""
+        model = _use_model(monkeypatch, do_sample=True)
+        await chat_model_services.generate_reply(PROMPT)
+
+        await chat_model_services.generate_reply([{"role": "system", "content": "Be verbose"}, PROMPT[1]])
+        await chat_model_services.generate_reply(PROMPT + [{"role": "assistant", "content": "Hi"}, PROMPT[1]])
+
+        assert model.calls == 3
+
+    @pytest.mark.asyncio
+    async def test_embedding_failure_runs_the_model(self, cache, monkeypatch):
+        """Test the model still runs when the message cannot be embedded."""
+        model = _use_model(monkeypatch, do_sample=True)
+
+        def failing_embedder(text):
+            raise RuntimeError("Embedding model not loaded")
+
+        cache.embedder = failing_embedder
+
+        assert await chat_model_services.generate_reply(PROMPT) == ("token7 token8", [7, 8])
+        assert model.calls == 1
+
+
+def test_namespace_depends_on_system_prompt_and_params():
+    """Test namespaces differ by model, system prompt and parameters."""
+    base = namespace("model", "Be brief", {"max_new_tokens": 100})
+
+    assert base == namespace("model", "Be brief", {"max_new_tokens": 100})
+    assert base != namespace("model", "Be verbose", {"max_new_tokens": 100})
+    assert base != namespace("model", "Be brief", {"max_new_tokens": 50})
@@ -0,0 +1,304 @@
+"""
+Test cases for user-sharded conversation storage and the shard rebalancer.
+
+Every test runs against three SQLite files: the directory database and two
+shards, "a" and "b".
+"""
+
+import pytest
+from models.base import Base
+from models.conversation import Conversation, decode_transcript
+from models.conversation_archive import ConversationArchive
+from models.message import Message, SenderType
+from models.shard_directory import UserShard
+from models.user import User
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool
+from tests.conftest import _enable_sqlite_foreign_keys
+
+from database.sharding import ShardMap
+from services.shard_rebalancer import _copy_conversations, pin_existing_users, rebalance_user
+
+
+@pytest.fixture
+def directory_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'directory.db'}")
+    _enable_sqlite_foreign_keys(engine)
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def directory_session(directory_engine):
+    session = sessionmaker(bind=directory_engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def shards(tmp_path, directory_engine):
+    async_directory_engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'directory.db'}", poolclass=NullPool
+    )
+    shard_map = ShardMap(
+        {name: f"sqlite:///{tmp_path / f'shard_{name}.db'}" for name in ("b", "a")},
+        sessionmaker(bind=directory_engine),
+        async_sessionmaker(bind=async_directory_engine, expire_on_commit=False),
+        async_engine_options={"poolclass": NullPool},
+    )
+    for engine in shard_map.engines.values():
+        _enable_sqlite_foreign_keys(engine)
+        Base.metadata.create_all(engine)
+    yield shard_map
+    for engine in shard_map.engines.values():
+        engine.dispose()
+
+
+def _create_user(directory_session: Session, user_id: int) -> User:
+    user = User(
+        id=user_id,
+        username=f"user{user_id}",
+        email=f"user{user_id}@example.com",
+        password_hash="hashed_password",
+    )
+    directory_session.add(user)
+    directory_session.commit()
+    return user
+
+
+def _create_conversation(shards: ShardMap, directory_session: Session, user_id: int) -> int:
+    shard = shards.shard_for_user(directory_session, user_id)
+    with shards.session_factories[shard]() as db:
+        conversation = Conversation.create_conversation(
+            db,
+            user_id,
+            "Title",
+            "Prompt",
+            conversation_id=shards.allocate_conversation_id(user_id),
+        )
+        Conversation.append_turn(db, conversation.id, "Question", "Answer")
+        return conversation.id
+
+
+def _count(shards: ShardMap, shard: str, model) -> int:
+    with shards.session_factories[shard]() as db:
+        return db.execute(select(func.count()).select_from(model)).scalar_one()
+
+
+class TestShardMap:
+    """Test placement, the directory and conversation id allocation."""
+
+    def test_users_are_spread_and_placement_is_recorded(self, shards, directory_session):
+        """Test new users are placed by id and the directory remembers the shard."""
+        _create_user(directory_session, 1)
+        _create_user(directory_session, 2)
+
+        assert shards.names == ["a", "b"]
+        assert shards.shard_for_user(directory_session, 1) == "b"
+        assert shards.shard_for_user(directory_session, 2) == "a"
+        assert UserShard.get_shard(directory_session, 1) == "b"
+
+        with shards.session_factories["b"]() as db:
+            assert db.get(User, 1).username == "user1"
+            assert db.get(User, 2) is None
+
+    def test_directory_wins_over_placement(self, shards, directory_session):
+        """Test a recorded shard is used even when placement would pick another one."""
+        _create_user(directory_session, 1)
+        UserShard.assign(directory_session, 1, "a")
+
+        assert shards.shard_for_user(directory_session, 1) == "a"
+
+    def test_conversation_ids_are_unique_across_shards(self, shards, directory_session):
+        """Test conversations of users on different shards never share an id."""
+        _create_user(directory_session, 1)
+        _create_user(directory_session, 2)
+
+        ids = [_create_conversation(shards, directory_session, user_id) for user_id in (1, 2, 1, 2)]
+
+        assert len(set(ids)) == 4
+        assert _count(shards, "a", Conversation) == 2
+        assert _count(shards, "b", Conversation) == 2
+
+    @pytest.mark.asyncio
+    async def test_async_routing_matches_sync(self, shards, directory_session):
+        """Test the async path places users and allocates ids the same way."""
+        _create_user(directory_session, 1)
+
+        async with shards.async_directory_session_factory() as directory:
+            shard = await shards.shard_for_user_async(directory, 1)
+        conversation_id = await shards.allocate_conversation_id_async(1)
+
+        assert shard == "b"
+        assert UserShard.get_shard(directory_session, 1) == "b"
+        assert conversation_id == 1
+        async with shards.async_session_factories[shard]() as db:
+            conversation = await Conversation.create_conversation_async(
+                db, 1, "Title", "Prompt", conversation_id=conversation_id
+            )
+            assert db.info["shard"] == "b"
+        assert conversation.id == conversation_id
+
+    def test_cached_shard_expires(self, shards, directory_session):
+        """Test a move made by another process reaches this one once its cached shard expires."""
+        now = [1000.0]
+        shards.assignment_ttl_seconds = 10
+        shards.clock = lambda: now[0]
+        _create_user(directory_session, 1)
+        assert shards.shard_for_user(directory_session, 1) == "b"
+
+        UserShard.assign(directory_session, 1, "a")
+
+        assert shards.shard_for_user(directory_session, 1) == "b"
+        now[0] += 11
+        assert shards.shard_for_user(directory_session, 1) == "a"
+
+    def test_unsharded_map_routes_nothing(self, directory_engine):
+        """Test an empty shard map leaves ids to the main database."""
+        shard_map = ShardMap({}, sessionmaker(bind=directory_engine), None)
+
+        assert not shard_map.sharded
+        assert shard_map.allocate_conversation_id(1) is None
+
+    def test_conversations_created_unsharded_are_registered(self, shards, directory_session):
+        """Test ids allocated once sharding is on continue after conversations created without it."""
+        _create_user(directory_session, 1)
+        unsharded = Conversation.create_conversation(directory_session, 1, "Before", "Prompt")
+        Conversation.create_conversation(directory_session, 1, "Before", "Prompt")
+
+        assert shards.register_unsharded_conversations() == 2
+        assert shards.register_unsharded_conversations() == 0
+        assert shards.allocate_conversation_id(1) == unsharded.id + 2
+
+    def test_shard_dependency_routes_requests(
+        self, shards, directory_session, make_conversation_client, monkeypatch
+    ):
+        """Test conversation routes read from the shard of the current user."""
+        import database.sharding
+
+        _create_user(directory_session, 1)
+        conversation_id = _create_conversation(shards, directory_session, 1)
+        monkeypatch.setattr(database.sharding, "shard_map", shards)
+
+        client = make_conversation_client(directory_session)
+        response = client.get(f"/api/conv-with-msg/{conversation_id}")
+
+        assert response.status_code == 200
+        assert [m["content"] for m in response.json()["messages"]] == ["Question", "Answer"]
+
+
+class TestShardRebalancer:
+    """Test moving users between shards."""
+
+    def test_rebalance_moves_conversations(self, shards, directory_session):
+        """Test a move copies conversations, messages and transcripts, then cleans the source."""
+        _create_user(directory_session, 1)
+        first = _create_conversation(shards, directory_session, 1)
+        second = _create_conversation(shards, directory_session, 1)
+
+        report = rebalance_user(shards, 1, "a")
+
+        assert (report.source, report.target) == ("b", "a")
+        assert (report.conversations, report.messages) == (2, 4)
+        assert UserShard.get_shard(directory_session, 1) == "a"
+        assert shards.shard_for_user(directory_session, 1) == "a"
+        assert _count(shards, "b", Conversation) == 0
+        assert _count(shards, "b", Message) == 0
+
+        with shards.session_factories["a"]() as db:
+            moved = Conversation.get_by_id(db, second, with_messages=True)
+            assert [(m.sent_by, m.content) for m in moved.messages] == [
+                (SenderType.USER, "Question"),
+                (SenderType.ASSISTANT, "Answer"),
+            ]
+            assert [e.content for e in decode_transcript(moved.transcript)] == ["Question", "Answer"]
+            assert db.get(Conversation, first) is not None
+
+    def test_writes_routed_to_the_source_during_the_move_are_kept(self, shards, directory_session):
+        """Test turns and conversations a stale worker writes to the source while the move settles reach the target."""
+        _create_user(directory_session, 1)
+        existing = _create_conversation(shards, directory_session, 1)
+        waited = []
+
+        def stale_worker_writes(seconds):
+            waited.append(seconds)
+            with shards.session_factories["b"]() as db:
+                Conversation.append_turn(db, existing, "Late question", "Late answer")
+                late = Conversation.create_conversation(
+                    db, 1, "Late", "Prompt", conversation_id=shards.allocate_conversation_id(1)
+                )
+                Conversation.append_turn(db, late.id, "New", "Reply")
+
+        report = rebalance_user(shards, 1, "a", settle_seconds=30, sleep=stale_worker_writes)
+
+        assert waited == [30]
+        assert (report.conversations, report.messages) == (2, 6)
+        assert _count(shards, "b", Message) == 0
+        assert _count(shards, "a", Conversation) == 2
+        with shards.session_factories["a"]() as db:
+            moved = Conversation.get_by_id(db, existing, with_messages=True)
+            assert [m.content for m in moved.messages] == ["Question", "Answer", "Late question", "Late answer"]
+            assert moved.transcript is None
+
+    def test_rebalance_restores_archived_conversations(self, shards, directory_session):
+        """Test archived conversations are moved with their messages."""
+        _create_user(directory_session, 1)
+        conversation_id = _create_conversation(shards, directory_session, 1)
+        with shards.session_factories["b"]() as db:
+            ConversationArchive.archive(db, db.get(Conversation, conversation_id))
+
+        report = rebalance_user(shards, 1, "a")
+
+        assert report.messages == 2
+        assert _count(shards, "b", ConversationArchive) == 0
+        with shards.session_factories["a"]() as db:
+            assert not db.get(Conversation, conversation_id).archived
+            assert _count(shards, "a", Message) == 2
+
+    def test_rebalance_is_rerunnable_after_interruption(self, shards, directory_session):
+        """Test a move interrupted before the directory switch can run again."""
+        _create_user(directory_session, 1)
+        conversation_id = _create_conversation(shards, directory_session, 1)
+        with shards.session_factories["b"]() as src, shards.session_factories["a"]() as dst:
+            dst.add(User(id=1, username="user1", email="user1@example.com", password_hash="hashed"))
+            dst.commit()
+            _copy_conversations(src, dst, [conversation_id])
+
+        rebalance_user(shards, 1, "a")
+
+        assert _count(shards, "a", Conversation) == 1
+        assert _count(shards, "a", Message) == 2
+
+    def test_rebalance_to_current_shard_is_a_no_op(self, shards, directory_session):
+        """Test moving a user to the shard it is on changes nothing."""
+        _create_user(directory_session, 1)
+        _create_conversation(shards, directory_session, 1)
+
+        report = rebalance_user(shards, 1, "b")
+
+        assert report.conversations == 0
+        assert _count(shards, "b", Conversation) == 1
+
+    def test_rebalance_rejects_unknown_shard(self, shards, directory_session):
+        """Test an unknown target shard raises ValueError."""
+        _create_user(directory_session, 1)
+
+        with pytest.raises(ValueError):
+            rebalance_user(shards, 1, "c")
+
+    def test_pin_existing_users(self, shards, directory_session):
+        """Test unassigned users are recorded on the given shard and copied there."""
+        _create_user(directory_session, 1)
+        _create_user(directory_session, 2)
+        UserShard.assign(directory_session, 2, "b")
+
+        assert pin_existing_users(shards, "a") == 1
+        assert UserShard.get_shard(directory_session, 1) == "a"
+        assert UserShard.get_shard(directory_session, 2) == "b"
+        with shards.session_factories["a"]() as db:
+            assert db.get(User, 1) is not None
@@ -0,0 +1,143 @@
+"""
+Test cases for the ordering and de-duplication of chat turns.
+"""
+
+import asyncio
+
+import pytest
+from models.conversation import Conversation
+from models.user import User
+from schemas.chat_model import ChatMessage, ChatRequest, ChatRole
+from services import chat_model_services
+from services.turn_coordinator import TurnCoordinator
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+
+def _recording_turn(events: list, name: str, delay: float = 0.01):
+    async def turn():
+        events.append(f"{name} start")
+        await asyncio.sleep(delay)
+        events.append(f"{name} end")
+        return name
+
+    return turn
+
+
+class TestTurnCoordinator:
+    """Test TurnCoordinator on its own."""
+
+    @pytest.mark.asyncio
+    async def test_turns_of_a_conversation_run_in_order(self):
+        """Test turns of one conversation queue behind each other in submission order."""
+        coordinator = TurnCoordinator()
+        events = []
+
+        results = await asyncio.gather(
+            *(coordinator.run(("turn", i), 1, _recording_turn(events, f"t{i}")) for i in range(3))
+        )
+
+        assert results == ["t0", "t1", "t2"]
+        assert events == ["t0 start", "t0 end", "t1 start", "t1 end", "t2 start", "t2 end"]
+        assert not coordinator.is_busy(1)
+
+    @pytest.mark.asyncio
+    async def test_other_conversations_run_concurrently(self):
+        """Test turns of different or new conversations do not wait for each other."""
+        coordinator = TurnCoordinator()
+        events = []
+
+        await asyncio.gather(
+            coordinator.run("a", 1, _recording_turn(events, "a")),
+            coordinator.run("b", 2, _recording_turn(events, "b")),
+            coordinator.run("c", None, _recording_turn(events, "c")),
+        )
+
+        assert events[:3] == ["a start", "b start", "c start"]
+
+    @pytest.mark.asyncio
+    async def test_duplicate_attaches_to_the_running_turn(self):
+        """Test a duplicate in flight gets the running turn's result without running again."""
+        coordinator = TurnCoordinator()
+        events = []
+
+        first, second = await asyncio.gather(
+            coordinator.run("same", 1, _recording_turn(events, "first")),
+            coordinator.run("same", 1, _recording_turn(events, "second")),
+        )
+
+        assert first == second == "first"
+        assert events == ["first start", "first end"]
+        # once done, the same key runs again
+        assert await coordinator.run("same", 1, _recording_turn(events, "third")) == "third"
+
+    @pytest.mark.asyncio
+    async def test_duplicate_gets_the_error(self):
+        """Test a failing turn raises in its duplicates too and releases the conversation."""
+        coordinator = TurnCoordinator()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError("generation failed")
+
+        results = await asyncio.gather(
+            coordinator.run("same", 1, failing),
+            coordinator.run("same", 1, failing),
+            return_exceptions=True,
+        )
+
+        assert [type(r) for r in results] == [ValueError, ValueError]
+        assert not coordinator.is_busy(1)
+
+    @pytest.mark.asyncio
+    async def test_duplicate_runs_when_the_original_is_cancelled(self):
+        """Test a duplicate runs the turn itself when the job it waits for is cancelled."""
+        coordinator = TurnCoordinator()
+        events = []
+
+        original = asyncio.create_task(coordinator.run("same", 1, _recording_turn(events, "original", 1)))
+        await asyncio.sleep(0)
+        duplicate = asyncio.create_task(coordinator.run("same", 1, _recording_turn(events, "duplicate")))
+        await asyncio.sleep(0)
+        original.cancel()
+
+        assert await duplicate == "duplicate"
+        assert events == ["original start", "duplicate start", "duplicate end"]
+
+
+class TestConcurrentChatTurns:
+    """Test concurrent chat turns through run_chat_turn."""
+
+    @pytest.mark.asyncio
+    async def test_turns_of_a_conversation_are_not_interleaved(
+        self, db_session: Session, async_db_engine, monkeypatch
+    ):
+        """Test two turns sent at once to a conversation are stored in order, each after its reply."""
+        prompts = []
+
+        async def generate_reply(complete_prompt, on_text=None, user_id=None, usage=None, max_new_tokens=None, deadline=None):
+            prompts.append([m["content"] for m in complete_prompt[1:]])
+            await asyncio.sleep(0.01)
+            return f"Reply to {complete_prompt[-1]['content']}", [1]
+
+        monkeypatch.setattr(chat_model_services, "generate_reply", generate_reply)
+        db_session.add(User(id=1, username="testuser", email="test@example.com", password_hash="hashed"))
+        db_session.commit()
+        conversation = Conversation.create_conversation(db_session, 1, "Title", "Prompt")
+        session_factory = async_sessionmaker(bind=async_db_engine, expire_on_commit=False)
+
+        async def send(content: str):
+            request = ChatRequest(
+                conversation_id=conversation.id,
+                messages=[ChatMessage(role=ChatRole.USER, content=content)],
+            )
+            async with session_factory() as session:
+                return await chat_model_services.run_chat_turn(request, session)
+
+        await asyncio.gather(send("First"), send("Second"), send("First"))
+
+        # the duplicate "First" did not generate, "Second" saw the first turn
+        assert prompts == [["First"], ["First", "Reply to First", "Second"]]
+        db_session.expire_all()
+        stored = Conversation.get_by_id(db_session, conversation.id, with_messages=True)
+        assert [m.content for m in stored.messages] == ["First", "Reply to First", "Second", "Reply to Second"]
@@ -0,0 +1,284 @@
+"""
+Negotiated response compression: zstd, brotli or gzip.
+
+The encoding is picked from Accept-Encoding, highest q-value first and the
+configured order of preference on ties. Brotli and zstd need their packages
+(the "compression" extra) and are skipped without them. Bodies under the
+minimum size, already encoded bodies and excluded content types go out as
+they are.
+
+Streamed responses (the conversation listing, the NDJSON export) are
+compressed as they go: every chunk is flushed so the client can decode it
+without waiting for the end. Flushing costs some ratio, which is why the
+listing sends chunks of 64 KB rather than one per message.
+"""
+
+import zlib
+from abc import ABC, abstractmethod
+from typing import Callable
+
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Chunks at least this large are compressed in a worker thread
+THREAD_MINIMUM_SIZE = 128 * 1024
+
+# Content types that are already compressed or must not be buffered
+DEFAULT_EXCLUDED_CONTENT_TYPES = (
+    "application/grpc",
+    "application/gzip",
+    "application/x-gzip",
+    "application/zip",
+    "audio/*",
+    "font/woff",
+    "font/woff2",
+    "image/avif",
+    "image/gif",
+    "image/jpeg",
+    "image/png",
+    "image/webp",
+    "text/event-stream",
+    "video/*",
+)
+
+
+def available_encodings() -> set[str]:
+    encodings = {"gzip"}
+    if brotli is not None:
+        encodings.add("br")
+    if zstandard is not None:
+        encodings.add("zstd")
+    return encodings
+
+
+def choose_encoding(accept_encoding: str, preference: list[str]) -> str | None:
+    """Encoding to answer with, None for identity"""
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+
+    candidates = [
+        (weights.get(encoding, weights.get("*", 0.0)), -rank, encoding)
+        for rank, encoding in enumerate(preference)
+    ]
+    candidates = [candidate for candidate in candidates if candidate[0] > 0]
+    return max(candidates)[2] if candidates else None
+
+
+class Compressor(ABC):
+    """Compression stream of one response body"""
+
+    @abstractmethod
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        """Compress a chunk, flushed when more_body, else ending the stream"""
+
+
+class GzipCompressor(Compressor):
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        data = self._compressor.compress(body)
+        return data + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH
+        )
+
+
+class BrotliCompressor(Compressor):
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=quality)
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        data = self._compressor.process(body)
+        return data + (
+            self._compressor.flush() if more_body else self._compressor.finish()
+        )
+
+
+class ZstdCompressor(Compressor):
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        data = self._compressor.compress(body)
+        flush_mode = (
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+            if more_body
+            else zstandard.COMPRESSOBJ_FLUSH_FINISH
+        )
+        return data + self._compressor.flush(flush_mode)
+
+
+def _media_types(content_type: str) -> set[str]:
+    """The media type of a Content-Type and its wildcard, for exclusion"""
+    media_type = content_type.partition(";")[0].strip().lower()
+    media_types = {media_type, media_type.partition("/")[0] + "/*"}
+    if media_type.startswith("application/grpc+"):
+        media_types.add("application/grpc")
+    return media_types
+
+
+class _Responder:
+    """
+    Compresses the body of one response. Without a compressor the body goes
+    out as it is, with Vary: Accept-Encoding when it could have been
+    compressed.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int,
+        exclude_content_types: tuple[str, ...],
+        encoding: str | None,
+        new_compressor: Callable[[], Compressor] | None,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.exclude_content_types = exclude_content_types
+        self.encoding = encoding
+        self.new_compressor = new_compressor
+        self.send: Send | None = None
+        self.initial_message: Message = {}
+        self.passthrough = False
+        self.started = False
+        self.compressor: Compressor | None = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # held back until the first body chunk decides the headers
+            self.initial_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = (
+                "content-encoding" in headers
+                or message["status"] == 206
+                or not _media_types(headers.get("content-type", "")).isdisjoint(
+                    self.exclude_content_types
+                )
+            )
+            if self.passthrough:
+                await self.send(message)
+        elif self.passthrough:
+            await self.send(message)
+        elif message_type == "http.response.body":
+            await self._send_body(message)
+        else:
+            if message_type == "http.response.pathsend" and not self.started:
+                # files sent by the server are not compressed
+                self.started = True
+                await self.send(self.initial_message)
+            await self.send(message)
+
+    async def _send_body(self, message: Message):
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.started:
+            if self.compressor is not None:
+                message["body"] = await self._compress(body, more_body)
+            await self.send(message)
+            return
+
+        self.started = True
+        if len(body) < self.minimum_size and not more_body:
+            await self.send(self.initial_message)
+            await self.send(message)
+            return
+
+        headers = MutableHeaders(raw=self.initial_message["headers"])
+        headers.add_vary_header("Accept-Encoding")
+        if self.new_compressor is not None:
+            self.compressor = self.new_compressor()
+            message["body"] = await self._compress(body, more_body)
+            headers["Content-Encoding"] = self.encoding
+            if more_body or self.initial_message.get("trailers", False):
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(message["body"]))
+        await self.send(self.initial_message)
+        await self.send(message)
+
+    async def _compress(self, body: bytes, more_body: bool) -> bytes:
+        if len(body) >= THREAD_MINIMUM_SIZE:
+            # compressing large chunks inline would block the event loop
+            return await anyio.to_thread.run_sync(
+                self.compressor.compress, body, more_body
+            )
+        return self.compressor.compress(body, more_body)
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        encodings: list[str],
+        minimum_size: int = 1024,
+        gzip_level: int = 4,
+        brotli_quality: int = 5,
+        zstd_level: int = 3,
+        exclude_content_types: tuple[str, ...] = DEFAULT_EXCLUDED_CONTENT_TYPES,
+    ):
+        self.app = app
+        available = available_encodings()
+        self.encodings = [encoding for encoding in encodings if encoding in available]
+        self.minimum_size = minimum_size
+        self.exclude_content_types = tuple(
+            content_type.partition(";")[0].strip().lower()
+            for content_type in exclude_content_types
+        )
+        self.compressors: dict[str, Callable[[], Compressor]] = {
+            "gzip": lambda: GzipCompressor(gzip_level),
+            "br": lambda: BrotliCompressor(brotli_quality),
+            "zstd": lambda: ZstdCompressor(zstd_level),
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(
+            Headers(scope=scope).get("accept-encoding", ""), self.encodings
+        )
+        responder = _Responder(
+            self.app,
+            self.minimum_size,
+            self.exclude_content_types,
+            encoding,
+            self.compressors.get(encoding),
+        )
+        await responder(scope, receive, send)
+
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    """Inverse of the middleware, for tests and benchmarks"""
+    if encoding == "gzip":
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+    if encoding == "br":
+        return brotli.decompress(data)
+    if encoding == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
@@ -0,0 +1,40 @@
+"""
+Conditional GET support: validator headers and If-None-Match matching.
+
+Validators are weak ETags (see models.conversation.Validator). Clients are
+asked to revalidate on every use, since Last-Modified is informational and
+If-None-Match is what decides a 304.
+"""
+
+from email.utils import format_datetime
+
+from fastapi import Request, Response
+from utils.metrics import metrics
+
+
+def validator_headers(validator) -> dict[str, str]:
+    headers = {"ETag": validator.etag, "Cache-Control": "no-cache"}
+    if validator.last_modified is not None:
+        headers["Last-Modified"] = format_datetime(validator.last_modified, usegmt=True)
+    return headers
+
+
+def _opaque(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_fresh(request: Request, validator) -> bool:
+    """True if the client's If-None-Match names the current validator (weak comparison)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or _opaque(validator.etag) in {_opaque(tag) for tag in tags}
+
+
+def not_modified(request: Request, validator, name: str) -> Response | None:
+    """A 304 response when the client's copy is current, else None"""
+    if not is_fresh(request, validator):
+        return None
+    metrics.counter(f"http.{name}.not_modified").inc()
+    return Response(status_code=304, headers=validator_headers(validator))
@@ -0,0 +1,30 @@
+"""
+JSON encoding for responses built straight from database rows.
+
+Such responses are already JSON-ready dicts, so they skip Pydantic and
+jsonable_encoder and are encoded once. orjson is used when installed (the
+"fast-json" extra), the standard library otherwise; both produce the same
+compact UTF-8 JSON.
+"""
+
+import json
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse for content that needs no conversion before encoding"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
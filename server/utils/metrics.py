@@ -0,0 +1,128 @@
+"""
+In-process metrics registry.
+
+Counters, gauges and histograms are kept in memory and exposed as a JSON
+snapshot by the metrics router. Gauges may be backed by a callback so values
+owned by another object (e.g. a connection pool) are read at snapshot time.
+"""
+
+import threading
+from collections import deque
+from typing import Callable
+
+HISTOGRAM_SAMPLE_SIZE = 1024
+
+
+class Counter:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> float:
+        return self._value
+
+
+class Gauge:
+    def __init__(self, callback: Callable[[], float] | None = None):
+        self._value = 0.0
+        self._callback = callback
+
+    def set(self, value: float):
+        self._value = value
+
+    def inc(self, amount: float = 1.0):
+        self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        self._value -= amount
+
+    @property
+    def value(self) -> float:
+        return self._callback() if self._callback else self._value
+
+    def snapshot(self) -> float:
+        return self.value
+
+
+class Histogram:
+    """Count, sum and max of all observations plus percentiles of recent ones."""
+
+    def __init__(self, sample_size: int = HISTOGRAM_SAMPLE_SIZE):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._samples = deque(maxlen=sample_size)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+            self._samples.append(value)
+
+    def percentile(self, q: float) -> float:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        index = min(len(samples) - 1, int(q * len(samples)))
+        return samples[index]
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Gauge | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name: str, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = factory()
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str) -> Counter:
+        return self._get_or_create(name, Counter)
+
+    def gauge(self, name: str, callback: Callable[[], float] | None = None) -> Gauge:
+        gauge = self._get_or_create(name, lambda: Gauge(callback))
+        if callback is not None:
+            gauge._callback = callback
+        return gauge
+
+    def histogram(self, name: str) -> Histogram:
+        return self._get_or_create(name, Histogram)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+        return {name: metric.snapshot() for name, metric in sorted(metrics.items())}
+
+    def reset(self):
+        """Drop all metrics. Used by tests."""
+        with self._lock:
+            self._metrics.clear()
+
+
+metrics = MetricsRegistry()
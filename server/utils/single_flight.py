@@ -0,0 +1,72 @@
+"""
+Single-flight calls: one running call per key, joined by its duplicates.
+
+A call started while another one with the same key is in flight waits for
+that one instead of running, and gets its result or its error. Joining is
+shielded: a joiner that is cancelled leaves the call running for the others.
+When the call itself is cancelled its joiners get FlightCancelled and decide
+whether to run it again. Flights are per process.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable, NamedTuple, TypeVar
+
+T = TypeVar("T")
+
+
+class FlightCancelled(Exception):
+    """The joined call was cancelled before it completed"""
+
+
+class Flight(NamedTuple):
+    tag: Any
+    future: asyncio.Future
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: dict[Hashable, Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def get(self, key: Hashable) -> Flight | None:
+        """The in-flight call of a key, None when there is none"""
+        return self._flights.get(key)
+
+    async def join(self, flight: Flight) -> Any:
+        """
+        The result of an in-flight call. Raises its error, or FlightCancelled
+        when it was cancelled.
+        """
+        try:
+            return await asyncio.shield(flight.future)
+        except asyncio.CancelledError:
+            if not flight.future.cancelled():
+                raise
+            raise FlightCancelled() from None
+
+    async def run(
+        self, key: Hashable, call: Callable[[], Awaitable[T]], tag: Any = None
+    ) -> T:
+        """
+        Run `call` as the in-flight call of a key; `tag` is kept with it for
+        those that look it up. The key must not be in flight already.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._flights[key] = Flight(tag, future)
+        try:
+            value = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # joiners re-raise it, without them it must not be logged as lost
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            del self._flights[key]